@@ -0,0 +1,320 @@
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+from strategies.TechStrategy import my_strategy_params, simple_strategy_params, order_size
+from strategies.Signals import my_strategy_signals, simple_strategy_signals, stop_candle_indices
+
+# Бэктест SimpleStrategy и MyStrategy на истории свечей.
+# Индикаторы, сигналы, стопы и выходы по RSI считаются массивами по всему ряду,
+# а цикл на Python идет только по свечам с событиями (сигнал, срабатывание ордера, стоп-лосс).
+#
+# Модель исполнения:
+# - решение принимается на закрытии свечи t, ордера действуют со свечи t+1
+# - рыночный ордер исполняется по Open свечи t+1
+# - стоп-ордер на покупку (triggerDirection=1, цена пришла снизу) срабатывает на первой свече с High >= trigger,
+#   на продажу (triggerDirection=2, цена пришла сверху) - с Low <= trigger, и исполняется лимитом по цене ордера
+# - стоп-лосс позиции рыночный по LastPrice: исполняется по цене стопа или по Open, если свеча открылась за ним;
+#   если на одной свече и стоп-лосс, и ордер - первым считаем стоп-лосс
+# - каждое исполнение платит taker комиссию, как в calculate_order_size
+# - ордера на закрытие считаются reduce-only и снимаются при закрытии позиции по стоп-лоссу
+
+BARS_PER_YEAR = {'D': 365, 'W': 52, 'M': 12}
+
+class Backtester:
+    def __init__(self, strategy='simple', timeframe='1', leverage=1, depo_procent=100, params=None,
+                 taker_fee=0.00055, price_step=0.01, qty_step=0.01, min_qty=0.01, initial_cash=1000.0):
+        if strategy == 'my':
+            self.params = my_strategy_params(timeframe, leverage, depo_procent)
+        else:
+            self.params = simple_strategy_params(timeframe, leverage, depo_procent)
+        if params:
+            self.params.update(params)
+
+        self.strategy = strategy
+        self.taker_fee = taker_fee
+        self.price_step = price_step
+        self.price_acc = len(str(price_step).split('.')[1]) if price_step < 1 else 0
+        self.qty_step = qty_step
+        self.qty_acc = len(str(qty_step).split('.')[1]) if qty_step < 1 else None
+        self.min_qty = min_qty
+        self.initial_cash = initial_cash
+
+    # Indicators and signals for the whole history (pandas_ta, as the strategies compute them)
+    def prepare(self, data):
+        close = data['Close']
+        arrays = {name: data[name].to_numpy(dtype=np.float64) for name in ('Open', 'High', 'Low', 'Close')}
+        ma = ta.ema(close=close, length=self.params['ma_period']).to_numpy()
+
+        long_index, short_index = stop_candle_indices(arrays['Low'], arrays['High'])
+        arrays['long_stop'] = np.round(arrays['Low'][long_index] - self.price_step * 2, self.price_acc)
+        arrays['short_stop'] = np.round(arrays['High'][short_index] + self.price_step * 2, self.price_acc)
+
+        if self.strategy != 'my':
+            signal = simple_strategy_signals(arrays['Close'], ma)
+            arrays['long'] = signal == 1
+            arrays['short'] = signal == -1
+            arrays['events'] = np.flatnonzero(signal)
+            return arrays
+
+        k, d, smooth_k = self.params['stochastic_params']
+        stochastic = ta.stoch(high=data['High'], low=data['Low'], close=close, k=k, d=d, smooth_k=smooth_k)
+        # stoch отдает хвост ряда без начальных NaN - дополняем по позиции, reindex по миллиону меток дорогой
+        stochastic = np.vstack([np.full((len(data) - len(stochastic), 2), np.nan), stochastic.to_numpy(dtype=np.float64)])
+        chaikin = ta.adosc(high=data['High'], low=data['Low'], close=close, volume=data['Volume'], fast=3, slow=10)
+        rsi = ta.rsi(close=close).to_numpy()
+
+        volume_levels = self.params['volume_levels']
+        goodvolume = ((volume_levels[0] + volume_levels[1]) / 2, volume_levels[2])
+        signals = my_strategy_signals(data['Open'], close, data['Volume'], ma, stochastic[:, 0], stochastic[:, 1],
+                                      chaikin, goodvolume, self.params['window'])
+        arrays['long'] = signals['long']
+        arrays['short'] = signals['short']
+
+        low_level, high_level = self.params['rsi_levels']
+        rsi_prev = np.r_[np.nan, rsi[:-1]]
+        arrays['rsi_high_in'] = (rsi_prev < high_level) & (rsi >= high_level)
+        arrays['rsi_high_out'] = (rsi_prev >= high_level) & (rsi < high_level)
+        arrays['rsi_low_in'] = (rsi_prev > low_level) & (rsi <= low_level)
+        arrays['rsi_low_out'] = (rsi_prev <= low_level) & (rsi > low_level)
+        arrays['events'] = np.flatnonzero(arrays['long'] | arrays['short'] | arrays['rsi_high_in'] | arrays['rsi_high_out'] |
+                                          arrays['rsi_low_in'] | arrays['rsi_low_out'])
+        return arrays
+
+    # Rounding qty like place_*_order. None if the order is too small
+    def round_qty(self, qty):
+        if qty == None or not qty > 0:
+            return None
+        qty = int(qty / self.qty_step) * self.qty_step
+        if self.qty_acc != None:
+            qty = round(qty, self.qty_acc)
+        if qty < self.min_qty:
+            return None
+        return qty
+
+    # data - DataFrame like Bybit.klines(): index Time, columns Open, High, Low, Close, Volume
+    def run(self, data):
+        arrays = self.prepare(data)
+        simulation = _Simulation(self, arrays)
+        for t in arrays['events']:
+            simulation.advance(t)
+            if self.strategy == 'my':
+                simulation.my_strategy_decision(t)
+            else:
+                simulation.simple_strategy_decision(t)
+        simulation.advance(len(arrays['Close']) - 1)
+        simulation.close_at_end()
+
+        equity = pd.Series(simulation.equity_curve(), index=data.index, name='Equity')
+        trades = pd.DataFrame(simulation.trades, columns=['side', 'entry_time', 'entry_price', 'exit_time', 'exit_price',
+                                                          'qty', 'pnl', 'fees', 'exit_reason'])
+        if len(trades) > 0:
+            trades['entry_time'] = data.index[trades['entry_time'].to_numpy()]
+            trades['exit_time'] = data.index[trades['exit_time'].to_numpy()]
+        return {'equity': equity, 'trades': trades, 'summary': self.summary(equity, trades)}
+
+    def summary(self, equity, trades):
+        values = equity.to_numpy()
+        returns = np.diff(values) / values[:-1] if len(values) > 1 else np.zeros(1)
+        timeframe = str(self.params['timeframe'])
+        bars_per_year = BARS_PER_YEAR.get(timeframe) or 525_600 / int(timeframe)
+        wins = trades['pnl'][trades['pnl'] > 0].sum() if len(trades) > 0 else 0.0
+        losses = -trades['pnl'][trades['pnl'] < 0].sum() if len(trades) > 0 else 0.0
+        return {
+            'final_equity': float(values[-1]),
+            'total_return': float(values[-1] / self.initial_cash - 1),
+            'max_drawdown': float(np.max(1 - values / np.maximum.accumulate(values))),
+            'sharpe': float(returns.mean() / returns.std() * np.sqrt(bars_per_year)) if returns.std() > 0 else 0.0,
+            'trades': int(len(trades)),
+            'win_rate': float((trades['pnl'] > 0).mean()) if len(trades) > 0 else 0.0,
+            'profit_factor': float(wins / losses) if losses > 0 else float('inf') if wins > 0 else 0.0,
+            'fees': float(trades['fees'].sum()) if len(trades) > 0 else 0.0
+        }
+
+
+# Состояние одного прогона: счет, позиция, висящий стоп-ордер
+class _Simulation:
+    def __init__(self, backtester, arrays):
+        self.bt = backtester
+        self.a = arrays
+        self.n = len(arrays['Close'])
+        self.cash = backtester.initial_cash
+        self.side = 0 # 1 - long, -1 - short
+        self.qty = 0.0
+        self.entry_price = 0.0
+        self.entry_index = 0
+        self.entry_fee = 0.0
+        self.stop_loss = np.nan
+        self.pending = None # {'side', 'price', 'qty', 'sl', 'kind': entry/exit/reverse}
+        self.cursor = 0 # свечи до cursor уже обработаны
+        self.changes = [(-1, self.cash, 0.0, 0.0)] # (индекс свечи, cash, qty со знаком, цена входа)
+        self.trades = []
+
+    # --- исполнение ---
+
+    def __record(self, index):
+        self.changes.append((index, self.cash, self.side * self.qty, self.entry_price))
+
+    def open_position(self, side, qty, price, index, sl):
+        self.entry_fee = qty * price * self.bt.taker_fee
+        self.cash -= self.entry_fee
+        self.side, self.qty, self.entry_price, self.entry_index, self.stop_loss = side, qty, price, index, sl
+        self.__record(index)
+
+    def close_position(self, price, index, reason):
+        fee = self.qty * price * self.bt.taker_fee
+        pnl = self.side * self.qty * (price - self.entry_price)
+        self.cash += pnl - fee
+        self.trades.append(('Buy' if self.side == 1 else 'Sell', self.entry_index, self.entry_price, index, price,
+                            self.qty, pnl - fee - self.entry_fee, fee + self.entry_fee, reason))
+        self.side, self.qty, self.entry_price, self.stop_loss = 0, 0.0, 0.0, np.nan
+        self.__record(index)
+
+    def available_cash(self):
+        if self.side == 0:
+            return self.cash
+        return self.cash - self.entry_price * self.qty / self.bt.params['leverage']
+
+    def current_position(self):
+        return {'side': 'Buy' if self.side == 1 else 'Sell', 'entryPrice': self.entry_price, 'size': self.qty}
+
+    def order_qty(self, order_price, stop_price, with_position=False):
+        if order_price == stop_price:
+            return None
+        cur_pos = self.current_position() if with_position else None
+        return self.bt.round_qty(order_size(self.available_cash(), order_price, stop_price, self.bt.params,
+                                            self.bt.taker_fee, cur_pos))
+
+    @staticmethod
+    def __first(mask):
+        index = int(np.argmax(mask))
+        return index if mask[index] else None
+
+    # Simulating stop-loss and pending order triggers on candles cursor..to
+    def advance(self, to):
+        a = self.a
+        while self.cursor <= to:
+            start = self.cursor
+            stop_hit = None
+            if self.side == 1:
+                stop_hit = self.__first(a['Low'][start:to + 1] <= self.stop_loss)
+            elif self.side == -1:
+                stop_hit = self.__first(a['High'][start:to + 1] >= self.stop_loss)
+
+            fill = None
+            if self.pending != None:
+                price = self.pending['price']
+                if self.pending['side'] == 1: # цена пришла снизу
+                    trigger = self.__first(a['High'][start:to + 1] >= price)
+                    if trigger != None:
+                        fill = self.__first(a['Low'][start + trigger:to + 1] <= price)
+                        fill = None if fill == None else fill + trigger
+                else: # цена пришла сверху
+                    trigger = self.__first(a['Low'][start:to + 1] <= price)
+                    if trigger != None:
+                        fill = self.__first(a['High'][start + trigger:to + 1] >= price)
+                        fill = None if fill == None else fill + trigger
+
+            if stop_hit == None and fill == None:
+                self.cursor = to + 1
+                return
+
+            if stop_hit != None and (fill == None or stop_hit <= fill):
+                index = start + stop_hit
+                if index == self.entry_index:
+                    price = self.stop_loss
+                elif self.side == 1:
+                    price = min(a['Open'][index], self.stop_loss)
+                else:
+                    price = max(a['Open'][index], self.stop_loss)
+                self.close_position(price, index, 'stop_loss')
+                if self.pending != None:
+                    if self.pending['kind'] == 'exit':
+                        self.pending = None
+                    elif self.pending['kind'] == 'reverse':
+                        self.pending['kind'] = 'entry' # остается только нога на открытие
+                self.cursor = index
+                continue
+
+            index = start + fill
+            order, self.pending = self.pending, None
+            if order['kind'] in ('exit', 'reverse') and self.side != 0:
+                self.close_position(order['price'], index, 'rsi' if order['kind'] == 'exit' else 'reverse')
+            if order['kind'] in ('entry', 'reverse') and order['qty'] != None:
+                self.open_position(order['side'], order['qty'], order['price'], index, order['sl'])
+            self.cursor = index
+
+    def market(self, t, side, qty=None, sl=np.nan, reverse=False):
+        if t + 1 >= self.n:
+            return
+        price = self.a['Open'][t + 1]
+        if self.side != 0:
+            self.close_position(price, t + 1, 'reverse' if reverse else 'rsi')
+        if qty != None:
+            self.open_position(side, qty, price, t + 1, sl)
+        self.cursor = t + 1
+
+    def close_at_end(self):
+        if self.side != 0:
+            self.close_position(self.a['Close'][-1], self.n - 1, 'end')
+
+    # --- логика стратегий на закрытии свечи t ---
+
+    def simple_strategy_decision(self, t):
+        a = self.a
+        if self.side == 0:
+            if a['long'][t]:
+                self.market(t, 1, self.order_qty(a['High'][t], a['long_stop'][t]), a['long_stop'][t])
+            elif a['short'][t]:
+                self.market(t, -1, self.order_qty(a['Low'][t], a['short_stop'][t]), a['short_stop'][t])
+        elif self.side == 1 and a['short'][t]:
+            qty = self.order_qty(a['Low'][t], a['short_stop'][t], with_position=True)
+            self.market(t, -1, qty, a['short_stop'][t], reverse=True)
+        elif self.side == -1 and a['long'][t]:
+            qty = self.order_qty(a['High'][t], a['long_stop'][t], with_position=True)
+            self.market(t, 1, qty, a['long_stop'][t], reverse=True)
+
+    def my_strategy_decision(self, t):
+        a = self.a
+        step = self.bt.price_step
+        buy_price = a['High'][t] + step * 2
+        sell_price = a['Low'][t] - step * 2
+
+        # новый сигнал - снимаем открытые ордера
+        if a['long'][t] or a['short'][t]:
+            self.pending = None
+
+        if self.side == 0:
+            if a['long'][t]:
+                qty = self.order_qty(buy_price, a['long_stop'][t])
+                if qty != None:
+                    self.pending = {'side': 1, 'price': buy_price, 'qty': qty, 'sl': a['long_stop'][t], 'kind': 'entry'}
+            elif a['short'][t]:
+                qty = self.order_qty(sell_price, a['short_stop'][t])
+                if qty != None:
+                    self.pending = {'side': -1, 'price': sell_price, 'qty': qty, 'sl': a['short_stop'][t], 'kind': 'entry'}
+
+        elif self.side == 1:
+            if a['rsi_high_in'][t]: # достигли КЗ RSI
+                self.pending = None
+                self.market(t, -1)
+            elif a['rsi_high_out'][t]: # выход из КЗ RSI
+                self.pending = {'side': -1, 'price': sell_price, 'qty': None, 'sl': np.nan, 'kind': 'exit'}
+            elif a['short'][t]: # переворот в short
+                qty = self.order_qty(sell_price, a['short_stop'][t], with_position=True)
+                self.pending = {'side': -1, 'price': sell_price, 'qty': qty, 'sl': a['short_stop'][t], 'kind': 'reverse'}
+
+        else:
+            if a['rsi_low_in'][t]:
+                self.pending = None
+                self.market(t, 1)
+            elif a['rsi_low_out'][t]:
+                self.pending = {'side': 1, 'price': buy_price, 'qty': None, 'sl': np.nan, 'kind': 'exit'}
+            elif a['long'][t]: # переворот в long
+                qty = self.order_qty(buy_price, a['long_stop'][t], with_position=True)
+                self.pending = {'side': 1, 'price': buy_price, 'qty': qty, 'sl': a['long_stop'][t], 'kind': 'reverse'}
+
+    def equity_curve(self):
+        indices, cash, qty, entry = (np.array(column) for column in zip(*self.changes))
+        # состояние на закрытии каждой свечи - последнее изменение на этой свече или раньше
+        state = np.searchsorted(indices, np.arange(self.n), side='right') - 1
+        return cash[state] + qty[state] * (self.a['Close'] - entry[state])
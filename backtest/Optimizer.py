@@ -0,0 +1,142 @@
+import argparse
+import itertools
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from logs.logger import get_logger
+from backtest.Backtester import Backtester
+from market_data.KlineStream import KLINE_COLUMNS
+from strategies.TechStrategy import myStrategyVolumes
+
+# Перебор параметров стратегий на истории в пуле процессов.
+# Свечи один раз сохраняются в .npy, каждый воркер открывает их через mmap (страницы общие, без копий),
+# результаты дописываются в JSONL построчно - прерванный прогон продолжается с того же места.
+# Упавший набор параметров пишется строкой с 'error' и повторяется при следующем запуске.
+
+# Default search space around the hardcoded params of the strategies
+def default_space(strategy, timeframe):
+    if strategy != 'my':
+        return {'ma_period': [5, 10, 20, 50], 'max_loss_percent': [1, 2, 3]}
+    volumes = myStrategyVolumes[timeframe]
+    return {
+        'ma_period': [5, 10, 20, 50],
+        'stochastic_params': [(14, 3, 3), (9, 3, 3), (21, 5, 5)],
+        'window': [2, 3, 4, 6],
+        'rsi_levels': [(30, 70), (25, 75), (20, 80)],
+        'max_loss_percent': [1, 2, 3],
+        'volume_levels': [tuple(v * scale for v in volumes) for scale in (0.5, 1, 2)]
+    }
+
+# All combinations of the space values
+def param_grid(space):
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+# n random combinations (without repeats if the grid is big enough)
+def param_samples(space, n, seed=None):
+    grid = param_grid(space)
+    return random.Random(seed).sample(grid, min(n, len(grid)))
+
+# Key of a param set in the results file (tuples and lists are the same after JSON)
+def params_key(params):
+    return json.dumps(params, sort_keys=True)
+
+# Saving candles (DataFrame like Bybit.klines()) for workers: rows = Time + KLINE_COLUMNS, so every column is contiguous
+def save_candles(data, path):
+    columns = [data.index.to_numpy(dtype=np.float64)] + [data[name].to_numpy(dtype=np.float64) for name in KLINE_COLUMNS]
+    np.save(path, np.vstack(columns))
+
+# DataFrame over the memory-mapped file without copying the columns
+def load_candles(path):
+    candles = np.load(path, mmap_mode='r')
+    data = pd.DataFrame(candles[1:].T, columns=KLINE_COLUMNS, copy=False)
+    data.index = pd.Index(candles[0].astype(np.int64), name='Time')
+    return data
+
+
+_candles = None # свечи воркера
+
+def _init_worker(path):
+    global _candles
+    _candles = load_candles(path)
+
+def _evaluate(strategy, backtest_kwargs, params):
+    result = Backtester(strategy, params=params, **backtest_kwargs).run(_candles)
+    return params, result['summary']
+
+
+class Optimizer:
+    # metrics - ranking order, '-' prefix means lower is better (e.g. '-max_drawdown')
+    def __init__(self, candles_path, results_path, strategy='simple', timeframe='1', leverage=1,
+                 metrics=('sharpe', 'total_return'), workers=None, **backtest_kwargs):
+        self.candles_path = candles_path
+        self.results_path = results_path
+        self.strategy = strategy
+        self.metrics = list(metrics)
+        self.workers = workers or os.cpu_count()
+        self.backtest_kwargs = dict(backtest_kwargs, timeframe=timeframe, leverage=leverage)
+        self.__logger = get_logger('optimizer')
+
+    def __rows(self):
+        if not os.path.exists(self.results_path):
+            return []
+        with open(self.results_path, encoding='utf-8') as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    # Param sets already evaluated in results_path (failed ones are run again)
+    def done_keys(self):
+        return {params_key(row['params']) for row in self.__rows() if 'summary' in row}
+
+    def run(self, param_sets):
+        done = self.done_keys()
+        todo = [params for params in param_sets if params_key(params) not in done]
+        if todo:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(self.candles_path,)) as pool, \
+                 open(self.results_path, 'a', encoding='utf-8') as file:
+                futures = {pool.submit(_evaluate, self.strategy, self.backtest_kwargs, params): params for params in todo}
+                for future in as_completed(futures):
+                    try:
+                        params, summary = future.result()
+                        row = {'params': params, 'summary': summary}
+                    except Exception as err: # ошибка стратегии или упавший воркер - остальные наборы считаем дальше
+                        params = futures[future]
+                        self.__logger.error(f'Backtest failed for params {params}: {err!r}')
+                        row = {'params': params, 'error': repr(err)}
+                    file.write(json.dumps(row) + '\n')
+                    file.flush()
+        return self.ranking()
+
+    # Results sorted by metrics, one row per param set
+    def ranking(self, metrics=None, top=None):
+        metrics = list(metrics or self.metrics)
+        results = pd.DataFrame([{**row['params'], **row['summary']} for row in self.__rows() if 'summary' in row])
+        if results.empty:
+            return results
+        results = results.sort_values([m.lstrip('-') for m in metrics],
+                                      ascending=[m.startswith('-') for m in metrics]).reset_index(drop=True)
+        return results if top == None else results.head(top)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parameter sweep over saved candles')
+    parser.add_argument('candles', help='.npy file from save_candles')
+    parser.add_argument('results', help='JSONL file with results (appended, used to resume)')
+    parser.add_argument('--strategy', default='simple', choices=['simple', 'my'])
+    parser.add_argument('--timeframe', default='1')
+    parser.add_argument('--leverage', type=int, default=1)
+    parser.add_argument('--samples', type=int, help='random samples instead of the full grid')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--metrics', default='sharpe,total_return')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    space = default_space(args.strategy, args.timeframe)
+    param_sets = param_samples(space, args.samples, args.seed) if args.samples else param_grid(space)
+    optimizer = Optimizer(args.candles, args.results, args.strategy, args.timeframe, args.leverage,
+                          metrics=args.metrics.split(','), workers=args.workers)
+    print(optimizer.run(param_sets).head(args.top).to_string())
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pandas_ta')
+from backtest.Backtester import Backtester
+
+# Цена растет, разворачивается вниз через EMA(3) и снова вверх: short на свече 7, переворот в long на свече 11
+def make_history():
+    close = [10, 10, 10, 10, 12, 13, 14, 12, 9, 8, 8, 11, 12]
+    open_ = [10, 10, 10, 10, 10, 12, 13, 14, 12, 9, 8, 8, 11]
+    high = [max(o, c) + 0.5 for o, c in zip(open_, close)]
+    low = [min(o, c) - 0.5 for o, c in zip(open_, close)]
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': 100.0},
+                        index=pd.Index(np.arange(len(close)) * 60_000, name='Time'), dtype=np.float64)
+
+def test_simple_strategy_trades():
+    bt = Backtester('simple', '1', params={'ma_period': 3}, taker_fee=0.0, price_step=0.1, qty_step=0.1, min_qty=0.1,
+                    initial_cash=1000)
+    result = bt.run(make_history())
+    trades = result['trades']
+
+    # short: рыночный по Open[8] = 12, стоп за High[6] = 14.5, объем по риску 2% от 1000 / (11.5 - 14.7) -> 6.2
+    # переворот: закрытие по Open[12] = 11, long 20.06 / (11.5 - 7.3) -> 4.7, закрытие в конце по Close[12] = 12
+    expected = [
+        ('Sell', 480_000, 12.0, 720_000, 11.0, 6.2, 6.2, 'reverse'),
+        ('Buy', 720_000, 11.0, 720_000, 12.0, 4.7, 4.7, 'end'),
+    ]
+    actual = list(trades[['side', 'entry_time', 'entry_price', 'exit_time', 'exit_price', 'qty', 'pnl', 'exit_reason']]
+                  .itertuples(index=False, name=None))
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        assert got[:2] == want[:2] and got[3] == want[3] and got[-1] == want[-1]
+        np.testing.assert_allclose([got[2], got[4], got[5], got[6]], [want[2], want[4], want[5], want[6]])
+
+    assert result['summary']['final_equity'] == pytest.approx(1010.9)
+    assert result['equity'].iloc[-1] == pytest.approx(1010.9)
+
+def test_stop_loss_closes_position():
+    data = make_history()
+    data.loc[540_000, ['High', 'Close']] = [15.0, 14.9] # свеча 9 пробивает стоп шорта 14.7
+    bt = Backtester('simple', '1', params={'ma_period': 3}, taker_fee=0.0, price_step=0.1, qty_step=0.1, min_qty=0.1,
+                    initial_cash=1000)
+    trades = bt.run(data)['trades']
+    assert trades['exit_reason'].iloc[0] == 'stop_loss'
+    assert trades['exit_time'].iloc[0] == 540_000
+    assert trades['exit_price'].iloc[0] == pytest.approx(14.7)
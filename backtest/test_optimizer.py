@@ -0,0 +1,35 @@
+import json
+import pytest
+
+pytest.importorskip('pandas_ta')
+from backtest.Optimizer import Optimizer, save_candles, params_key
+from backtest.test_backtester import make_history
+
+def read_rows(path):
+    with open(path, encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+def make_optimizer(tmp_path):
+    candles = str(tmp_path / 'candles.npy')
+    save_candles(make_history().assign(Turnover=0.0), candles)
+    return Optimizer(candles, str(tmp_path / 'results.jsonl'), workers=2, taker_fee=0.0, price_step=0.1, qty_step=0.1,
+                     min_qty=0.1, initial_cash=1000)
+
+def test_resume_skips_evaluated_params(tmp_path):
+    optimizer = make_optimizer(tmp_path)
+    first = [{'ma_period': 3}, {'ma_period': 5}]
+    optimizer.run(first)
+    assert len(read_rows(optimizer.results_path)) == 2
+
+    ranking = optimizer.run(first + [{'ma_period': 4}]) # прерванный прогон продолжается - считается только новый набор
+    rows = read_rows(optimizer.results_path)
+    assert [row['params'] for row in rows[2:]] == [{'ma_period': 4}]
+    assert sorted(ranking['ma_period']) == [3, 4, 5]
+
+def test_failing_params_are_recorded_and_do_not_stop_the_sweep(tmp_path):
+    optimizer = make_optimizer(tmp_path)
+    ranking = optimizer.run([{'ma_period': 3}, {'ma_period': 'bad'}, {'ma_period': 5}])
+    rows = {params_key(row['params']): row for row in read_rows(optimizer.results_path)}
+    assert 'error' in rows[params_key({'ma_period': 'bad'})]
+    assert sorted(ranking['ma_period']) == [3, 5]
+    assert optimizer.done_keys() == {params_key({'ma_period': 3}), params_key({'ma_period': 5})} # упавший повторится
@@ -0,0 +1,132 @@
+from threading import Lock
+from collections import deque
+from time import time
+
+OPEN_ORDER_STATUSES = ('New', 'PartiallyFilled', 'Untriggered')
+
+# Зеркало состояния аккаунта пользователя (позиции, ордера, кошелек).
+# Обновляется приватными WebSocket топиками, периодически сверяется с REST
+class AccountState:
+    def __init__(self, available_loader=None, reconcile_interval=300):
+        self.reconcile_interval = reconcile_interval
+        self.__available_loader = available_loader
+        self.__lock = Lock()
+        self.__positions = {}
+        self.__orders = {}
+        self.__balance = None
+        self.__available = None
+        self.executions = deque(maxlen=100) # последние исполнения
+        self.synced_at = 0
+        # Плечо и режим маржи по символам (из position стрима и успешных ответов), чтобы не слать лишние запросы
+        self.__leverage = {}
+        self.__trade_mode = {}
+        self.__saved_requests = 0 # сколько запросов set_leverage / switch_margin_mode не отправили
+
+    def is_stale(self):
+        return time() - self.synced_at > self.reconcile_interval
+
+    # Private stream was down and messages could be lost: reconcile with REST on the next check
+    def invalidate(self):
+        self.synced_at = 0
+
+    # Full state from REST: positions as in Bybit.get_positions(), orders as in Bybit.get_open_orders()
+    def reconcile(self, positions, orders, balance):
+        with self.__lock:
+            self.__positions = dict(positions)
+            self.__orders = {order['orderId']: order for order in orders}
+            self.__balance = balance
+            self.__available = None
+            self.synced_at = time()
+            for symbol, pos in positions.items():
+                self.__remember_settings(symbol, pos.get('leverage'), pos.get('tradeMode'))
+
+    def __remember_settings(self, symbol, leverage, trade_mode):
+        if leverage not in (None, ''):
+            self.__leverage[symbol] = float(leverage)
+        if trade_mode not in (None, ''):
+            self.__trade_mode[symbol] = int(trade_mode)
+
+    def on_position(self, message):
+        with self.__lock:
+            for elem in message['data']:
+                if elem.get('category', 'linear') != 'linear':
+                    continue
+                # плечо и режим приходят и для закрытой позиции
+                self.__remember_settings(elem['symbol'], elem.get('leverage'), elem.get('tradeMode'))
+                size = float(elem['size'] or 0)
+                if size == 0 or elem['side'] == '':
+                    self.__positions.pop(elem['symbol'], None)
+                    continue
+                entry_price = elem.get('avgPrice', elem.get('entryPrice'))
+                self.__positions[elem['symbol']] = {'side': elem['side'], 'entryPrice': float(entry_price), 'size': size}
+
+    def on_order(self, message):
+        with self.__lock:
+            for order in message['data']:
+                if order.get('category', 'linear') != 'linear':
+                    continue
+                if order['orderStatus'] in OPEN_ORDER_STATUSES:
+                    self.__orders[order['orderId']] = order
+                else:
+                    self.__orders.pop(order['orderId'], None)
+
+    def on_execution(self, message):
+        with self.__lock:
+            self.executions.extend(message['data'])
+            # после исполнения доступный баланс меняется - перезапросим при необходимости
+            self.__available = None
+
+    def on_wallet(self, message):
+        with self.__lock:
+            for account in message['data']:
+                for coin in account['coin']:
+                    if coin['coin'] != 'USDT':
+                        continue
+                    self.__balance = float(coin['walletBalance'])
+                    available = coin.get('availableToWithdraw', '')
+                    self.__available = float(available) if available != '' else None
+
+    def get_positions(self):
+        with self.__lock:
+            return {symbol: dict(pos) for symbol, pos in self.__positions.items()}
+
+    def get_open_orders(self, symbol=None):
+        with self.__lock:
+            return [order for order in self.__orders.values() if symbol == None or order['symbol'] == symbol]
+
+    def get_balance(self):
+        return self.__balance
+
+    # Known leverage for symbol or None
+    def get_leverage(self, symbol):
+        return self.__leverage.get(symbol)
+
+    def set_leverage(self, symbol, leverage):
+        with self.__lock:
+            self.__leverage[symbol] = float(leverage)
+
+    # Known margin mode for symbol (0 - cross, 1 - isolated) or None
+    def get_trade_mode(self, symbol):
+        return self.__trade_mode.get(symbol)
+
+    def set_trade_mode(self, symbol, mode):
+        with self.__lock:
+            self.__trade_mode[symbol] = int(mode)
+
+    def count_saved_request(self):
+        with self.__lock:
+            self.__saved_requests += 1
+
+    # Requests saved since the last call (main reports them per tick)
+    def take_saved_requests(self):
+        with self.__lock:
+            saved, self.__saved_requests = self.__saved_requests, 0
+        return saved
+
+    # Available for withdraw: from wallet stream, otherwise loaded once by REST
+    def get_available_balance(self):
+        if self.__available == None and self.__available_loader != None:
+            available = self.__available_loader()
+            with self.__lock:
+                self.__available = available
+        return self.__available
@@ -0,0 +1,537 @@
+import asyncio
+import hashlib
+import hmac
+import json
+from datetime import datetime, timezone
+from time import time
+from weakref import WeakKeyDictionary
+import aiohttp
+import pandas as pd
+from pybit.exceptions import InvalidRequestError, FailedRequestError
+from logs.logger import get_logger
+from config import config
+from bybit.InstrumentsRegistry import instruments_registry
+from bybit.AccountState import AccountState
+from bybit.KlineParser import Klines, parse_klines
+from bybit.RateLimiter import rate_limiter, ENDPOINT_GROUPS, PRIORITY_READ
+from market_data.KlineStream import KLINE_COLUMNS
+from market_data.KlineDownloader import kline_pages, stitch_pages, PAGE_LIMIT
+from bybit.BybitHelper import order_params, fit_qty, reversal_legs, order_text, reversal_text
+
+# Асинхронный клиент Bybit v5 на aiohttp: тысячи запросов разных пользователей в одном event loop
+# без потока на каждый запрос. Поверхность методов и ответы как у Bybit (BybitHelper) - это отдельный
+# синхронный клиент на pybit, не обертка над AsyncBybit; общая логика (qty, переворот, страницы свечей)
+# в функциях BybitHelper и KlineDownloader, здесь только транспорт.
+# Запросы идут через общий RateLimiter (те же корзины, что у синхронных клиентов), 10006 повторяется после сброса.
+
+BYBIT_URL = config.BYBIT_REST_URL or 'https://api.bybit.com'
+RECV_WINDOW = 5000
+
+# v5 path -> pybit HTTP method (ключ ENDPOINT_GROUPS)
+PATH_METHODS = {
+    '/v5/order/create': 'place_order',
+    '/v5/order/create-batch': 'place_batch_order',
+    '/v5/order/cancel': 'cancel_order',
+    '/v5/order/cancel-all': 'cancel_all_orders',
+    '/v5/position/set-leverage': 'set_leverage',
+    '/v5/position/switch-isolated': 'switch_margin_mode',
+    '/v5/position/list': 'get_positions',
+    '/v5/order/realtime': 'get_open_orders',
+    '/v5/account/wallet-balance': 'get_wallet_balance',
+    '/v5/account/withdrawal': 'get_transferable_amount',
+    '/v5/market/tickers': 'get_tickers',
+    '/v5/market/kline': 'get_kline',
+    '/v5/market/instruments-info': 'get_instruments_info',
+    '/v5/market/time': 'get_server_time',
+    '/v5/position/closed-pnl': 'get_closed_pnl',
+    '/v5/account/fee-rate': 'get_fee_rates'
+}
+
+_shared_sessions = WeakKeyDictionary() # event loop -> aiohttp session
+
+# One aiohttp session (connection pool) for all clients of the running loop.
+# A session is bound to its loop, so every loop (e.g. every asyncio.run) gets its own
+def get_shared_session():
+    loop = asyncio.get_running_loop()
+    session = _shared_sessions.get(loop)
+    if session == None or session.closed:
+        session = _shared_sessions[loop] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=1000, ttl_dns_cache=300), timeout=aiohttp.ClientTimeout(total=10))
+    return session
+
+# Closing the session of the running loop (call before the loop ends)
+async def close_shared_session():
+    session = _shared_sessions.pop(asyncio.get_running_loop(), None)
+    if session != None:
+        await session.close()
+
+
+class AsyncBybit:
+    def __init__(self, api, secret, user_id=None, telegram_bot=None, session=None, base_url=BYBIT_URL,
+                 limiter=rate_limiter, retries=3):
+        self.__api = api
+        self.__secret = secret
+        self.__bot = telegram_bot
+        self.__user_id = user_id
+        self.__session = session
+        self.__base_url = base_url
+        self.__limiter = limiter
+        self.__retries = retries
+        self.__logger = get_logger('bybit')
+        self.account = AccountState() # только кэш плеча и режима маржи
+
+    # Signed (auth) or public v5 request like pybit HTTP._submit_request. Raises InvalidRequestError on retCode != 0.
+    # Waits in the shared limiter queue like RateLimitedSession; 10006 is retried after the reset
+    async def _request(self, method, path, params=None, auth=True):
+        group, priority = ENDPOINT_GROUPS.get(PATH_METHODS.get(path), ('other', PRIORITY_READ))
+        uid = 'ip' if group == 'public' else self.__api
+        for attempt in range(self.__retries + 1):
+            await self.__limiter.acquire_async(uid, group, priority)
+            try:
+                body, headers = await self.__send(method, path, params, auth) # подпись после очереди - свежий timestamp
+            except InvalidRequestError as err:
+                if err.status_code != 10006 or attempt == self.__retries:
+                    raise
+                self.__limiter.on_rate_limited(uid, group, err.resp_headers)
+                continue
+            self.__limiter.update(uid, group, headers)
+            return body
+
+    async def __send(self, method, path, params, auth):
+        params = {k: int(v) if isinstance(v, float) and v == int(v) else v for k, v in (params or {}).items()}
+        if method == 'GET':
+            payload = '&'.join(f'{k}={v}' for k, v in params.items() if v != None)
+        else:
+            payload = json.dumps(params)
+
+        headers = {}
+        if auth:
+            timestamp = str(int(time() * 1000))
+            sign = hmac.new(self.__secret.encode('utf-8'), (timestamp + self.__api + str(RECV_WINDOW) + payload).encode('utf-8'),
+                            hashlib.sha256).hexdigest()
+            headers = {
+                'Content-Type': 'application/json',
+                'X-BAPI-API-KEY': self.__api,
+                'X-BAPI-SIGN': sign,
+                'X-BAPI-SIGN-TYPE': '2',
+                'X-BAPI-TIMESTAMP': timestamp,
+                'X-BAPI-RECV-WINDOW': str(RECV_WINDOW)
+            }
+
+        session = self.__session or get_shared_session()
+        url = self.__base_url + path
+        request_time = datetime.now(timezone.utc).strftime('%H:%M:%S')
+        if method == 'GET':
+            context = session.get(url + (f'?{payload}' if payload else ''), headers=headers)
+        else:
+            context = session.post(url, data=payload, headers=headers)
+
+        async with context as resp:
+            if resp.status != 200:
+                raise FailedRequestError(request=f'{method} {path}: {payload}', message='HTTP status code is not 200.',
+                                         status_code=resp.status, time=request_time, resp_headers=resp.headers)
+            body = await resp.json(content_type=None)
+            resp_headers = resp.headers
+
+        if body['retCode']:
+            raise InvalidRequestError(request=f'{method} {path}: {payload}', message=body['retMsg'],
+                                      status_code=body['retCode'], time=request_time, resp_headers=resp_headers)
+        return body, resp_headers
+
+    async def __notify(self, text):
+        if self.__bot and self.__user_id:
+            self.__bot.notify(self.__user_id, text) # только очередь, не ждем Telegram
+        else:
+            print(text)
+
+    # Getting balance on Bybit Derivatrives Asset (in USDT)
+    async def get_balance(self):
+        try:
+            resp = (await self._request('GET', '/v5/account/wallet-balance', {'accountType': 'UNIFIED', 'coin': 'USDT'})
+                    )['result']['list'][0]['coin'][0]['walletBalance']
+
+            self.__logger.info(f'Successfully got balance: {resp} USDT')
+            return float(resp)
+
+        except Exception as err:
+            self.__logger.error('Cannot get balance')
+            return None
+
+    # Getting balance available for withdraw
+    async def get_availableWithdrawal_balance(self, symbol="USDT"):
+        try:
+            resp = (await self._request('GET', '/v5/account/withdrawal', {'coinName': symbol}))['result']['availableWithdrawal']
+
+            self.__logger.info(f'Successfully got availableWithdrawal balance: {resp}')
+            return float(resp)
+
+        except Exception as err:
+            print(err)
+            self.__logger.error('Cannot get availableWithdrawal balance')
+            return None
+
+    # Getting all available tickers from Derivatives market (like 'BTCUSDT', 'ETHUSDT', etc)
+    async def get_tickers(self):
+        try:
+            resp = (await self._request('GET', '/v5/market/tickers', {'category': 'linear'}, auth=False))['result']['list']
+            symbols = [elem['symbol'] for elem in resp if 'USDT' in elem['symbol'] and not 'USDC' in elem['symbol']]
+
+            self.__logger.info('Successfully got all available tickers')
+            return symbols
+
+        except Exception as err:
+            print(err)
+            self.__logger.error('Cannot get all available tickers')
+            return None
+
+    async def __kline_page(self, symbol, timeframe, start, end):
+        resp = (await self._request('GET', '/v5/market/kline', {'category': 'linear', 'symbol': symbol, 'interval': timeframe,
+                                                                 'start': start, 'end': end - 1, 'limit': PAGE_LIMIT},
+                                    auth=False))['result']['list']
+        return parse_klines(resp).reshape(-1, len(KLINE_COLUMNS) + 1)
+
+    # Klines like Bybit.klines(): DataFrame, last elem has [-1] index.
+    # start_date without limit - the whole period, pages are requested concurrently like KlineDownloader
+    async def klines(self, symbol, timeframe, limit=None, start_date=None):
+        timeframe = str(timeframe)
+        try:
+            if limit == None and start_date != None:
+                start, end, pages = kline_pages(timeframe, start_date)
+                chunks = await asyncio.gather(*(self.__kline_page(symbol, timeframe, *page) for page in pages))
+                klines = Klines(stitch_pages(chunks, start, end))
+            else:
+                resp = (await self._request('GET', '/v5/market/kline', {'category': 'linear', 'symbol': symbol, 'interval': timeframe,
+                                                                         'limit': limit if limit != None else 200},
+                                            auth=False))['result']['list']
+                klines = Klines.from_response(resp)
+
+            self.__logger.info(f'Successfully got klines for {symbol}')
+            return klines.to_dataframe()
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot get klines for {symbol}')
+            return pd.DataFrame()
+
+    # Getting your current positions. It returns symbols list with opened positions
+    async def get_positions(self):
+        try:
+            resp = (await self._request('GET', '/v5/position/list', {'category': 'linear', 'settleCoin': 'USDT'}))['result']['list']
+
+            pos = {}
+            for elem in resp:
+                pos[elem['symbol']] = {'side': elem['side'], 'entryPrice': float(elem['avgPrice']), 'size': float(elem['size']),
+                                       'leverage': elem.get('leverage'), 'tradeMode': elem.get('tradeMode')}
+
+            self.__logger.info(f'Successfully got positions. Quantity: {len(pos)}')
+            return pos
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot get positions')
+            return None
+
+    # Get open orders
+    async def get_open_orders(self, symbol=None):
+        params = {'category': "linear",
+                  'settleCoin': 'USDT',
+                  'openOnly': 0}
+        if symbol != None:
+            params['symbol'] = symbol
+        try:
+            resp = (await self._request('GET', '/v5/order/realtime', params))['result']['list']
+
+            if symbol != None:
+                self.__logger.info(f'Successfully got open orders for {symbol}')
+            else:
+                self.__logger.info('Successfully got all open orders')
+            return resp
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot get open orders')
+            return None
+
+    # Cancel order by Id
+    async def cancel_order_by_id(self, symbol, orderId):
+        try:
+            await self._request('POST', '/v5/order/cancel', {'category': 'linear', 'symbol': symbol, 'orderId': orderId})
+            self.__logger.info(f'Successfully cancelled order {orderId}')
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot cancel order {orderId}')
+
+    # Cancel all symbol orders
+    async def cancel_all_symbol_orders(self, symbol):
+        try:
+            await self._request('POST', '/v5/order/cancel-all', {'category': 'linear', 'symbol': symbol})
+            self.__logger.info(f'Successfully cancelled all orders for {symbol}')
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot cancel all orders for {symbol}')
+
+    # Getting last N PnL (to check strategies performance)
+    async def get_last_pnl(self, limit=50):
+        try:
+            resp = (await self._request('GET', '/v5/position/closed-pnl', {'category': 'linear', 'limit': limit}))['result']['list']
+            pnl = sum(float(elem['closedPnl']) for elem in resp)
+
+            self.__logger.info(f'Successfully got last {limit} PnL')
+            return round(pnl, 4)
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot get last {limit} PnL')
+            return None
+
+    # Getting current PnL.
+    async def get_current_pnl(self, symbol=None):
+        try:
+            resp = (await self._request('GET', '/v5/position/list', {'category': 'linear', 'symbol': symbol, 'settleCoin': 'USDT'})
+                    )['result']['list']
+
+            if symbol == None:
+                pnl = sum(float(elem['unrealisedPnl']) for elem in resp)
+                self.__logger.info(f'Successfully got current PnL: {pnl}')
+            else:
+                pnl = float(resp[0]['unrealisedPnl'])
+                self.__logger.info(f'Successfully got current PnL for {symbol}: {pnl}')
+
+            return round(pnl, 4)
+
+        except Exception as err:
+            print(err)
+            self.__logger.error('Cannot get current PnL')
+            return None
+
+    # Changing mode and leverage (skipped if both are already set)
+    async def set_mode(self, symbol, mode=1, leverage=1):
+        if self.account.get_trade_mode(symbol) == int(mode) and self.account.get_leverage(symbol) == float(leverage):
+            self.account.count_saved_request()
+            return
+
+        try:
+            await self._request('POST', '/v5/position/switch-isolated', {'category': 'linear', 'symbol': symbol, 'tradeMode': mode,
+                                                                          'buyLeverage': str(leverage), 'sellLeverage': str(leverage)})
+            self.account.set_trade_mode(symbol, mode)
+            self.account.set_leverage(symbol, leverage)
+            self.__logger.info(f'Successfully changed margin mode to {'ISOLATED' if mode == 1 else 'CROSS'} for {symbol}')
+
+        except Exception as err:
+            if '110026' in str(err):
+                self.account.set_trade_mode(symbol, mode)
+                self.__logger.info(f'Margin mode is not changed for {symbol}')
+            else:
+                print(err)
+                self.__logger.error(f'Cannot change margin mode for {symbol}')
+
+    async def __instrument(self, symbol):
+        return (await self._request('GET', '/v5/market/instruments-info', {'category': 'linear', 'symbol': symbol},
+                                    auth=False))['result']['list'][0]
+
+    # Getting price and qty steps (registry first, like Bybit)
+    async def get_price_and_qty_steps(self, symbol):
+        tick, qty = instruments_registry.get_price_and_qty_steps(symbol)
+        if tick != None:
+            return tick, qty
+
+        try:
+            resp = await self.__instrument(symbol)
+            tick = float(resp['priceFilter']['tickSize'])
+            tick = tick if tick < 0.99 else int(tick)
+            qty = float(resp['lotSizeFilter']['qtyStep'])
+            qty = qty if qty < 0.99 else int(qty)
+
+            self.__logger.info(f'Successfully got steps for {symbol}: price - {tick} and lotSize - {qty}')
+            return tick, qty
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot get steps for {symbol}')
+            return None, None
+
+    # Get fee rates
+    async def get_fee_rates(self, symbol="BTCUSDT"):
+        try:
+            resp = (await self._request('GET', '/v5/account/fee-rate', {'category': 'linear', 'symbol': symbol}))['result']['list'][0]
+
+            self.__logger.info(f'Successfully got fee rates for {symbol}: taker - {resp['takerFeeRate']}, maker - {resp['makerFeeRate']}')
+            return float(resp['takerFeeRate']), float(resp['makerFeeRate'])
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot get fee rates for {symbol}')
+            return None, None
+
+    # Get min order quantity
+    async def get_min_order_quantity(self, symbol):
+        min_qty = instruments_registry.get_min_order_quantity(symbol)
+        if min_qty != None:
+            return min_qty
+
+        try:
+            min_qty = (await self.__instrument(symbol))['lotSizeFilter']['minOrderQty']
+
+            self.__logger.info(f'Successfully got min order quantity for {symbol}: {min_qty}')
+            return float(min_qty)
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot get min order quantity for {symbol}')
+            return None
+
+    # Get max available leverage
+    async def get_max_leverage(self, symbol):
+        max_leverage = instruments_registry.get_max_leverage(symbol)
+        if max_leverage != None:
+            return max_leverage
+
+        try:
+            resp = (await self.__instrument(symbol))['leverageFilter']['maxLeverage']
+
+            self.__logger.info(f'Successfully got max leverage for {symbol}: {resp}')
+            return float(resp)
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot get max leverage for {symbol}')
+            return None
+
+    # Set leverage (skipped if it is already set)
+    async def set_leverage(self, symbol, leverage=1):
+        if self.account.get_leverage(symbol) == float(leverage):
+            self.account.count_saved_request()
+            return
+
+        try:
+            await self._request('POST', '/v5/position/set-leverage', {'category': 'linear', 'symbol': symbol,
+                                                                       'buyLeverage': str(leverage), 'sellLeverage': str(leverage)})
+            self.account.set_leverage(symbol, leverage)
+            self.__logger.info(f'Successfully changed leverage to {leverage} for {symbol}')
+
+        except Exception as err:
+            if '110043' in str(err):
+                self.account.set_leverage(symbol, leverage)
+                self.__logger.info(f'Leverage is not changed to {leverage} for {symbol}')
+            else:
+                print(err)
+                self.__logger.error(f'Cannot change leverage to {leverage} for {symbol}')
+
+    # Get Market price
+    async def get_market_price(self, symbol):
+        try:
+            mark_price = (await self._request('GET', '/v5/market/tickers', {'category': 'linear', 'symbol': symbol},
+                                              auth=False))['result']['list'][0]['lastPrice']
+
+            self.__logger.info(f'Successfully got market price for {symbol}: {mark_price}')
+            return float(mark_price)
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot get market price for {symbol}')
+            return None
+
+    # Leverage, qty step and min qty - once per order (or per reversal)
+    async def __qty_rules(self, symbol, leverage):
+        await self.set_leverage(symbol, leverage)
+        size_step = (await self.get_price_and_qty_steps(symbol))[1]
+        if size_step == None:
+            return None
+        min_order_qty = await self.get_min_order_quantity(symbol)
+        if min_order_qty == None:
+            return None
+        return size_step, min_order_qty
+
+    def __round_qty(self, symbol, qty, rules):
+        qty = fit_qty(qty, rules)
+        if qty == None:
+            self.__logger.warning(f'Order size is too small for {symbol}')
+        return qty
+
+    async def __prepare_qty(self, symbol, leverage, qty):
+        if qty == None:
+            return None
+        rules = await self.__qty_rules(symbol, leverage)
+        if rules == None:
+            return None
+        return self.__round_qty(symbol, qty, rules)
+
+    # Placing order with Market price. Placing TP and SL as well
+    async def place_market_order(self, symbol, side, mode=1, leverage=1, qty=None, sl=None, tp=None):
+        qty = await self.__prepare_qty(symbol, leverage, qty)
+        if qty == None:
+            return
+
+        mark_price = await self.get_market_price(symbol)
+        if mark_price == None:
+            return
+
+        self.__logger.info(f'Start placing market {side} order for {symbol}. Mark price: {mark_price}')
+        try:
+            resp = await self._request('POST', '/v5/order/create', {'category': 'linear', **order_params(symbol, side, qty, sl=sl, tp=tp)})
+            self.__logger.info(f'Successfully placed market {side} order for {symbol}. Mark price: {mark_price}')
+            await self.__notify(order_text(resp['retMsg'] == 'OK', side, symbol, qty, mark_price, sl=sl, tp=tp))
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot place market {side} order for {symbol}')
+            raise Exception('Something is wrong with market order')
+
+    async def place_stop_order(self, symbol, side, price, triggerPrice=None, mode=1, leverage=1, qty=None, sl=None, tp=None):
+        qty = await self.__prepare_qty(symbol, leverage, qty)
+        if qty == None:
+            return
+
+        if triggerPrice == None:
+            triggerPrice = price
+
+        self.__logger.info(f'Start placing stop {side} order for {symbol}. Trigger price: {triggerPrice}')
+        try:
+            resp = await self._request('POST', '/v5/order/create',
+                                       {'category': 'linear', **order_params(symbol, side, qty, price, triggerPrice, sl, tp)})
+            self.__logger.info(f'Successfully placed stop {side} order for {symbol}. Trigger price: {triggerPrice}')
+            await self.__notify(order_text(resp['retMsg'] == 'OK', side, symbol, qty, price, triggerPrice, sl, tp))
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot place stop {side} order for {symbol}')
+            raise Exception('Something is wrong with stop order')
+
+    # Placing several linear orders in one request like Bybit.place_batch_order
+    async def place_batch_order(self, orders):
+        try:
+            resp = await self._request('POST', '/v5/order/create-batch', {'category': 'linear', 'request': orders})
+            placed = resp['result']['list']
+            statuses = resp.get('retExtInfo', {}).get('list', [{}] * len(placed))
+
+            results = [{'orderId': order.get('orderId', ''), 'code': status.get('code', 0), 'msg': status.get('msg', 'OK')}
+                       for order, status in zip(placed, statuses)]
+            self.__logger.info(f'Successfully placed batch of {len(orders)} orders. Results: {results}')
+            return results
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot place batch of {len(orders)} orders')
+            return None
+
+    # Reversing position in one round trip like Bybit.reverse_position
+    async def reverse_position(self, symbol, side, cur_size, qty, price=None, triggerPrice=None, leverage=1, sl=None, tp=None):
+        rules = await self.__qty_rules(symbol, leverage)
+        if rules == None:
+            return None
+        reversal = reversal_legs(symbol, side, cur_size, qty, rules, price, triggerPrice, sl, tp)
+        if reversal == None:
+            self.__logger.warning(f'Position size is too small to reverse for {symbol}')
+            return None
+        close_qty, open_qty, legs = reversal
+
+        self.__logger.info(f'Start reversing position to {side} for {symbol}: close {close_qty}, open {open_qty}')
+        results = await self.place_batch_order(legs)
+        if results == None:
+            raise Exception('Something is wrong with position reversal')
+
+        ok = all(result['code'] == 0 for result in results)
+        await self.__notify(reversal_text(ok, side, symbol, close_qty, open_qty, price, sl, tp))
+        return results
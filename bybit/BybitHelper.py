@@ -1,8 +1,14 @@
-from pybit.unified_trading import HTTP, WebSocket
+import numpy as np
 import pandas as pd
 from time import sleep
-import datetime as dt
 from logs.logger import get_logger
+from bybit.InstrumentsRegistry import instruments_registry
+from bybit.AccountState import AccountState
+from bybit.Endpoints import make_http
+from bybit.RateLimiter import RateLimitedSession
+from bybit.ConnectionManager import connection_manager
+from market_data.KlineDownloader import kline_downloader
+from bybit.KlineParser import Klines
 
 # timeframe 1, 3, 5, 15, 30, 60, 120, 240, 360, 720, D, M, W
 timeframe_match = {
@@ -10,30 +16,127 @@ timeframe_match = {
     '1 час': '60',
 }
 
+# Order params for place_order / place_batch_order (without category). Stop order if price is set
+def order_params(symbol, side, qty, price=None, triggerPrice=None, sl=None, tp=None):
+    params = {'symbol': symbol,
+              'side': side,
+              'orderType': 'Market',
+              'qty': str(qty),
+              'tpslMode': 'Full'}
+    if price != None:
+        params['orderType'] = 'Limit'
+        params['price'] = str(price)
+        params['triggerPrice'] = str(triggerPrice if triggerPrice != None else price)
+        params['triggerBy'] = 'LastPrice'
+        params['triggerDirection'] = 1 if side == 'Buy' else 2 # цена придет снизу / сверху
+    if tp != None:
+        params['takeProfit'] = str(tp)
+        params['tpOrderType'] = 'Market'
+        params['tpTriggerBy'] = 'LastPrice'
+    if sl != None:
+        params['stopLoss'] = str(sl)
+        params['slOrderType'] = 'Market'
+        params['slTriggerBy'] = 'LastPrice'
+    return params
+
+# Qty rounded down to qty step with its precision
+def round_qty(qty, size_step):
+    qty = int(qty / size_step) * size_step
+    if size_step < 1:
+        size_precision = len(str(size_step).split('.')[1])
+        qty = round(qty, size_precision)
+    return qty
+
+# Qty rounded to qty step, None if it is below min order qty. rules - (size_step, min_order_qty)
+def fit_qty(qty, rules):
+    size_step, min_order_qty = rules
+    qty = round_qty(qty, size_step) # Приводим qty к необходимой точности
+    return qty if qty >= min_order_qty else None
+
+# Legs of position reversal: side - side of the new position, cur_size - size of the current one.
+# Market - one net-size order (cur_size + qty), stop (price is set) - close and open legs in one batch.
+# Returns close_qty, open_qty, legs; None if the position is below min order qty
+def reversal_legs(symbol, side, cur_size, qty, rules, price=None, triggerPrice=None, sl=None, tp=None):
+    # размер позиции уже кратен шагу - полшага защищают от ошибки округления float (0.29 / 0.01 = 28.99...)
+    close_qty = fit_qty(cur_size + rules[0] / 2, rules)
+    if close_qty == None:
+        return None
+    open_qty = (fit_qty(qty, rules) if qty != None else None) or 0 # маленький новый объем - только закрываем
+
+    if price == None:
+        # в one-way режиме рыночный ордер на cur_size + qty закрывает позицию и открывает обратную
+        net_qty = fit_qty(close_qty + open_qty + rules[0] / 2, rules)
+        legs = [order_params(symbol, side, net_qty, sl=sl, tp=tp)]
+    else:
+        legs = [order_params(symbol, side, close_qty, price, triggerPrice, sl, tp)]
+        if open_qty > 0:
+            legs.append(order_params(symbol, side, open_qty, price, triggerPrice, sl, tp))
+    return close_qty, open_qty, legs
+
+# Telegram text about placed order (stop order if triggerPrice is set)
+def order_text(ok, side, symbol, qty, price, triggerPrice=None, sl=None, tp=None):
+    kind = 'рыночного ордера' if triggerPrice == None else 'стоп-ордера'
+    direction = 'покупку' if side == 'Buy' else 'продажу'
+    if ok:
+        text = f"Выставлен {'рыночный ордер' if triggerPrice == None else 'стоп-ордер'} на {direction}.\n"
+    else:
+        text = f"ОШИБКА при выставлении {kind} на {direction}.\n"
+
+    text += f"Инструмент: {symbol}.\n"
+    if triggerPrice != None:
+        text += f"Триггер-цена: {triggerPrice}.\n"
+    text += (
+        f"Цена: {price}.\n"
+        f"Стоп-лосс: {sl if sl != None else '---'}.\n"
+        f"Тейк-профит: {tp if tp != None else '---'}.\n"
+        f"Количество: {qty} ({round(qty * price, 4)} USDT)."
+    )
+    return text
+
+# Telegram text about position reversal
+def reversal_text(ok, side, symbol, close_qty, open_qty, price=None, sl=None, tp=None):
+    text = ("Выставлен переворот позиции" if ok else "ОШИБКА при перевороте позиции") + \
+           (" в лонг.\n" if side == 'Buy' else " в шорт.\n")
+    text += (
+        f"Инструмент: {symbol}.\n"
+        f"Тип: {'рыночный' if price == None else 'стоп-ордер'}.\n"
+        f"Цена: {price if price != None else '---'}.\n"
+        f"Стоп-лосс: {sl if sl != None else '---'}.\n"
+        f"Тейк-профит: {tp if tp != None else '---'}.\n"
+        f"Закрытие: {close_qty}. Открытие: {open_qty}."
+    )
+    return text
+
 class Bybit:
-    def __init__(self, api, secret, user_id=None, telegram_bot=None):
+    # ws=False - REST only (handlers, checks): no private stream subscription
+    def __init__(self, api, secret, user_id=None, telegram_bot=None, ws=True):
+        self.__stream = None # подписка на общий приватный стрим ключа (ConnectionManager)
         self.__bot = telegram_bot
         self.__user_id = user_id
-        self.__session = HTTP(api_key=api, api_secret=secret, testnet=False)
-        self.__ws = None
+        self.__api = api
+        self.__secret = secret
+        # запросы идут через общий планировщик лимитов (корзины на ключ API и группу эндпоинтов)
+        self.__session = RateLimitedSession(make_http(api_key=api, api_secret=secret), uid=api)
         self.__logger = get_logger('bybit')
         self.is_connected = True
+        self.account = AccountState(available_loader=self.get_availableWithdrawal_balance)
 
-        if self.get_balance() != None:
-            self.__ws = WebSocket(channel_type="private", api_key=api, api_secret=secret, testnet=False)
-            self.start_order_ws_stream() # Запуск отслеживания ордеров через WebSocket
-        else:
+        if self.get_balance() == None:
             self.is_connected = False
+        elif ws:
+            self.start_ws_stream() # Ордера, позиции, исполнения и кошелек для зеркала аккаунта
 
+    # Callbacks keep the client alive while it is subscribed, so the stream is released by close(), not by GC
     def __del__(self):
-        if self.is_connected:
-            self.stop_ws_stream() # Остановка отслеживания ордеров через WebSocket
+        self.close()
 
     def filled_order_callback(self, message):
         if not message['data']:
             return
 
         try:
+            self.account.on_order(message)
+
             for order in message['data']:
                 if order['orderStatus'] == "Filled" and order['rejectReason'] == "EC_NoError":
                     text = (
@@ -45,10 +148,7 @@ class Bybit:
                     )
 
                     # могут приходить на все ордера, даже когда не запущена стратегия
-                    if self.__bot and self.__user_id:
-                        self.__bot.send_message_to_user(self.__user_id, text)
-                    else:
-                        print(text)
+                    self.__notify(text)
 
             self.__logger.info('Successfully got info about filled orders')
 
@@ -56,17 +156,62 @@ class Bybit:
             print(err)
             self.__logger.error('Error in filled_order_callback')
 
-    def start_order_ws_stream(self):
+    def account_state_callback(self, message):
+        if not message['data']:
+            return
+
+        try:
+            topic = message['topic']
+            if topic == 'position':
+                self.account.on_position(message)
+            elif topic == 'execution':
+                self.account.on_execution(message)
+            elif topic == 'wallet':
+                self.account.on_wallet(message)
+        except Exception as err:
+            print(err)
+            self.__logger.error('Error in account_state_callback')
+
+    def private_stream_callback(self, message):
+        if message['topic'] == 'order':
+            self.filled_order_callback(message)
+        else:
+            self.account_state_callback(message)
+
+    # Subscribing to the private stream of the key (one socket per key for the whole process)
+    def start_ws_stream(self):
         try:
-            self.__ws.order_stream(callback=self.filled_order_callback)
-            self.__logger.info('Successfully activated order stream by Bybit WebSocket')
+            self.__stream = connection_manager.acquire(self.__api, self.__secret, self.private_stream_callback,
+                                                       on_reconnect=self.account.invalidate)
+            self.__logger.info('Successfully activated private streams by Bybit WebSocket')
         except Exception as err:
             print(err)
-            self.__logger.error('Cannot activate order stream by Bybit WebSocket')
-    
-    def stop_ws_stream(self):
+            self.__logger.error('Cannot activate private streams by Bybit WebSocket')
+
+    # Reconciling account state mirror with REST (only when it is stale). Returns False if Bybit is unavailable
+    def sync_account(self, force=False):
+        if not force and not self.account.is_stale():
+            return True
+
+        balance = self.get_balance()
+        if balance == None:
+            return False
+        positions = self.get_positions()
+        orders = self.get_open_orders()
+        if positions == None or orders == None:
+            return False
+
+        self.account.reconcile(positions, orders, balance)
+        self.__logger.info('Successfully reconciled account state')
+        return True
+
+    # Releasing the private stream subscription (the socket closes with its last user)
+    def close(self):
+        stream, self.__stream = self.__stream, None
+        if stream == None:
+            return
         try:
-            self.__ws.exit()
+            connection_manager.release(self.__api, stream)
             self.__logger.info('Successfully stopped stream by Bybit WebSocket')
         except Exception as err:
             print(err)
@@ -115,40 +260,28 @@ class Bybit:
             self.__logger.error('Cannot get all available tickers')
             return None
 
-    # Klines is the candles of some symbol (up to 1500 candles). Dataframe, last elem has [-1] index
-    def klines(self, symbol, timeframe, limit=None, start_date=None):
+    # Klines is the candles of some symbol (up to 1500 candles). Dataframe, last elem has [-1] index.
+    # as_array=True - Klines (float64 array, DataFrame only on to_dataframe())
+    def klines(self, symbol, timeframe, limit=None, start_date=None, as_array=False):
         '''
             timeframe 1, 3, 5, 15, 30, 60, 120, 240, 360, 720, D, M, W
         '''
-        params = {'category': 'linear',
-                  'symbol': symbol,
-                  'interval': str(timeframe)}
-        
-        if limit == None:
-            if start_date != None:
-                start = int(dt.datetime.strptime(start_date, "%Y-%m-%d").timestamp() * 1000)
-                params['start'] = start
-            else:
-                limit = 200
-        if limit != None:
-            params['limit'] = limit
-        
         try:
-            resp = self.__session.get_kline(**params)['result']['list']
-
-            resp = pd.DataFrame(resp)
-            resp.columns = ['Time', 'Open', 'High', 'Low', 'Close', 'Volume', 'Turnover']
-            resp = resp.set_index('Time')
-            resp = resp.astype(float)
-            resp = resp[::-1]
+            # весь период от start_date - постранично (один запрос вернул бы только первые 1000 свечей)
+            if limit == None and start_date != None:
+                klines = Klines(kline_downloader.download(symbol, timeframe, start_date))
+            else:
+                resp = self.__session.get_kline(category='linear', symbol=symbol, interval=str(timeframe),
+                                                limit=limit if limit != None else 200)['result']['list']
+                klines = Klines.from_response(resp)
 
             self.__logger.info(f'Successfully got klines for {symbol}')
-            return resp
+            return klines if as_array else klines.to_dataframe()
         
         except Exception as err:
             print(err)
             self.__logger.error(f'Cannot get klines for {symbol}')
-            return pd.DataFrame()
+            return Klines(np.empty((0, 7))) if as_array else pd.DataFrame()
 
     # Getting your current positions. It returns symbols list with opened positions
     def get_positions(self):
@@ -160,7 +293,8 @@ class Bybit:
 
             pos = {}
             for elem in resp:
-                pos[elem['symbol']] = {'side': elem['side'], 'entryPrice': float(elem['avgPrice']), 'size': float(elem['size'])}
+                pos[elem['symbol']] = {'side': elem['side'], 'entryPrice': float(elem['avgPrice']), 'size': float(elem['size']),
+                                       'leverage': elem.get('leverage'), 'tradeMode': elem.get('tradeMode')}
             
             self.__logger.info(f'Successfully got positions. Quantity: {len(pos)}')
             return pos
@@ -261,8 +395,12 @@ class Bybit:
             self.__logger.error('Cannot get current PnL')
             return None
 
-    # Changing mode and leverage
+    # Changing mode and leverage (skipped if both are already set)
     def set_mode(self, symbol, mode=1, leverage=1):
+        if self.account.get_trade_mode(symbol) == int(mode) and self.account.get_leverage(symbol) == float(leverage):
+            self.account.count_saved_request()
+            return
+
         try:
             resp = self.__session.switch_margin_mode(
                 category='linear',
@@ -273,6 +411,8 @@ class Bybit:
             )
 
             if resp['retMsg'] == 'OK':
+                self.account.set_trade_mode(symbol, mode)
+                self.account.set_leverage(symbol, leverage)
                 if mode == 1:
                     self.__logger.info(f'Successfully changed margin mode to ISOLATED for {symbol}')
                 if mode == 0:
@@ -282,6 +422,7 @@ class Bybit:
         
         except Exception as err:
             if '110026' in str(err):
+                self.account.set_trade_mode(symbol, mode)
                 self.__logger.info(f'Margin mode is not changed for {symbol}')
             else:
                 print(err)
@@ -289,6 +430,10 @@ class Bybit:
 
     # Getting number of decimal digits for price and qty
     def get_price_and_qty_steps(self, symbol):
+        tick, qty = instruments_registry.get_price_and_qty_steps(symbol)
+        if tick != None:
+            return tick, qty
+
         try:
             resp = self.__session.get_instruments_info(
                 category='linear',
@@ -334,6 +479,10 @@ class Bybit:
         
     # Get min order quantity
     def get_min_order_quantity(self, symbol):
+        min_qty = instruments_registry.get_min_order_quantity(symbol)
+        if min_qty != None:
+            return min_qty
+
         try:
             min_qty = self.__session.get_instruments_info(
                 category='linear',
@@ -350,6 +499,10 @@ class Bybit:
 
     # Get max available leverage
     def get_max_leverage(self, symbol):
+        max_leverage = instruments_registry.get_max_leverage(symbol)
+        if max_leverage != None:
+            return max_leverage
+
         try:
             resp = self.__session.get_instruments_info(
                 category="linear",
@@ -364,8 +517,12 @@ class Bybit:
             self.__logger.error(f'Cannot get max leverage for {symbol}')
             return None
 
-    # Set leverage
+    # Set leverage (skipped if it is already set)
     def set_leverage(self, symbol, leverage=1):
+        if self.account.get_leverage(symbol) == float(leverage):
+            self.account.count_saved_request()
+            return
+
         try:
             resp = self.__session.set_leverage(
                 category="linear",
@@ -374,12 +531,14 @@ class Bybit:
                 sellLeverage=str(leverage)
             )
             if resp['retMsg'] == 'OK':
+                self.account.set_leverage(symbol, leverage)
                 self.__logger.info(f'Successfully changed leverage to {leverage} for {symbol}')
             else:
                 self.__logger.warning(f'After changing leverage to {leverage} for {symbol} got message: {resp['retMsg']}')
 
         except Exception as err:
             if '110043' in str(err):
+                self.account.set_leverage(symbol, leverage)
                 self.__logger.info(f'Leverage is not changed to {leverage} for {symbol}')
             else:
                 print(err)
@@ -401,29 +560,43 @@ class Bybit:
             self.__logger.error(f'Cannot get market price for {symbol}')
             return None
 
-    # Placing order with Market price. Placing TP and SL as well
-    def place_market_order(self, symbol, side, mode=1, leverage=1, qty=None, sl=None, tp=None):
-        if qty == None:
-            return
-        
+    # Setting leverage, getting qty step and min qty - once per order (or per reversal)
+    def __qty_rules(self, symbol, leverage):
         self.set_leverage(symbol, leverage)
-        # sleep(0.5)
-
         size_step = self.get_price_and_qty_steps(symbol)[1]
         if size_step == None:
-            return
-        
-        # Приводим qty к необходимой точности
-        qty = int(qty / size_step) * size_step
-        if size_step < 1:
-            size_precision = len(str(size_step).split('.')[1])
-            qty = round(qty, size_precision)
-
+            return None
         min_order_qty = self.get_min_order_quantity(symbol)
         if min_order_qty == None:
-            return
-        if qty < min_order_qty:
+            return None
+        return size_step, min_order_qty
+
+    # Qty rounded to qty step. None if the order is too small
+    def __round_qty(self, symbol, qty, rules):
+        qty = fit_qty(qty, rules)
+        if qty == None:
             self.__logger.warning(f'Order size is too small for {symbol}')
+        return qty
+
+    def __prepare_qty(self, symbol, leverage, qty):
+        if qty == None:
+            return None
+        rules = self.__qty_rules(symbol, leverage)
+        if rules == None:
+            return None
+        return self.__round_qty(symbol, qty, rules)
+
+    # Queued in the bot's notifier, never waits for Telegram
+    def __notify(self, text):
+        if self.__bot and self.__user_id:
+            self.__bot.notify(self.__user_id, text)
+        else:
+            print(text)
+
+    # Placing order with Market price. Placing TP and SL as well
+    def place_market_order(self, symbol, side, mode=1, leverage=1, qty=None, sl=None, tp=None):
+        qty = self.__prepare_qty(symbol, leverage, qty)
+        if qty == None:
             return
         
         mark_price = self.get_market_price(symbol)
@@ -432,55 +605,18 @@ class Bybit:
         
         self.__logger.info(f'Start placing market {side} order for {symbol}. Mark price: {mark_price}')
 
-        params = {'category': 'linear',
-                  'symbol': symbol,
-                  'orderType': 'Market',
-                  'qty': str(qty),
-                  'tpslMode': 'Full'}
-        if tp != None:
-            params['takeProfit'] = str(tp)
-            params['tpOrderType'] = 'Market'
-            params['tpTriggerBy'] = 'LastPrice'
-        if sl != None:
-            params['stopLoss'] = str(sl)
-            params['slOrderType'] = 'Market'
-            params['slTriggerBy'] = 'LastPrice'
+        params = order_params(symbol, side, qty, sl=sl, tp=tp)
 
         try:
-            if side == 'Buy':
-                params['side'] = 'Buy'
-                resp = self.__session.place_order(**params)
-
-                if resp['retMsg'] == 'OK':
-                    self.__logger.info(f'Successfully placed market {side} order for {symbol}. Mark price: {mark_price}')
-                    text = "Выставлен рыночный ордер на покупку.\n"
-                else:
-                    self.__logger.error(f'Error after placing market {side} order for {symbol}. Message: {resp['retMsg']}')
-                    text = "ОШИБКА при выставлении рыночного ордера на покупку.\n"
-
-            else: # Sell
-                params['side'] = 'Sell'
-                resp = self.__session.place_order(**params)
-
-                if resp['retMsg'] == 'OK':
-                    self.__logger.info(f'Successfully placed market {side} order for {symbol}. Mark price: {mark_price}')
-                    text = "Выставлен рыночный ордер на продажу.\n"
-                else:
-                    self.__logger.error(f'Error after placing market {side} order for {symbol}. Message: {resp['retMsg']}')
-                    text = "ОШИБКА при выставлении рыночного ордера на продажу.\n"
-
-            text += (
-                f"Инструмент: {symbol}.\n"
-                f"Цена: {mark_price}.\n"
-                f"Стоп-лосс: {sl if sl != None else '---'}.\n"
-                f"Тейк-профит: {tp if tp != None else '---'}.\n"
-                f"Количество: {qty} ({round(qty * mark_price, 4)} USDT)."
-            )
+            resp = self.__session.place_order(category='linear', **params)
 
-            if self.__bot and self.__user_id:
-                self.__bot.send_message_to_user(self.__user_id, text)
+            ok = resp['retMsg'] == 'OK'
+            if ok:
+                self.__logger.info(f'Successfully placed market {side} order for {symbol}. Mark price: {mark_price}')
             else:
-                print(text)
+                self.__logger.error(f'Error after placing market {side} order for {symbol}. Message: {resp['retMsg']}')
+            text = order_text(ok, side, symbol, qty, mark_price, sl=sl, tp=tp)
+            self.__notify(text)
             
         except Exception as err:
             print(err)
@@ -488,93 +624,71 @@ class Bybit:
             raise Exception('Something is wrong with market order')
 
     def place_stop_order(self, symbol, side, price, triggerPrice=None, mode=1, leverage=1, qty=None, sl=None, tp=None):
+        qty = self.__prepare_qty(symbol, leverage, qty)
         if qty == None:
             return
-        
-        self.set_leverage(symbol, leverage)
-        # sleep(0.5)
-
-        size_step = self.get_price_and_qty_steps(symbol)[1]
-        if size_step == None:
-            return
-
-        # Приводим qty к необходимой точности
-        qty = int(qty / size_step) * size_step
-        if size_step < 1:
-            size_precision = len(str(size_step).split('.')[1])
-            qty = round(qty, size_precision)
-
-        min_order_qty = self.get_min_order_quantity(symbol)
-        if min_order_qty == None:
-            return
-        if qty < min_order_qty:
-            self.__logger.warning(f'Order size is too small for {symbol}')
-            return
 
         if triggerPrice == None:
             triggerPrice = price
         
         self.__logger.info(f'Start placing stop {side} order for {symbol}. Trigger price: {triggerPrice}')
 
-        params = {'category': 'linear',
-                  'symbol': symbol,
-                  'orderType': 'Limit',
-                  'qty': str(qty),
-                  'price': str(price),
-                  'triggerPrice': str(triggerPrice),
-                  'triggerBy': 'LastPrice',
-                  'tpslMode': 'Full'}
-        if tp != None:
-            params['takeProfit'] = str(tp)
-            params['tpOrderType'] = 'Market'
-            params['tpTriggerBy'] = 'LastPrice'
-        if sl != None:
-            params['stopLoss'] = str(sl)
-            params['slOrderType'] = 'Market'
-            params['slTriggerBy'] = 'LastPrice'
+        params = order_params(symbol, side, qty, price, triggerPrice, sl, tp)
 
         try:
-            if side == 'Buy':
-                params['side'] = 'Buy'
-                params['triggerDirection'] = 1 # цена придет снизу
-                
-                resp = self.__session.place_order(**params)
-
-                if resp['retMsg'] == 'OK':
-                    self.__logger.info(f'Successfully placed stop {side} order for {symbol}. Trigger price: {triggerPrice}')
-                    text = "Выставлен стоп-ордер на покупку.\n"
-                else:
-                    self.__logger.error(f'Error after placing stop {side} order for {symbol}. Message: {resp['retMsg']}')
-                    text = "ОШИБКА при выставлении стоп-ордера на покупку.\n"
-
-            else: # Sell
-                params['side'] = 'Sell'
-                params['triggerDirection'] = 2 # цена придет сверху
-                
-                resp = self.__session.place_order(**params)
-
-                if resp['retMsg'] == 'OK':
-                    self.__logger.info(f'Successfully placed stop {side} order for {symbol}. Trigger price: {triggerPrice}')
-                    text = "Выставлен стоп-ордер на продажу.\n"
-                else:
-                    self.__logger.error(f'Error after placing stop {side} order for {symbol}. Message: {resp['retMsg']}')
-                    text = "ОШИБКА при выставлении стоп-ордера на продажу.\n"
-
-            text += (
-                f"Инструмент: {symbol}.\n"
-                f"Триггер-цена: {triggerPrice}.\n"
-                f"Цена: {price}.\n"
-                f"Стоп-лосс: {sl if sl != None else '---'}.\n"
-                f"Тейк-профит: {tp if tp != None else '---'}.\n"
-                f"Количество: {qty} ({round(qty * price, 4)} USDT)."
-            )
+            resp = self.__session.place_order(category='linear', **params)
 
-            if self.__bot and self.__user_id:
-                self.__bot.send_message_to_user(self.__user_id, text)
+            ok = resp['retMsg'] == 'OK'
+            if ok:
+                self.__logger.info(f'Successfully placed stop {side} order for {symbol}. Trigger price: {triggerPrice}')
             else:
-                print(text)
+                self.__logger.error(f'Error after placing stop {side} order for {symbol}. Message: {resp['retMsg']}')
+            text = order_text(ok, side, symbol, qty, price, triggerPrice, sl, tp)
+            self.__notify(text)
             
         except Exception as err:
             print(err)
             self.__logger.error(f'Cannot place stop {side} order for {symbol}')
             raise Exception('Something is wrong with stop order')
+
+    # Placing several linear orders in one request. orders - params like order_params()
+    # Returns results per order: [{'orderId', 'code', 'msg'}], None if the request failed
+    def place_batch_order(self, orders):
+        try:
+            resp = self.__session.place_batch_order(category='linear', request=orders)
+            placed = resp['result']['list']
+            statuses = resp.get('retExtInfo', {}).get('list', [{}] * len(placed))
+
+            results = []
+            for order, status in zip(placed, statuses):
+                results.append({'orderId': order.get('orderId', ''), 'code': status.get('code', 0), 'msg': status.get('msg', 'OK')})
+            self.__logger.info(f'Successfully placed batch of {len(orders)} orders. Results: {results}')
+            return results
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot place batch of {len(orders)} orders')
+            return None
+
+    # Reversing position in one round trip: side - side of the new position, cur_size - size of the current one.
+    # Market - one net-size order (cur_size + qty), stop (price is set) - close and open legs in one batch.
+    # Returns results per leg like place_batch_order
+    def reverse_position(self, symbol, side, cur_size, qty, price=None, triggerPrice=None, leverage=1, sl=None, tp=None):
+        rules = self.__qty_rules(symbol, leverage)
+        if rules == None:
+            return None
+        reversal = reversal_legs(symbol, side, cur_size, qty, rules, price, triggerPrice, sl, tp)
+        if reversal == None:
+            self.__logger.warning(f'Position size is too small to reverse for {symbol}')
+            return None
+        close_qty, open_qty, legs = reversal
+
+        self.__logger.info(f'Start reversing position to {side} for {symbol}: close {close_qty}, open {open_qty}')
+        results = self.place_batch_order(legs)
+        if results == None:
+            raise Exception('Something is wrong with position reversal')
+
+        ok = all(result['code'] == 0 for result in results)
+        text = reversal_text(ok, side, symbol, close_qty, open_qty, price, sl, tp)
+        self.__notify(text)
+        return results
@@ -0,0 +1,58 @@
+from collections import OrderedDict
+from threading import Lock
+from time import time
+from logs.logger import get_logger
+from bybit.BybitHelper import Bybit
+
+# Кэш авторизованных REST-клиентов Bybit по ключу API для обработчиков Telegram:
+# одна keep-alive сессия на пользователя вместо нового клиента (TLS и проверочный запрос) на каждое нажатие кнопки.
+# Клиенты без WebSocket, давно не использованные и лишние сверх max_clients вытесняются
+class ClientPool:
+    def __init__(self, max_clients=1000, idle_ttl=1800):
+        self.__logger = get_logger('clientPool')
+        self.__lock = Lock()
+        self.__clients = OrderedDict() # api -> {'client', 'secret', 'used'}, последние использованные в конце
+        self.__max_clients = max_clients
+        self.__idle_ttl = idle_ttl
+        self.hits = 0
+        self.misses = 0
+
+    def __evict(self):
+        now = time()
+        while self.__clients:
+            api, entry = next(iter(self.__clients.items()))
+            if len(self.__clients) <= self.__max_clients and now - entry['used'] < self.__idle_ttl:
+                break
+            del self.__clients[api]
+
+    # REST-only Bybit for the keys. Clients with invalid keys (is_connected == False) are not cached
+    def get(self, api, secret):
+        with self.__lock:
+            entry = self.__clients.get(api)
+            if entry != None and entry['secret'] == secret:
+                entry['used'] = time()
+                self.__clients.move_to_end(api)
+                self.hits += 1
+                return entry['client']
+            self.misses += 1
+
+        client = Bybit(api, secret, ws=False)
+        if not client.is_connected:
+            return client
+
+        with self.__lock:
+            self.__clients[api] = {'client': client, 'secret': secret, 'used': time()}
+            self.__clients.move_to_end(api)
+            self.__evict()
+        return client
+
+    # Forgetting the keys (user replaced or removed them)
+    def drop(self, api):
+        with self.__lock:
+            self.__clients.pop(api, None)
+
+    def stats(self):
+        with self.__lock:
+            return {'clients': len(self.__clients), 'hits': self.hits, 'misses': self.misses}
+
+client_pool = ClientPool()
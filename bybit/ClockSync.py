@@ -0,0 +1,86 @@
+from threading import Thread, Event
+from time import time, sleep
+from logs.logger import get_logger
+from bybit.RateLimiter import rate_limiter
+from bybit.Endpoints import make_http
+
+# Смещение часов биржи относительно локальных.
+# Каждая синхронизация - несколько запросов времени сервера, берется ответ с минимальным RTT:
+# ошибка оценки смещения не больше RTT / 2. В фоне синхронизация повторяется, чтобы учесть дрейф локальных часов.
+# Запросы идут своим HTTP клиентом: токен 'ip' берется до отметки sent, так что очередь лимитера не попадает в RTT
+class ClockSync:
+    def __init__(self, samples=5, resync_interval=600):
+        self.__http = make_http()
+        self.__logger = get_logger('clockSync')
+        self.__samples = samples
+        self.__resync_interval = resync_interval
+        self.__stop = Event()
+        self.__thread = None
+        self.offset_ms = 0 # серверное время - локальное
+        self.rtt_ms = None # RTT лучшего замера последней синхронизации
+        self.synced_at = 0
+
+    # One request: (rtt, offset) in ms
+    def __sample(self):
+        rate_limiter.acquire('ip', 'public')
+        sent = time() * 1000
+        resp = self.__http.get_server_time()['result']
+        received = time() * 1000
+        return received - sent, int(resp['timeNano']) / 1e6 - (sent + received) / 2
+
+    def sync(self):
+        try:
+            rtt, offset = min(self.__sample() for _ in range(self.__samples))
+            drift = offset - self.offset_ms if self.synced_at else 0
+
+            self.offset_ms = offset
+            self.rtt_ms = rtt
+            self.synced_at = time() * 1000
+
+            self.__logger.info(f'Successfully synced server time. Offset: {round(offset, 1)} ms, RTT: {round(rtt, 1)} ms, '
+                               f'drift: {round(drift, 1)} ms')
+            return True
+
+        except Exception as err:
+            print(err)
+            self.__logger.error('Cannot sync server time')
+            return False
+
+    # Syncing now and then every resync_interval seconds in a background thread
+    def start(self):
+        if self.__thread != None and self.__thread.is_alive():
+            return
+        self.sync()
+        self.__stop.clear()
+        self.__thread = Thread(target=self.__run, daemon=True, name='clockSync')
+        self.__thread.start()
+
+    def __run(self):
+        while not self.__stop.wait(self.__resync_interval):
+            self.sync()
+
+    def stop(self):
+        self.__stop.set()
+
+    # Max error of now_ms() after the last sync
+    def error_ms(self):
+        return self.rtt_ms / 2 if self.rtt_ms != None else 0
+
+    # Current exchange time in ms
+    def now_ms(self):
+        return time() * 1000 + self.offset_ms
+
+    # Converting exchange time (ms) to local unix time (s)
+    def to_local(self, server_ms):
+        return (server_ms - self.offset_ms) / 1000
+
+    # Sleeping until exchange time server_ms. Returns how late we woke up (ms)
+    def sleep_until(self, server_ms):
+        while True:
+            left = (server_ms - self.now_ms()) / 1000
+            if left <= 0:
+                return -left * 1000
+            # длинный сон с запасом, последние миллисекунды - короткими снами (sleep может проспать на 1-2 ms)
+            sleep(left - 0.01 if left > 0.02 else min(left, 0.001))
+
+clock_sync = ClockSync()
@@ -0,0 +1,178 @@
+from threading import Lock, Thread, Event, active_count
+from itertools import count
+from time import time, sleep
+from logs.logger import get_logger
+from bybit.Endpoints import make_websocket
+
+PRIVATE_TOPICS = ['order', 'position', 'execution', 'wallet']
+
+# Приватные WebSocket стримы Bybit: один на ключ API на весь процесс, сколько бы клиентов Bybit его ни использовали.
+# acquire() увеличивает счетчик ссылок и добавляет слушателя, release() уменьшает, последний release закрывает сокет.
+# Переподключения pybit ловятся по _on_open сокета: после переподписки слушатели получают on_reconnect
+# (сообщения за время разрыва могли потеряться). Сторож пересоздает стрим, если pybit сдался
+class ConnectionManager:
+    def __init__(self, check_interval=10):
+        self.__logger = get_logger('connectionManager')
+        self.__lock = Lock()
+        self.__key_locks = {}
+        self.__streams = {} # api -> {'ws', 'secret', 'listeners': {token: (callback, on_reconnect)}, 'down'}
+        self.__tokens = count()
+        self.__check_interval = check_interval
+        self.__watchdog = None
+        self.__stop = Event()
+        self.reconnects = 0
+
+    def __key_lock(self, api):
+        with self.__lock:
+            return self.__key_locks.setdefault(api, Lock())
+
+    def __connect(self, api, secret):
+        ws = make_websocket('private', api_key=api, api_secret=secret)
+        self.__hook_reconnects(api, ws)
+        for topic in PRIVATE_TOPICS:
+            getattr(ws, f'{topic}_stream')(callback=lambda message, api=api: self.__dispatch(api, message))
+        return ws
+
+    # pybit calls ws._on_open() on every connect, including its own reconnects; the first one is already done here
+    def __hook_reconnects(self, api, ws):
+        on_open = ws._on_open
+        def reopened():
+            on_open()
+            Thread(target=self.__reconnected, args=(api, ws), daemon=True, name='connectionManagerReconnect').start()
+        ws._on_open = reopened
+
+    # Notifying listeners once pybit has authenticated and resubscribed the reopened socket
+    def __reconnected(self, api, ws, timeout=30):
+        deadline = time() + timeout
+        while ws.attempting_connection and time() < deadline:
+            sleep(0.05)
+        with self.__key_lock(api):
+            with self.__lock:
+                stream = self.__streams.get(api)
+            if stream == None or stream['ws'] is not ws:
+                return # сокет уже закрыт или заменен
+            self.reconnects += 1
+            stream['down'] = False
+            self.__logger.info('Private stream reconnected')
+        self.__on_reconnect(stream)
+
+    def __dispatch(self, api, message):
+        with self.__lock:
+            stream = self.__streams.get(api)
+            listeners = list(stream['listeners'].values()) if stream != None else []
+        for callback, _ in listeners:
+            try:
+                callback(message)
+            except Exception as err:
+                print(err)
+                self.__logger.error(f'Error in private stream listener: {err}')
+
+    @staticmethod
+    def __close(ws):
+        try:
+            ws.exit()
+        except Exception as err:
+            print(err)
+
+    # Subscribing callback(message) to the private topics of the key. Returns a token for release()
+    def acquire(self, api, secret, callback, on_reconnect=None):
+        token = next(self.__tokens)
+        with self.__key_lock(api):
+            with self.__lock:
+                stream = self.__streams.get(api)
+            if stream == None or stream['secret'] != secret:
+                if stream != None:
+                    self.__close(stream['ws']) # ключ перевыпущен - старый сокет больше не нужен
+                ws = self.__connect(api, secret) # под блокировкой только этого ключа: подключение занимает время
+                stream = {'ws': ws, 'secret': secret, 'listeners': stream['listeners'] if stream != None else {}, 'down': False}
+                self.__logger.info('Opened private stream')
+            with self.__lock:
+                stream['listeners'][token] = (callback, on_reconnect)
+                self.__streams[api] = stream
+        self.__start_watchdog()
+        return token
+
+    # Explicit close of one subscription: the socket is closed with the last one
+    def release(self, api, token):
+        with self.__key_lock(api):
+            with self.__lock:
+                stream = self.__streams.get(api)
+                if stream == None or stream['listeners'].pop(token, None) == None:
+                    return
+                if stream['listeners']:
+                    return
+                del self.__streams[api]
+            self.__close(stream['ws'])
+            self.__logger.info('Closed private stream')
+
+    def __start_watchdog(self):
+        with self.__lock:
+            if self.__watchdog != None and self.__watchdog.is_alive():
+                return
+            self.__stop.clear()
+            self.__watchdog = Thread(target=self.__watch, daemon=True, name='connectionManager')
+            self.__watchdog.start()
+
+    def __watch(self):
+        while not self.__stop.wait(self.__check_interval):
+            with self.__lock:
+                apis = list(self.__streams)
+            for api in apis:
+                self.check(api)
+
+    # Reconnecting the stream of the key if pybit gave up (its own reconnects are caught by __hook_reconnects)
+    def check(self, api):
+        with self.__key_lock(api):
+            with self.__lock:
+                stream = self.__streams.get(api)
+            if stream == None:
+                return
+            ws = stream['ws']
+            if ws.is_connected():
+                stream['down'] = False
+                return
+
+            stream['down'] = True
+            if ws.attempting_connection:
+                return # pybit переподключается сам, подписки восстановит он же
+            self.__logger.warning('Private stream is down, reconnecting')
+            self.__close(ws)
+            try:
+                stream['ws'] = self.__connect(api, stream['secret'])
+            except Exception as err:
+                print(err)
+                self.__logger.error(f'Cannot reconnect private stream: {err}')
+                return
+            self.reconnects += 1
+            stream['down'] = False
+            self.__on_reconnect(stream)
+
+    def __on_reconnect(self, stream):
+        with self.__lock:
+            listeners = list(stream['listeners'].values())
+        for _, on_reconnect in listeners:
+            if on_reconnect != None:
+                on_reconnect()
+
+    # Closing all streams (shutdown)
+    def close_all(self):
+        self.__stop.set()
+        with self.__lock:
+            streams, self.__streams = self.__streams, {}
+        for stream in streams.values():
+            self.__close(stream['ws'])
+
+    # Gauges for capacity planning
+    def stats(self):
+        with self.__lock:
+            streams = list(self.__streams.values())
+        return {
+            'streams': len(streams),
+            'open_sockets': sum(1 for stream in streams if stream['ws'].is_connected()),
+            'subscribers': sum(len(stream['listeners']) for stream in streams),
+            'ws_threads': sum(1 for stream in streams if getattr(stream['ws'], 'wst', None) and stream['ws'].wst.is_alive()),
+            'threads': active_count(),
+            'reconnects': self.reconnects
+        }
+
+connection_manager = ConnectionManager()
@@ -0,0 +1,20 @@
+import pybit.unified_trading as unified_trading
+from pybit.unified_trading import HTTP, WebSocket
+from config import config
+
+# Адреса Bybit для всех клиентов процесса. По умолчанию боевые,
+# BYBIT_REST_URL / BYBIT_WS_URL направляют их на другой сервер (mock_exchange)
+
+# pybit собирает адрес WebSocket из констант модуля внутри __init__, поэтому подменяем их один раз при импорте
+if config.BYBIT_WS_URL:
+    unified_trading.PRIVATE_WSS = config.BYBIT_WS_URL + '/v5/private'
+    unified_trading.PUBLIC_WSS = config.BYBIT_WS_URL + '/v5/public/{CHANNEL_TYPE}'
+
+def make_http(**kwargs):
+    http = HTTP(testnet=False, **kwargs)
+    if config.BYBIT_REST_URL:
+        http.endpoint = config.BYBIT_REST_URL
+    return http
+
+def make_websocket(channel_type, **kwargs):
+    return WebSocket(channel_type=channel_type, testnet=False, **kwargs)
@@ -0,0 +1,121 @@
+from threading import Thread, Lock, Event
+from time import time
+from logs.logger import get_logger
+from bybit.RateLimiter import public_session
+
+# Общий для всего процесса справочник параметров инструментов (шаги цены/объема, мин. объем, макс. плечо)
+class InstrumentsRegistry:
+    # retry_delay - first retry after a failed (or empty) load, doubled up to max_retry_delay
+    def __init__(self, ttl=3600, retry_delay=5, max_retry_delay=300, session=public_session):
+        self.__ttl = ttl
+        self.__retry_delay = retry_delay
+        self.__max_retry_delay = max_retry_delay
+        self.__failures = 0 # неудачных загрузок подряд
+        self.__session = session
+        self.__logger = get_logger('instruments')
+        self.__specs = {}
+        self.__lock = Lock()
+        self.__loaded_at = 0
+        self.__refresher = None
+        self.__start_lock = Lock()
+        self.__stop = Event()
+
+    @staticmethod
+    def __to_step(value):
+        value = float(value)
+        if value < 0.99:
+            return value
+        return int(value)
+
+    # Loading all linear USDT instruments in one paginated request
+    def refresh(self):
+        try:
+            specs = {}
+            cursor = ''
+            while True:
+                params = {'category': 'linear', 'limit': 1000}
+                if cursor:
+                    params['cursor'] = cursor
+                resp = self.__session.get_instruments_info(**params)['result']
+
+                for elem in resp['list']:
+                    if not 'USDT' in elem['symbol'] or 'USDC' in elem['symbol']:
+                        continue
+                    specs[elem['symbol']] = {
+                        'tickSize': self.__to_step(elem['priceFilter']['tickSize']),
+                        'qtyStep': self.__to_step(elem['lotSizeFilter']['qtyStep']),
+                        'minOrderQty': float(elem['lotSizeFilter']['minOrderQty']),
+                        'maxLeverage': float(elem['leverageFilter']['maxLeverage'])
+                    }
+
+                cursor = resp.get('nextPageCursor', '')
+                if not cursor:
+                    break
+
+            if not specs:
+                raise ValueError('Empty instruments list')
+
+            with self.__lock:
+                self.__specs = specs
+                self.__loaded_at = time()
+            self.__failures = 0
+
+            self.__logger.info(f'Successfully loaded {len(specs)} instruments')
+            return True
+
+        except Exception as err:
+            print(err)
+            self.__failures += 1
+            self.__logger.error('Cannot load instruments info')
+            return False
+
+    # TTL after a successful load, otherwise backoff: retry_delay, doubled, capped by max_retry_delay
+    def __next_delay(self):
+        if self.__failures == 0:
+            return self.__ttl
+        return min(self.__retry_delay * 2 ** (self.__failures - 1), self.__max_retry_delay)
+
+    def __refresh_loop(self):
+        while not self.__stop.wait(self.__next_delay()):
+            self.refresh()
+
+    # Starting background refresh by TTL, with retries while the load fails (first load is synchronous)
+    def start(self):
+        with self.__start_lock:
+            if self.__refresher != None:
+                return
+            self.refresh()
+            self.__stop.clear()
+            self.__refresher = Thread(target=self.__refresh_loop, daemon=True)
+            self.__refresher.start()
+
+    def stop(self):
+        self.__stop.set()
+        self.__refresher = None
+
+    # Getting instrument spec: {'tickSize', 'qtyStep', 'minOrderQty', 'maxLeverage'} or None
+    def get(self, symbol):
+        if self.__loaded_at == 0:
+            self.start()
+        with self.__lock:
+            return self.__specs.get(symbol)
+
+    def get_price_and_qty_steps(self, symbol):
+        spec = self.get(symbol)
+        if spec == None:
+            return None, None
+        return spec['tickSize'], spec['qtyStep']
+
+    def get_min_order_quantity(self, symbol):
+        spec = self.get(symbol)
+        if spec == None:
+            return None
+        return spec['minOrderQty']
+
+    def get_max_leverage(self, symbol):
+        spec = self.get(symbol)
+        if spec == None:
+            return None
+        return spec['maxLeverage']
+
+instruments_registry = InstrumentsRegistry()
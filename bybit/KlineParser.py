@@ -0,0 +1,40 @@
+from itertools import chain
+import numpy as np
+import pandas as pd
+
+KLINE_FIELDS = ['Time', 'Open', 'High', 'Low', 'Close', 'Volume', 'Turnover']
+
+# get_kline()['result']['list'] (строки, новые первыми) -> float64 массив (n, 7) по возрастанию времени.
+# Один проход: строки разворачиваются итератором и сразу парсятся в заранее выделенный массив (fromiter с count)
+def parse_klines(rows):
+    n = len(rows)
+    return np.fromiter(map(float, chain.from_iterable(reversed(rows))), dtype=np.float64,
+                       count=n * len(KLINE_FIELDS)).reshape(n, len(KLINE_FIELDS))
+
+
+# Parsed klines: array columns as views, DataFrame (like Bybit.klines()) only on demand
+class Klines:
+    def __init__(self, rows):
+        self.array = rows
+        self.__frame = None
+
+    @classmethod
+    def from_response(cls, rows):
+        return cls(parse_klines(rows))
+
+    def __len__(self):
+        return len(self.array)
+
+    @property
+    def time(self):
+        return self.array[:, 0].astype(np.int64)
+
+    # Column view by name: 'Open', 'Close', ...
+    def __getitem__(self, name):
+        return self.array[:, KLINE_FIELDS.index(name)]
+
+    def to_dataframe(self):
+        if self.__frame is None:
+            self.__frame = pd.DataFrame(self.array[:, 1:], columns=KLINE_FIELDS[1:],
+                                        index=pd.Index(self.time, name='Time'), copy=False)
+        return self.__frame
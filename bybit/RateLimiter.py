@@ -0,0 +1,309 @@
+import asyncio
+from bisect import insort
+from collections import deque
+from itertools import count
+from threading import Condition
+from time import time
+import numpy as np
+from requests.adapters import HTTPAdapter
+from pybit.exceptions import InvalidRequestError
+from logs.logger import get_logger
+from bybit.Endpoints import make_http
+
+# Планировщик запросов к Bybit с учетом лимитов: token bucket на (UID, группа эндпоинтов).
+# Лимиты Bybit считаются на UID и эндпоинт за секунду - UID здесь ключ API (у пользователя он один).
+# Корзины подстраиваются под заголовки X-Bapi-Limit / X-Bapi-Limit-Status / X-Bapi-Limit-Reset-Timestamp,
+# очередь одна на UID и упорядочена по приоритету: ордера и отмены раньше чтений, отчеты (PnL, комиссии) последними.
+# Запрос проходит, когда в его корзине есть токен и ни один более приоритетный запрос этого UID не может пройти сейчас -
+# запрос к пустой корзине не задерживает запросы к другим группам.
+
+PRIORITY_ORDER = 0
+PRIORITY_SETTINGS = 1
+PRIORITY_READ = 2
+PRIORITY_REPORT = 3
+
+# pybit HTTP method -> (endpoint group, priority)
+ENDPOINT_GROUPS = {
+    'place_order': ('order_create', PRIORITY_ORDER),
+    'place_batch_order': ('order_batch', PRIORITY_ORDER),
+    'cancel_order': ('order_cancel', PRIORITY_ORDER),
+    'cancel_all_orders': ('order_cancel_all', PRIORITY_ORDER),
+    'set_leverage': ('position_settings', PRIORITY_SETTINGS),
+    'switch_margin_mode': ('position_settings', PRIORITY_SETTINGS),
+    'get_positions': ('position_list', PRIORITY_READ),
+    'get_open_orders': ('order_realtime', PRIORITY_READ),
+    'get_wallet_balance': ('wallet_balance', PRIORITY_READ),
+    'get_transferable_amount': ('withdrawal', PRIORITY_READ),
+    'get_tickers': ('public', PRIORITY_READ),
+    'get_kline': ('public', PRIORITY_READ),
+    'get_instruments_info': ('public', PRIORITY_READ),
+    'get_server_time': ('public', PRIORITY_READ),
+    'get_closed_pnl': ('closed_pnl', PRIORITY_REPORT),
+    'get_fee_rates': ('fee_rate', PRIORITY_REPORT)
+}
+
+# Requests per second until Bybit reports the real limit in headers
+DEFAULT_LIMITS = {
+    'order_create': 10, 'order_batch': 10, 'order_cancel': 10, 'order_cancel_all': 10, 'position_settings': 10,
+    'position_list': 50, 'order_realtime': 50, 'wallet_balance': 50, 'withdrawal': 5, 'closed_pnl': 50, 'fee_rate': 5,
+    'public': 100 # IP лимит 600 запросов за 5 секунд
+}
+
+class TokenBucket:
+    def __init__(self, limit):
+        self.limit = limit
+        self.tokens = float(limit)
+        self.updated = time()
+        self.blocked_until = 0
+
+    # Seconds until a token is available (0 - now), without taking it
+    def wait(self):
+        now = time()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.limit)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.limit
+
+    # Takes a token. Returns 0 or seconds to wait before the next try
+    def take(self):
+        timeout = self.wait()
+        if timeout == 0:
+            self.tokens -= 1
+        return timeout
+
+    # Syncing with X-Bapi-* headers of the last response
+    def update(self, limit, remaining, reset_ms):
+        if limit:
+            self.limit = limit
+        if remaining != None:
+            self.tokens = min(self.tokens, remaining)
+            if remaining <= 0 and reset_ms:
+                self.blocked_until = max(self.blocked_until, reset_ms / 1000)
+
+
+# Request waiting for admission: a thread (waits on the limiter Condition) or a coroutine (awaits future)
+class Waiter:
+    def __init__(self, loop=None):
+        self.start = time()
+        self.admitted = False
+        self.loop = loop
+        self.future = loop.create_future() if loop != None else None
+
+    # Called under the limiter lock from any thread
+    def admit(self):
+        self.admitted = True
+        if self.future != None:
+            self.loop.call_soon_threadsafe(self.__resolve)
+
+    def __resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class RateLimiter:
+    def __init__(self, history=1000):
+        self.__logger = get_logger('rate_limiter')
+        self.__cond = Condition()
+        self.__buckets = {} # (uid, group) -> TokenBucket
+        self.__waiting = {} # uid -> отсортированный список (priority, seq, group, Waiter)
+        self.__groups = {} # uid -> {group: сколько запросов ждет}
+        self.__timers = {} # uid -> (время срабатывания, loop) таймера пополнения корзин для корутин
+        self.__seq = count()
+        self.__wait_times = deque(maxlen=history) # секунды ожидания последних запросов
+        self.__depth = 0
+        self.__max_depth = 0
+        self.rate_limited = 0 # сколько раз получили 10006
+
+    def __bucket(self, key):
+        bucket = self.__buckets.get(key)
+        if bucket == None:
+            bucket = self.__buckets[key] = TokenBucket(DEFAULT_LIMITS.get(key[1], 10))
+        return bucket
+
+    def __enqueue(self, uid, group, priority, waiter):
+        insort(self.__waiting.setdefault(uid, []), (priority, next(self.__seq), group, waiter))
+        groups = self.__groups.setdefault(uid, {})
+        groups[group] = groups.get(group, 0) + 1
+        self.__depth += 1
+        self.__max_depth = max(self.__max_depth, self.__depth)
+
+    def __forget(self, uid, group):
+        groups = self.__groups[uid]
+        groups[group] -= 1
+        if groups[group] == 0:
+            del groups[group]
+        self.__depth -= 1
+
+    def __remove(self, uid, waiter):
+        queue = self.__waiting[uid]
+        for i, entry in enumerate(queue):
+            if entry[3] is waiter:
+                del queue[i]
+                self.__forget(uid, entry[2])
+                return
+
+    # Admitting waiting requests of the UID in priority order: a request goes when its group's bucket has a token;
+    # a request to an empty bucket holds only the requests of its own group behind it.
+    # Called under the lock on every change (new request, headers, 10006, timeout). Returns seconds until a refill
+    def __dispatch(self, uid):
+        queue = self.__waiting.get(uid)
+        if not queue:
+            return None
+        blocked = set()
+        refill = None
+        admitted = []
+        groups = self.__groups[uid]
+        for entry in queue:
+            if len(blocked) == len(groups):
+                break # все группы ждут пополнения - дальше никто не пройдет
+            group = entry[2]
+            if group in blocked:
+                continue
+            timeout = self.__bucket((uid, group)).take()
+            if timeout == 0:
+                admitted.append(entry)
+            else:
+                blocked.add(group)
+                refill = timeout if refill == None else min(refill, timeout)
+        if admitted:
+            now = time()
+            for entry in admitted:
+                entry[3].admit()
+                self.__wait_times.append(now - entry[3].start)
+                self.__forget(uid, entry[2])
+            queue[:] = [entry for entry in queue if not entry[3].admitted]
+            self.__cond.notify_all() # потоки проверят свой флаг
+        if refill != None:
+            self.__schedule_refill(uid, queue, refill)
+        return refill
+
+    # One call_later per UID wakes coroutines when a bucket refills (threads wait on the Condition with a timeout)
+    def __schedule_refill(self, uid, queue, delay):
+        loop = next((entry[3].loop for entry in queue if entry[3].loop != None), None)
+        if loop == None or loop.is_closed():
+            return
+        due = time() + delay
+        timer = self.__timers.get(uid)
+        if timer != None and timer[0] <= due and not timer[1].is_closed():
+            return # раньше сработает уже заведенный таймер
+        self.__timers[uid] = (due, loop)
+        loop.call_soon_threadsafe(loop.call_later, delay, self.__refilled, uid, due)
+
+    def __refilled(self, uid, due):
+        with self.__cond:
+            if self.__timers.get(uid, (None,))[0] == due:
+                del self.__timers[uid]
+            self.__dispatch(uid)
+
+    # Blocks until the request may be sent: a token is available and no higher priority request of the UID can go now
+    def acquire(self, uid, group, priority=PRIORITY_READ):
+        waiter = Waiter()
+        with self.__cond:
+            self.__enqueue(uid, group, priority, waiter)
+            while True:
+                timeout = self.__dispatch(uid)
+                if waiter.admitted:
+                    return
+                self.__cond.wait(timeout)
+
+    # acquire() for coroutines: the same queue; the coroutine sleeps on a future until __dispatch admits it
+    async def acquire_async(self, uid, group, priority=PRIORITY_READ):
+        waiter = Waiter(asyncio.get_running_loop())
+        with self.__cond:
+            self.__enqueue(uid, group, priority, waiter)
+            self.__dispatch(uid)
+        try:
+            await waiter.future
+        finally:
+            with self.__cond:
+                if not waiter.admitted: # отмена корутины - уходим из очереди
+                    self.__remove(uid, waiter)
+                    self.__dispatch(uid)
+
+    def update(self, uid, group, headers):
+        if not headers:
+            return
+        try:
+            limit = int(headers['X-Bapi-Limit']) if 'X-Bapi-Limit' in headers else None
+            remaining = int(headers['X-Bapi-Limit-Status']) if 'X-Bapi-Limit-Status' in headers else None
+            reset_ms = int(headers['X-Bapi-Limit-Reset-Timestamp']) if 'X-Bapi-Limit-Reset-Timestamp' in headers else None
+        except ValueError:
+            return
+        with self.__cond:
+            self.__bucket((uid, group)).update(limit, remaining, reset_ms)
+            self.__dispatch(uid)
+
+    # 10006: the bucket is empty until the reset timestamp (or for a second if there is no header)
+    def on_rate_limited(self, uid, group, headers):
+        with self.__cond:
+            self.rate_limited += 1
+            bucket = self.__bucket((uid, group))
+            bucket.tokens = 0
+            reset_ms = (headers or {}).get('X-Bapi-Limit-Reset-Timestamp')
+            bucket.blocked_until = int(reset_ms) / 1000 if reset_ms else time() + 1
+            self.__dispatch(uid)
+        self.__logger.warning(f'Rate limit hit for {group}, waiting for reset')
+
+    def stats(self):
+        with self.__cond:
+            depth = {}
+            for uid, queue in self.__waiting.items():
+                for _, _, group, _ in queue:
+                    name = f'{uid}:{group}' if group != 'public' else group
+                    depth[name] = depth.get(name, 0) + 1
+            waits = np.array(self.__wait_times) * 1000
+            max_depth, self.__max_depth = self.__max_depth, sum(depth.values()) # новое окно начинается с текущей глубины
+        return {
+            'queue_depth': sum(depth.values()),
+            'max_queue_depth': max_depth, # с прошлого вызова stats()
+            'queues': depth,
+            'wait_ms': {'p50': float(np.percentile(waits, 50)), 'p95': float(np.percentile(waits, 95)),
+                        'max': float(waits.max())} if len(waits) else {'p50': 0.0, 'p95': 0.0, 'max': 0.0},
+            'rate_limited': self.rate_limited
+        }
+
+rate_limiter = RateLimiter()
+
+
+# pybit HTTP session proxy: every call goes through the limiter, 10006 is retried after the reset
+class RateLimitedSession:
+    def __init__(self, session, uid, limiter=rate_limiter, retries=3):
+        session.return_response_headers = True
+        session.retry_codes.discard(10006) # не спим внутри pybit - ждем в очереди лимитера
+        self.__session = session
+        self.__uid = uid
+        self.__limiter = limiter
+        self.__retries = retries
+
+    def __getattr__(self, name):
+        method = getattr(self.__session, name)
+        if not callable(method):
+            return method
+
+        group, priority = ENDPOINT_GROUPS.get(name, ('other', PRIORITY_READ))
+        uid = 'ip' if group == 'public' else self.__uid
+
+        def call(**kwargs):
+            for attempt in range(self.__retries + 1):
+                self.__limiter.acquire(uid, group, priority)
+                try:
+                    resp, _, headers = method(**kwargs)
+                except InvalidRequestError as err:
+                    if err.status_code != 10006 or attempt == self.__retries:
+                        raise
+                    self.__limiter.on_rate_limited(uid, group, err.resp_headers)
+                    continue
+                self.__limiter.update(uid, group, headers)
+                return resp
+        return call
+
+
+# Public HTTP client for the whole process (market data, instruments, server time): one keep-alive connection pool
+# and the shared 'ip' buckets instead of an HTTP session per component
+def make_public_session(pool_size=32):
+    http = make_http()
+    http.client.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    return RateLimitedSession(http, uid='ip')
+
+public_session = make_public_session()
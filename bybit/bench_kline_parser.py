@@ -0,0 +1,42 @@
+import timeit
+import numpy as np
+import pandas as pd
+from bybit.KlineParser import KLINE_FIELDS, Klines, parse_klines
+
+# Micro-benchmark: старый разбор get_kline (DataFrame строк) против parse_klines.
+# python -m bybit.bench_kline_parser
+# Замер на 1000 свечей: parse_klines ~1.35-1.8x быстрее старого пути, вместе с DataFrame ~1.2-1.35x
+# (разбор строк во float занимает большую часть времени в обоих путях)
+
+def make_response(n=1000, seed=1):
+    rng = np.random.default_rng(seed)
+    close = 600 + np.cumsum(rng.normal(0, 1, n))
+    rows = [[str(1_700_000_000_000 + i * 60_000), f'{c:.2f}', f'{c + 1:.2f}', f'{c - 1:.2f}', f'{c:.2f}',
+             f'{v:.3f}', f'{v * c:.4f}'] for i, (c, v) in enumerate(zip(close, rng.exponential(100, n)))]
+    return rows[::-1] # Bybit отдает новые свечи первыми
+
+# Bybit.klines до KlineParser
+def pandas_path(resp):
+    resp = pd.DataFrame(resp)
+    resp.columns = KLINE_FIELDS
+    resp = resp.set_index('Time')
+    resp = resp.astype(float)
+    return resp[::-1]
+
+def bench(name, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f'{name:<28}{seconds * 1e6:>10.1f} us')
+    return seconds
+
+if __name__ == '__main__':
+    resp = make_response()
+    old = pandas_path(resp)
+    new = Klines.from_response(resp).to_dataframe()
+    assert np.array_equal(old.to_numpy(), new.to_numpy()) and np.array_equal(old.index.astype(np.int64), new.index)
+
+    print(f'{len(resp)} klines per response')
+    base = bench('pandas (old)', lambda: pandas_path(resp), 200)
+    for name, func in [('parse_klines', lambda: parse_klines(resp)),
+                       ('parse_klines + DataFrame', lambda: Klines.from_response(resp).to_dataframe())]:
+        seconds = bench(name, func, 200)
+        print(f'{"":<28}{base / seconds:>10.2f}x')
@@ -0,0 +1,100 @@
+from time import time
+from bybit.AccountState import AccountState
+
+# Сообщения приватных топиков в формате Bybit v5 (лишние поля убраны)
+ORDER_NEW = {'topic': 'order', 'creationTime': 1717000000000, 'data': [
+    {'category': 'linear', 'symbol': 'BTCUSDT', 'orderId': 'o-1', 'side': 'Buy', 'orderType': 'Limit', 'price': '60000',
+     'qty': '0.01', 'orderStatus': 'New', 'avgPrice': '', 'cumExecQty': '0', 'cumExecValue': '0', 'rejectReason': 'EC_NoError'},
+    {'category': 'spot', 'symbol': 'BTCUSDT', 'orderId': 's-1', 'side': 'Buy', 'orderType': 'Limit', 'price': '60000',
+     'qty': '0.01', 'orderStatus': 'New', 'avgPrice': '', 'cumExecQty': '0', 'cumExecValue': '0', 'rejectReason': 'EC_NoError'}]}
+ORDER_FILLED = {'topic': 'order', 'creationTime': 1717000001000, 'data': [
+    {'category': 'linear', 'symbol': 'BTCUSDT', 'orderId': 'o-1', 'side': 'Buy', 'orderType': 'Limit', 'price': '60000',
+     'qty': '0.01', 'orderStatus': 'Filled', 'avgPrice': '60000', 'cumExecQty': '0.01', 'cumExecValue': '600', 'rejectReason': 'EC_NoError'}]}
+EXECUTION = {'topic': 'execution', 'creationTime': 1717000001000, 'data': [
+    {'category': 'linear', 'symbol': 'BTCUSDT', 'orderId': 'o-1', 'execId': 'e-1', 'side': 'Buy', 'execPrice': '60000',
+     'execQty': '0.01', 'execFee': '0.33', 'execType': 'Trade'}]}
+POSITION_OPEN = {'topic': 'position', 'creationTime': 1717000001000, 'data': [
+    {'category': 'linear', 'symbol': 'BTCUSDT', 'side': 'Buy', 'size': '0.01', 'entryPrice': '60000', 'leverage': '5',
+     'tradeMode': 1, 'positionValue': '600', 'unrealisedPnl': '0'}]}
+POSITION_CLOSED = {'topic': 'position', 'creationTime': 1717000002000, 'data': [
+    {'category': 'linear', 'symbol': 'BTCUSDT', 'side': '', 'size': '0', 'entryPrice': '0', 'leverage': '10',
+     'tradeMode': 0, 'positionValue': '0', 'unrealisedPnl': '0'}]}
+WALLET = {'topic': 'wallet', 'creationTime': 1717000001000, 'data': [
+    {'accountType': 'UNIFIED', 'coin': [
+        {'coin': 'BTC', 'walletBalance': '0.1', 'availableToWithdraw': '0.1'},
+        {'coin': 'USDT', 'walletBalance': '1000.5', 'availableToWithdraw': '400.25'}]}]}
+WALLET_NO_AVAILABLE = {'topic': 'wallet', 'creationTime': 1717000002000, 'data': [
+    {'accountType': 'UNIFIED', 'coin': [{'coin': 'USDT', 'walletBalance': '999.5', 'availableToWithdraw': ''}]}]}
+
+# REST загрузчик доступного баланса (как Bybit.get_availableWithdrawal_balance): считает вызовы
+class FakeLoader:
+    def __init__(self, value):
+        self.calls = 0
+        self.__value = value
+
+    def __call__(self):
+        self.calls += 1
+        return self.__value
+
+def test_stream_messages_update_the_mirror():
+    account = AccountState()
+    account.on_order(ORDER_NEW)
+    assert [order['orderId'] for order in account.get_open_orders()] == ['o-1'] # spot не учитывается
+    account.on_order(ORDER_FILLED)
+    account.on_execution(EXECUTION)
+    account.on_position(POSITION_OPEN)
+    assert account.get_open_orders() == []
+    assert account.get_positions() == {'BTCUSDT': {'side': 'Buy', 'entryPrice': 60000.0, 'size': 0.01}}
+    assert account.get_leverage('BTCUSDT') == 5.0 and account.get_trade_mode('BTCUSDT') == 1
+    assert [execution['execId'] for execution in account.executions] == ['e-1']
+
+    account.on_position(POSITION_CLOSED)
+    assert account.get_positions() == {}
+    assert account.get_leverage('BTCUSDT') == 10.0 and account.get_trade_mode('BTCUSDT') == 0 # и для закрытой позиции
+
+def test_reconcile_replaces_state_and_resets_staleness():
+    account = AccountState(reconcile_interval=60)
+    assert account.is_stale() # еще не сверялись с REST
+    account.on_order(ORDER_NEW)
+    account.on_position(POSITION_OPEN)
+
+    positions = {'ETHUSDT': {'side': 'Sell', 'entryPrice': 3000.0, 'size': 1.0, 'leverage': '3', 'tradeMode': 0}}
+    orders = [{'orderId': 'o-2', 'symbol': 'ETHUSDT', 'orderStatus': 'Untriggered'}]
+    account.reconcile(positions, orders, 1200.0)
+    assert not account.is_stale()
+    assert list(account.get_positions()) == ['ETHUSDT']
+    assert [order['orderId'] for order in account.get_open_orders()] == ['o-2']
+    assert account.get_open_orders('BTCUSDT') == []
+    assert account.get_balance() == 1200.0
+    assert account.get_leverage('ETHUSDT') == 3.0 and account.get_trade_mode('ETHUSDT') == 0
+
+    account.synced_at = time() - 61
+    assert account.is_stale()
+    account.reconcile(positions, orders, 1200.0)
+    account.invalidate() # переподключение стрима - сообщения могли потеряться
+    assert account.is_stale()
+
+def test_available_balance_falls_back_to_rest_loader():
+    loader = FakeLoader(350.0)
+    account = AccountState(available_loader=loader)
+    account.on_wallet(WALLET)
+    assert account.get_balance() == 1000.5
+    assert account.get_available_balance() == 400.25
+    assert loader.calls == 0
+
+    account.on_wallet(WALLET_NO_AVAILABLE) # availableToWithdraw пустой - один запрос REST
+    assert account.get_balance() == 999.5
+    assert account.get_available_balance() == 350.0
+    assert account.get_available_balance() == 350.0
+    assert loader.calls == 1
+
+    account.on_execution(EXECUTION) # после исполнения доступный баланс устарел
+    assert account.get_available_balance() == 350.0
+    assert loader.calls == 2
+
+def test_saved_requests_are_counted_per_window():
+    account = AccountState()
+    for _ in range(3):
+        account.count_saved_request()
+    assert account.take_saved_requests() == 3
+    assert account.take_saved_requests() == 0 # счетчик за тик
@@ -0,0 +1,69 @@
+import asyncio
+import datetime as dt
+import numpy as np
+from aiohttp.test_utils import TestServer
+from bybit.AsyncBybitHelper import AsyncBybit, close_shared_session
+from bybit.BybitHelper import order_params
+from bybit.RateLimiter import RateLimiter
+from market_data.KlineDownloader import to_ms, PAGE_LIMIT
+from mock_exchange.Server import MockExchange, user_keys
+
+# Один цикл работы клиента против mock_exchange в своем event loop
+async def session_round(close=True):
+    server = TestServer(MockExchange(users=2, seed=7).app())
+    await server.start_server()
+    limiter = RateLimiter()
+    try:
+        client = AsyncBybit(*user_keys(0), base_url=f'http://{server.host}:{server.port}', limiter=limiter)
+        balance, klines, placed = await asyncio.gather(
+            client.get_balance(), client.klines('BTCUSDT', '1', limit=50),
+            client.place_batch_order([order_params('BTCUSDT', 'Buy', 0.01)]))
+        positions = await client.get_positions()
+    finally:
+        if close:
+            await close_shared_session()
+        await server.close()
+    return balance, klines, placed, positions, limiter
+
+def test_client_against_mock_exchange_in_two_loops():
+    for close in (False, True): # сессия первого loop не закрыта - второй asyncio.run должен получить свою
+        balance, klines, placed, positions, limiter = asyncio.run(session_round(close))
+        assert balance > 0
+        assert len(klines) == 50
+        assert placed[0]['code'] == 0 and placed[0]['orderId']
+        assert positions['BTCUSDT']['side'] == 'Buy'
+        assert limiter.stats()['wait_ms']['max'] < 1000
+
+def test_rate_limited_requests_are_retried():
+    async def hammer():
+        server = TestServer(MockExchange(users=2, rate_limit_rate=0.3, seed=3).app())
+        await server.start_server()
+        limiter = RateLimiter()
+        try:
+            client = AsyncBybit(*user_keys(1), base_url=f'http://{server.host}:{server.port}', limiter=limiter, retries=10)
+            balances = await asyncio.gather(*(client.get_balance() for _ in range(10)))
+        finally:
+            await close_shared_session()
+            await server.close()
+        return balances, limiter
+
+    balances, limiter = asyncio.run(hammer())
+    assert all(balance != None for balance in balances)
+    assert limiter.rate_limited > 0
+
+def test_klines_from_start_date_are_paged():
+    async def history():
+        server = TestServer(MockExchange(users=1, seed=5).app())
+        await server.start_server()
+        try:
+            client = AsyncBybit(*user_keys(0), base_url=f'http://{server.host}:{server.port}', limiter=RateLimiter())
+            start = (dt.date.today() - dt.timedelta(days=2)).strftime('%Y-%m-%d')
+            return start, await client.klines('BTCUSDT', '1', start_date=start)
+        finally:
+            await close_shared_session()
+            await server.close()
+
+    start, klines = asyncio.run(history())
+    times = klines.index.to_numpy()
+    assert len(klines) > 2 * PAGE_LIMIT # один запрос вернул бы не больше 1000 свечей
+    assert times[0] == to_ms(start) and (np.diff(times) == 60_000).all()
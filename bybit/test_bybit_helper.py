@@ -0,0 +1,19 @@
+from bybit.BybitHelper import fit_qty, reversal_legs
+
+RULES = (0.01, 0.05) # шаг qty, минимальный ордер
+
+def test_fit_qty_rounds_down_and_rejects_small_orders():
+    assert fit_qty(0.129, RULES) == 0.12
+    assert fit_qty(0.049, RULES) == None
+
+def test_market_reversal_is_one_net_order():
+    close_qty, open_qty, legs = reversal_legs('BTCUSDT', 'Sell', 0.29, 0.1, RULES)
+    assert (close_qty, open_qty) == (0.29, 0.1)
+    assert [(leg['side'], leg['qty'], leg['orderType']) for leg in legs] == [('Sell', '0.39', 'Market')]
+
+def test_stop_reversal_has_close_and_open_legs():
+    _, _, legs = reversal_legs('BTCUSDT', 'Buy', 0.2, 0.3, RULES, price=100)
+    assert [(leg['qty'], leg['orderType'], leg['price']) for leg in legs] == [('0.2', 'Limit', '100'), ('0.3', 'Limit', '100')]
+    _, open_qty, legs = reversal_legs('BTCUSDT', 'Buy', 0.2, 0.01, RULES, price=100) # маленький новый объем - только закрытие
+    assert open_qty == 0 and len(legs) == 1
+    assert reversal_legs('BTCUSDT', 'Buy', 0.01, 0.3, RULES) == None
@@ -0,0 +1,81 @@
+from threading import Event
+from bybit import ConnectionManager as connection_manager_module
+from bybit.ConnectionManager import ConnectionManager, PRIVATE_TOPICS
+
+# Сокет с интерфейсом pybit WebSocket: подключен сразу после создания, reconnect() - как свое переподключение pybit
+class FakeWebSocket:
+    created = []
+
+    def __init__(self, channel_type, **kwargs):
+        self.callbacks = {}
+        self.connected = True
+        self.exited = False
+        self.attempting_connection = False
+        FakeWebSocket.created.append(self)
+
+    def __getattr__(self, name):
+        if name.endswith('_stream'):
+            return lambda callback: self.callbacks.__setitem__(name[:-len('_stream')], callback)
+        raise AttributeError(name)
+
+    def _on_open(self):
+        pass
+
+    def is_connected(self):
+        return self.connected
+
+    def exit(self):
+        self.exited = True
+        self.connected = False
+
+    def reconnect(self):
+        self.connected = False
+        self.attempting_connection = True
+        self._on_open() # новый сокет открыт, pybit еще авторизуется и переподписывается
+        self.connected = True
+        self.attempting_connection = False
+
+def make_manager(monkeypatch):
+    FakeWebSocket.created = []
+    monkeypatch.setattr(connection_manager_module, 'make_websocket', FakeWebSocket)
+    return ConnectionManager(check_interval=3600)
+
+def test_socket_is_shared_and_closed_by_last_release(monkeypatch):
+    manager = make_manager(monkeypatch)
+    first, second = [], []
+    token1 = manager.acquire('key', 'secret', first.append)
+    token2 = manager.acquire('key', 'secret', second.append)
+    assert len(FakeWebSocket.created) == 1
+    ws = FakeWebSocket.created[0]
+    assert sorted(ws.callbacks) == sorted(PRIVATE_TOPICS)
+
+    ws.callbacks['order']({'topic': 'order'})
+    assert first == second == [{'topic': 'order'}]
+
+    manager.release('key', token1)
+    assert not ws.exited and manager.stats()['open_sockets'] == 1
+    manager.release('key', token2)
+    assert ws.exited and manager.stats()['streams'] == 0
+    manager.close_all()
+
+def test_pybit_reconnect_notifies_listeners(monkeypatch):
+    manager = make_manager(monkeypatch)
+    reconnected = Event()
+    token = manager.acquire('key', 'secret', lambda message: None, on_reconnect=reconnected.set)
+    FakeWebSocket.created[0].reconnect()
+    assert reconnected.wait(2)
+    assert manager.stats()['reconnects'] == 1
+    assert len(FakeWebSocket.created) == 1 # сокет переподключил pybit, менеджер его не пересоздавал
+
+    manager.release('key', token)
+    manager.close_all()
+
+def test_dead_socket_is_recreated_by_check(monkeypatch):
+    manager = make_manager(monkeypatch)
+    reconnected = Event()
+    manager.acquire('key', 'secret', lambda message: None, on_reconnect=reconnected.set)
+    FakeWebSocket.created[0].exit() # pybit сдался
+    manager.check('key')
+    assert reconnected.is_set()
+    assert len(FakeWebSocket.created) == 2 and manager.stats()['open_sockets'] == 1
+    manager.close_all()
@@ -0,0 +1,37 @@
+from time import time, sleep
+from bybit.InstrumentsRegistry import InstrumentsRegistry
+
+INSTRUMENT = {'symbol': 'BTCUSDT', 'priceFilter': {'tickSize': '0.10'},
+              'lotSizeFilter': {'qtyStep': '0.001', 'minOrderQty': '0.001'}, 'leverageFilter': {'maxLeverage': '100.00'}}
+
+# get_instruments_info как у pybit: первые failures вызовов падают, время вызовов запоминается
+class FakeSession:
+    def __init__(self, failures):
+        self.calls = []
+        self.__failures = failures
+
+    def get_instruments_info(self, **params):
+        self.calls.append(time())
+        if len(self.calls) <= self.__failures:
+            raise ConnectionError('Connection reset by peer')
+        return {'result': {'list': [INSTRUMENT], 'nextPageCursor': ''}}
+
+def wait_for(condition, timeout=3):
+    deadline = time() + timeout
+    while not condition():
+        assert time() < deadline
+        sleep(0.01)
+
+def test_failed_first_load_is_retried_with_backoff():
+    session = FakeSession(failures=3)
+    registry = InstrumentsRegistry(ttl=60, retry_delay=0.1, max_retry_delay=0.15, session=session)
+    try:
+        assert registry.get_max_leverage('BTCUSDT') == None # первая загрузка не удалась
+        wait_for(lambda: registry.get_max_leverage('BTCUSDT') != None)
+        assert registry.get_max_leverage('BTCUSDT') == 100.0
+        delays = [b - a for a, b in zip(session.calls, session.calls[1:])]
+        assert 0.1 <= delays[0] < 0.15 and delays[1] >= 0.15 and delays[2] >= 0.15 # удвоение с потолком
+        sleep(0.3)
+        assert len(session.calls) == 4 # после успешной загрузки - только по TTL
+    finally:
+        registry.stop()
@@ -0,0 +1,93 @@
+import asyncio
+from threading import Thread
+from time import time, sleep, process_time
+import pytest
+from bybit import RateLimiter as rate_limiter_module
+from bybit.RateLimiter import RateLimiter, PRIORITY_ORDER, PRIORITY_REPORT
+
+def start_acquire(limiter, uid, group, priority):
+    thread = Thread(target=limiter.acquire, args=(uid, group, priority), daemon=True)
+    thread.start()
+    return thread
+
+def wait_depth(limiter, depth, timeout=2):
+    deadline = time() + timeout
+    while limiter.stats()['queue_depth'] < depth:
+        assert time() < deadline
+        sleep(0.005)
+
+@pytest.fixture
+def admitted(monkeypatch):
+    # лимиты корзин, из которых выдан токен, в порядке выдачи (order_create - 10, closed_pnl - 50)
+    admitted = []
+    take = rate_limiter_module.TokenBucket.take
+    def recording_take(bucket):
+        timeout = take(bucket)
+        if timeout == 0:
+            admitted.append(bucket.limit)
+        return timeout
+    monkeypatch.setattr(rate_limiter_module.TokenBucket, 'take', recording_take)
+    return admitted
+
+def test_order_goes_before_report_of_same_uid(admitted):
+    limiter = RateLimiter()
+    reset = {'X-Bapi-Limit-Reset-Timestamp': str(int((time() + 0.2) * 1000))}
+    limiter.on_rate_limited('key', 'closed_pnl', reset)
+    limiter.on_rate_limited('key', 'order_create', reset)
+
+    report = start_acquire(limiter, 'key', 'closed_pnl', PRIORITY_REPORT) # встал в очередь первым
+    wait_depth(limiter, 1)
+    order = start_acquire(limiter, 'key', 'order_create', PRIORITY_ORDER)
+    wait_depth(limiter, 2)
+    assert limiter.stats()['queues'] == {'key:closed_pnl': 1, 'key:order_create': 1}
+
+    report.join(2)
+    order.join(2)
+    assert admitted == [10, 50]
+    assert limiter.stats()['queue_depth'] == 0
+
+def test_empty_bucket_does_not_hold_other_groups(admitted):
+    limiter = RateLimiter()
+    limiter.on_rate_limited('key', 'order_create', {'X-Bapi-Limit-Reset-Timestamp': str(int((time() + 1) * 1000))})
+    order = start_acquire(limiter, 'key', 'order_create', PRIORITY_ORDER)
+    wait_depth(limiter, 1)
+
+    started = time()
+    limiter.acquire('key', 'closed_pnl', PRIORITY_REPORT)
+    assert time() - started < 0.5
+    assert admitted == [50]
+    order.join(2)
+    assert admitted == [50, 10]
+
+def test_max_queue_depth_is_max_since_last_stats():
+    limiter = RateLimiter()
+    limiter.on_rate_limited('key', 'order_create', {'X-Bapi-Limit-Reset-Timestamp': str(int((time() + 0.3) * 1000))})
+    threads = [start_acquire(limiter, 'key', 'order_create', PRIORITY_ORDER) for _ in range(2)]
+    wait_depth(limiter, 2)
+    assert limiter.stats()['max_queue_depth'] == 2
+    assert limiter.stats()['max_queue_depth'] == 2 # очередь та же - максимум окна равен текущей глубине
+    for thread in threads:
+        thread.join(2)
+    assert limiter.stats()['max_queue_depth'] == 2
+    assert limiter.stats()['max_queue_depth'] == 0
+
+def test_hundreds_of_coroutines_are_admitted_in_priority_order():
+    async def run():
+        limiter = RateLimiter()
+        limiter.update('key', 'order_create', {'X-Bapi-Limit': '2000'})
+        limiter.on_rate_limited('key', 'order_create', {'X-Bapi-Limit-Reset-Timestamp': str(int((time() + 0.5) * 1000))})
+        admitted = []
+
+        async def request(i, priority):
+            await limiter.acquire_async('key', 'order_create', priority)
+            admitted.append((priority, i))
+
+        priorities = [(i * 7) % 4 for i in range(300)]
+        cpu = process_time()
+        await asyncio.gather(*(request(i, priority) for i, priority in enumerate(priorities)))
+        return admitted, sorted(admitted), process_time() - cpu, limiter.stats()
+
+    admitted, expected, cpu, stats = asyncio.run(run())
+    assert admitted == expected # сначала по приоритету, внутри приоритета - в порядке прихода
+    assert stats['queue_depth'] == 0 and stats['max_queue_depth'] == 300
+    assert cpu < 0.1 # 0.5 с блокировки корзины корутины спят на future, а не опрашивают очередь
@@ -13,5 +13,18 @@ class Config:
     AVAILABLE_TICKERS = ['BNBUSDT']
     AVAILABLE_TIMEFRAMES = ['1 мин', '1 час']
 
+    # Strategies execution
+    STRATEGY_WORKERS = int(os.getenv('STRATEGY_WORKERS', 16)) # сколько стратегий выполняются одновременно
+    TICK_DEADLINE = float(os.getenv('TICK_DEADLINE', 5)) # секунд после закрытия свечи, за которые должен пройти тик
+
+    # Bybit endpoints (empty - real Bybit), e.g. http://127.0.0.1:8080 and ws://127.0.0.1:8080 for mock_exchange
+    BYBIT_REST_URL = os.getenv('BYBIT_REST_URL', '')
+    BYBIT_WS_URL = os.getenv('BYBIT_WS_URL', '')
+
+    # Market data
+    CANDLE_STORE_DIR = os.getenv('CANDLE_STORE_DIR', 'data/candles') # локальное хранилище истории свечей
+    # Префикс сегментов общей памяти со свечами (market_data/SharedCandles). Пусто - каждый процесс держит свой KlineStream
+    SHARED_CANDLES = os.getenv('SHARED_CANDLES', '')
+
 # Экспорт конфигурации
 config = Config()
\ No newline at end of file
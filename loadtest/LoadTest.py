@@ -0,0 +1,250 @@
+import argparse
+import json
+import resource
+from threading import Lock, active_count
+from time import time, process_time
+import numpy as np
+import requests
+from sqlalchemy import create_engine
+from logs.logger import get_logger
+from config import config
+from global_strategies import active_strategies
+from db.database import SessionLocal
+from db.models import Base
+from db.session import DBSessionManager
+from db.crud import create_user, create_trade_with_strategy, get_user_strategies, delete_user
+from strategies.Strategy import Strategy
+from strategies.Scheduler import StrategyScheduler, CandleCloseTimer
+from telegram.Notifier import Notifier, PRIORITY_TRADE
+from bybit.InstrumentsRegistry import instruments_registry
+from bybit.ClockSync import clock_sync
+from bybit.RateLimiter import rate_limiter
+from bybit.ConnectionManager import connection_manager
+from market_data.MarketDataHub import market_data_hub
+from mock_exchange.Server import user_keys
+
+# Нагрузочный тест робота: N синтетических пользователей заводятся через CRUD (как из Telegram),
+# их стратегии крутятся тем же циклом, что и в main.py (CandleCloseTimer + StrategyScheduler), против mock_exchange.
+# Пользователи добавляются ступенями; на каждой ступени - задержка окончания тика и прихода ордеров на биржу
+# относительно закрытия свечи (p50/p95/p99), CPU и память на пользователя. Точка насыщения - первая ступень,
+# на которой p99 окончания тика вышел за SLO или часть стратегий не уложилась в окно TICK_DEADLINE.
+#
+# python -m mock_exchange.Server --users 1000
+# BYBIT_REST_URL=http://127.0.0.1:8080 BYBIT_WS_URL=ws://127.0.0.1:8080 \
+#     python -m loadtest.LoadTest --users 10,50,100,200,500 --ticks 3 --db-url sqlite:///data/loadtest.db
+
+TELEGRAM_ID_BASE = 2_000_000_000 # синтетические telegram_id, не пересекаются с настоящими
+
+def percentiles(values):
+    if len(values) == 0:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    return {f'p{q}': float(np.percentile(values, q)) for q in (50, 95, 99)}
+
+# Current RSS of the process in MB (peak RSS where /proc is not available)
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Telegram stand-in: notifications go through the real Notifier queue and are only counted
+class SinkBot:
+    def __init__(self):
+        self.__lock = Lock()
+        self.delivered = 0
+        self.stopped = 0
+        self.notifier = Notifier(self.__deliver)
+
+    def __deliver(self, chat_id, text, priority):
+        with self.__lock:
+            self.delivered += 1
+
+    def notify(self, chat_id, text, priority=PRIORITY_TRADE):
+        return self.notifier.notify(chat_id, text, priority)
+
+    def stop_bot(self, message):
+        user_id = message.chat.id
+        if user_id in active_strategies:
+            active_strategies.pop(user_id).close()
+        with self.__lock:
+            self.stopped += 1
+
+
+class LoadTest:
+    def __init__(self, symbols, timeframe='1', leverage=1, depo_procent=10.0, workers=config.STRATEGY_WORKERS,
+                 slo_ms=config.TICK_DEADLINE * 1000):
+        self.__logger = get_logger('loadtest')
+        self.symbols = symbols
+        self.timeframe = timeframe
+        self.leverage = leverage
+        self.depo_procent = depo_procent
+        self.slo_ms = slo_ms
+        self.bot = SinkBot()
+        self.scheduler = StrategyScheduler(max_workers=workers)
+        self.timer = CandleCloseTimer()
+        self.users = [] # telegram_id синтетических пользователей
+        self.baseline_rss = None
+
+    # Registering users [len(self.users), count) through CRUD and starting their strategies
+    def add_users(self, count):
+        for i in range(len(self.users), count):
+            telegram_id = TELEGRAM_ID_BASE + i
+            api, secret = user_keys(i)
+            with DBSessionManager() as db:
+                if create_user(db, telegram_id, api, secret) == None:
+                    raise RuntimeError(f'Cannot create user {telegram_id}')
+                create_trade_with_strategy(db, telegram_id, coin_name=self.symbols[i % len(self.symbols)],
+                                           leverage=self.leverage, timeframe=self.timeframe, depo_procent=self.depo_procent)
+                strategy_id = get_user_strategies(db, telegram_id)[0]['id']
+            self.users.append(telegram_id)
+            active_strategies[telegram_id] = Strategy(self.bot, telegram_id, strategy_id)
+
+    # Arrival times at the exchange of orders sent since close_ms
+    @staticmethod
+    def __order_times(close_ms):
+        response = requests.get(config.BYBIT_REST_URL + '/mock/orders', params={'since': int(close_ms)}, timeout=5)
+        return [ms for ms, _ in response.json()['list']]
+
+    # One iteration of the main.py loop on the close of the strategies' timeframe (minute closes of other candles
+    # run nothing and are skipped). Returns latencies (ms after candle close) of finished strategies and of orders
+    def tick(self):
+        groups = {}
+        while not groups:
+            close_ms = self.timer.wait_next_close()
+            groups = self.timer.closing_groups(list(active_strategies.items()), close_ms)
+        strategies = [item for group in groups.values() for item in group]
+        close_local = clock_sync.to_local(close_ms)
+        stats = self.scheduler.run_tick(strategies, deadline=close_local + config.TICK_DEADLINE)
+        finished = [(finish - close_local) * 1000 for finish in stats['finished']]
+        orders = [ms - close_ms for ms in self.__order_times(close_ms)]
+        return stats, finished, orders
+
+    # Measuring ticks with count users. warmup ticks (cold caches, snapshots) are not counted
+    def step(self, count, ticks, warmup=1):
+        started = time()
+        self.add_users(count)
+        self.__logger.info(f'{count} users registered in {round(time() - started, 1)} s')
+        for _ in range(warmup):
+            self.tick()
+
+        finished, orders, late, total = [], [], 0, 0
+        cpu = process_time()
+        wall = time()
+        for _ in range(ticks):
+            stats, tick_finished, tick_orders = self.tick()
+            finished += tick_finished
+            orders += tick_orders
+            late += stats['late']
+            total += stats['total']
+        cpu = process_time() - cpu
+        wall = time() - wall
+        rss = rss_mb() # после тиков: кэши, снимки свечей и очереди уже заполнены
+
+        result = {
+            'users': count,
+            'ticks': ticks,
+            'tick_latency_ms': percentiles(finished),
+            'order_latency_ms': percentiles(orders),
+            'orders': len(orders),
+            'late': late,
+            'strategies': total,
+            'cpu_ms_per_user_tick': cpu * 1000 / max(count * ticks, 1),
+            'cpu_load': cpu / wall, # доля одного ядра (тик таймфрейма 5 - это 5 минут, а не 1)
+            'rss_mb': rss,
+            'mb_per_user': (rss - self.baseline_rss) / count,
+            'threads': active_count(),
+            'open_sockets': connection_manager.stats()['open_sockets'],
+            'rate_limit_wait_p95_ms': rate_limiter.stats()['wait_ms']['p95'],
+            'notifications': self.bot.delivered,
+            'stopped': self.bot.stopped
+        }
+        result['within_slo'] = result['tick_latency_ms']['p99'] <= self.slo_ms and late == 0 and total > 0
+        self.__logger.info(f'Load step: {result}')
+        return result
+
+    # Ramp over user counts; stops at the first step outside SLO unless keep_going
+    def run(self, steps, ticks, warmup=1, keep_going=False):
+        instruments_registry.start()
+        clock_sync.start()
+        for symbol in self.symbols:
+            market_data_hub.get_candles(symbol, self.timeframe) # подписка на свечи до замера памяти
+        self.baseline_rss = rss_mb()
+
+        results = []
+        for count in steps:
+            result = self.step(count, ticks, warmup)
+            results.append(result)
+            print(format_step(result), flush=True)
+            if not result['within_slo'] and not keep_going:
+                break
+        return results
+
+    # Stopping strategies and deleting synthetic users
+    def cleanup(self, keep_users=False):
+        for telegram_id in self.users:
+            if telegram_id in active_strategies:
+                active_strategies.pop(telegram_id).close()
+        self.scheduler.shutdown()
+        connection_manager.close_all()
+        if keep_users:
+            return
+        with DBSessionManager() as db:
+            for telegram_id in self.users:
+                delete_user(db, telegram_id)
+
+
+def format_step(result):
+    tick, order = result['tick_latency_ms'], result['order_latency_ms']
+    return (f"{result['users']:>6} users | tick p50/p95/p99 {tick['p50']:.0f}/{tick['p95']:.0f}/{tick['p99']:.0f} ms"
+            f" | orders {result['orders']} p50/p95/p99 {order['p50']:.0f}/{order['p95']:.0f}/{order['p99']:.0f} ms"
+            f" | late {result['late']}/{result['strategies']} | CPU {result['cpu_ms_per_user_tick']:.1f} ms/user/tick"
+            f" ({result['cpu_load'] * 100:.0f}% core) | RSS {result['rss_mb']:.0f} MB ({result['mb_per_user']:.2f} MB/user)"
+            f" | threads {result['threads']} | {'OK' if result['within_slo'] else 'SLO MISSED'}")
+
+# Saturation point: last step within SLO and the first one outside it
+def saturation(results):
+    passed = [result['users'] for result in results if result['within_slo']]
+    failed = [result['users'] for result in results if not result['within_slo']]
+    return {'max_users_within_slo': max(passed) if passed else 0, 'saturated_at': min(failed) if failed else None}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Multi-user load test of the strategy loop against mock_exchange')
+    parser.add_argument('--users', default='10,50,100,200', help='comma-separated user counts of the ramp')
+    parser.add_argument('--ticks', type=int, default=3, help='measured candle closes per step')
+    parser.add_argument('--warmup', type=int, default=1, help='candle closes per step not counted')
+    parser.add_argument('--symbols', default=','.join(config.AVAILABLE_TICKERS))
+    parser.add_argument('--timeframe', default='1')
+    parser.add_argument('--leverage', type=int, default=1)
+    parser.add_argument('--depo-procent', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=config.STRATEGY_WORKERS)
+    parser.add_argument('--slo-ms', type=float, default=config.TICK_DEADLINE * 1000, help='max p99 of tick finish after candle close')
+    parser.add_argument('--db-url', default=None, help='database for synthetic users (default - the bot database)')
+    parser.add_argument('--keep-going', action='store_true', help='run all steps even after SLO is missed')
+    parser.add_argument('--keep-users', action='store_true', help='do not delete synthetic users at the end')
+    parser.add_argument('--json', default=None, help='file for the report')
+    args = parser.parse_args()
+
+    if not config.BYBIT_REST_URL or not config.BYBIT_WS_URL:
+        parser.error('BYBIT_REST_URL and BYBIT_WS_URL must point to mock_exchange - the load test places real orders')
+
+    if args.db_url != None:
+        engine = create_engine(args.db_url)
+        Base.metadata.create_all(engine)
+        SessionLocal.configure(bind=engine)
+
+    steps = sorted(int(count) for count in args.users.split(','))
+    test = LoadTest(args.symbols.split(','), args.timeframe, args.leverage, args.depo_procent, args.workers, args.slo_ms)
+    try:
+        results = test.run(steps, args.ticks, args.warmup, args.keep_going)
+    finally:
+        test.cleanup(args.keep_users)
+
+    report = {'steps': results, **saturation(results)}
+    print(f"Max users within SLO ({args.slo_ms:.0f} ms p99): {report['max_users_within_slo']}, "
+          f"saturated at: {report['saturated_at'] or 'not reached'}")
+    if args.json != None:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
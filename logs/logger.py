@@ -6,8 +6,10 @@ def get_logger(name):
                         format=log_format,
                         filename='logs/all_logs.log',
                         filemode='w')
-    console = logging.FileHandler('logs/all_logs.log')
-    console.setLevel(logging.INFO)
-    console.setFormatter(logging.Formatter(log_format))
-    logging.getLogger(name).addHandler(console)
-    return logging.getLogger(name)
+    logger = logging.getLogger(name)
+    if not logger.handlers: # один обработчик на имя, даже если клиентов тысячи
+        console = logging.FileHandler('logs/all_logs.log')
+        console.setLevel(logging.INFO)
+        console.setFormatter(logging.Formatter(log_format))
+        logger.addHandler(console)
+    return logger
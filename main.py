@@ -1,17 +1,38 @@
 # docker-compose up -d
 # PGADMIN - http://localhost:5050/
-from time import sleep
-import datetime as dt
 from logs.logger import get_logger
 from global_strategies import active_strategies
 from config import config
 from telegram.Bot import TelegramBot
 from threading import Thread
+from bybit.InstrumentsRegistry import instruments_registry
+from bybit.ClockSync import clock_sync
+from strategies.Scheduler import StrategyScheduler, CandleCloseTimer
+from market_data.MarketDataHub import market_data_hub
+from bybit.RateLimiter import rate_limiter
+from bybit.ConnectionManager import connection_manager
+from bybit.BybitHelper import timeframe_match
+from market_data.SharedCandles import CandlePublisher
 
 if __name__ == '__main__':
     logger = get_logger('main')
+
+    # Свечи в общей памяти пишет отдельный процесс market data (запускаем до остальных потоков - fork)
+    candle_publisher = None
+    if config.SHARED_CANDLES:
+        candle_publisher = CandlePublisher(config.SHARED_CANDLES, [(symbol, timeframe) for symbol in config.AVAILABLE_TICKERS
+                                                                   for timeframe in timeframe_match.values()])
+        candle_publisher.start()
+
     bot = TelegramBot(config.TELEGRAM_BOT_TOKEN)
 
+    # Загружаем параметры инструментов (дальше обновляются в фоне)
+    instruments_registry.start()
+
+    scheduler = StrategyScheduler(max_workers=config.STRATEGY_WORKERS)
+    timer = CandleCloseTimer()
+    clock_sync.start() # синхронизация часов с биржей, дальше - в фоне
+
     # Запускаем бота в отдельном потоке
     Thread(target=bot.run, daemon=True).start()
 
@@ -20,27 +41,43 @@ if __name__ == '__main__':
     stop = False
     while not stop:
         try:
-            # Ждем окончания минуты
-            current_time = dt.datetime.now()
-            if current_time.second < 59:
-                print(f'Waiting {59 - current_time.second} seconds')
-                logger.info(f'Waiting {59 - current_time.second} seconds')
-                sleep(59 - current_time.second)
-        
-            for strategy in active_strategies.values():
-                strategy.execute()
-            
-            # Если все проверили до конца timeframe - ждем
-            current_time = dt.datetime.now()
-            if current_time.second >= 59:
-                sleep(1)
-        
+            # Ждем закрытия свечи по времени биржи
+            close_ms = timer.wait_next_close()
+
+            # Запускаем только стратегии, у которых закрылась свеча их таймфрейма
+            groups = timer.closing_groups(list(active_strategies.items()), close_ms)
+            if not groups:
+                continue
+            for timeframe, strategies in groups.items():
+                logger.info(f'Candle {timeframe} closed: {len(strategies)} strategies')
+
+            strategies = [item for group in groups.values() for item in group]
+            scheduler.run_tick(strategies, deadline=clock_sync.to_local(close_ms) + config.TICK_DEADLINE)
+            logger.info(f'Market data hub hit ratio: {market_data_hub.stats()["hit_ratio"]:.2f}')
+            saved = sum(strategy.broker.account.take_saved_requests() for strategy in list(active_strategies.values()))
+            logger.info(f'Leverage/margin mode requests skipped by account cache: {saved}')
+            limits = rate_limiter.stats()
+            logger.info(f'Bybit requests: max queue {limits["max_queue_depth"]}, wait p95 {limits["wait_ms"]["p95"]:.0f} ms, '
+                        f'rate limited {limits["rate_limited"]}')
+            notifications = bot.notifier.stats()
+            logger.info(f'Notifications: queue {notifications["queue_depth"]} (max {notifications["max_queue_depth"]}), '
+                        f'latency p95 {notifications["latency_ms"]["p95"]:.0f} ms, dropped {notifications["dropped"]}')
+            delivery = bot.sender.stats()
+            logger.info('Telegram delivery p95: ' + ', '.join(f'{name} {latency["p95"]:.0f} ms' for name, latency in delivery['latency_ms'].items())
+                        + f', rate limited {delivery["retried"]}')
+            streams = connection_manager.stats()
+            logger.info(f'Private streams: {streams["open_sockets"]}/{streams["streams"]} open, {streams["subscribers"]} subscribers, '
+                        f'{streams["threads"]} threads, reconnects {streams["reconnects"]}')
+
         except Exception as err:
             print(err)
             logger.error(f'Something is wrong in main. Watch out the terminal')
             stop = True
             break
 
+    if candle_publisher != None:
+        candle_publisher.stop()
+
 # Создаем список из объектов Strategy (у каждого user_id и все введенные параметры)
 # Внутри try проходим по всем объектам (хочется асинхронно) и выполняем execute()
 # Внутри execute() initial_check (базовые проверки, которые сейчас в try)
@@ -0,0 +1,182 @@
+import os
+import shutil
+from threading import Lock
+import numpy as np
+import pandas as pd
+from logs.logger import get_logger
+from config import config
+from market_data.KlineStream import KLINE_COLUMNS, timeframe_ms
+
+# Локальное хранилище свечей по (symbol, timeframe): root/SYMBOL/TF/<версия>/<колонка>.bin.
+# Каждая колонка - отдельный файл фиксированной ширины (Time - int64, остальные - float64),
+# новые свечи дописываются в конец, чтение через np.memmap - срезы по времени без копирования.
+# Длина ряда - минимальная длина колонок: Time пишется последним, так что оборванная запись не видна.
+# merge() пишет все колонки в новую версию и переключает на нее файл CURRENT одним os.replace -
+# читатель видит либо старую версию целиком, либо новую, колонки разных версий не смешиваются.
+
+COLUMN_TYPES = {'Time': np.int64, **{name: np.float64 for name in KLINE_COLUMNS}}
+MANIFEST = 'CURRENT'
+
+class CandleStore:
+    def __init__(self, root='data/candles'):
+        self.__logger = get_logger('candle_store')
+        self.root = root
+        self.__lock = Lock()
+        self.__key_locks = {}
+
+    def __key_lock(self, symbol, timeframe):
+        with self.__lock:
+            return self.__key_locks.setdefault((symbol, str(timeframe)), Lock())
+
+    def __dir(self, symbol, timeframe):
+        return os.path.join(self.root, symbol, str(timeframe))
+
+    # Directory of the current version (the series directory itself for stores written before versions)
+    def __current(self, symbol, timeframe):
+        directory = self.__dir(symbol, timeframe)
+        try:
+            with open(os.path.join(directory, MANIFEST)) as file:
+                return os.path.join(directory, file.read().strip())
+        except FileNotFoundError:
+            return directory
+
+    @staticmethod
+    def __file(directory, column):
+        return os.path.join(directory, f'{column}.bin')
+
+    def __len(self, directory):
+        sizes = [os.path.getsize(path) // 8 if os.path.exists(path) else 0
+                 for path in (self.__file(directory, column) for column in COLUMN_TYPES)]
+        return min(sizes)
+
+    def __column(self, directory, column, length):
+        if length == 0:
+            return np.empty(0, dtype=COLUMN_TYPES[column])
+        return np.memmap(self.__file(directory, column), dtype=COLUMN_TYPES[column], mode='r', shape=(length,))
+
+    def __write(self, directory, rows):
+        os.makedirs(directory, exist_ok=True)
+        # Time последним - пока его нет, строки не считаются записанными
+        for i, column in list(enumerate(COLUMN_TYPES))[1:] + [(0, 'Time')]:
+            with open(self.__file(directory, column), 'ab') as file:
+                file.write(rows[:, i].astype(COLUMN_TYPES[column]).tobytes())
+
+    def __truncate(self, directory, length):
+        for column in COLUMN_TYPES:
+            path = self.__file(directory, column)
+            if os.path.exists(path) and os.path.getsize(path) > length * 8:
+                with open(path, 'r+b') as file:
+                    file.truncate(length * 8)
+
+    # Writing rows as a new version and switching CURRENT to it; older versions are removed
+    # (readers that still map them keep their data until they drop the memmaps)
+    def __switch(self, symbol, timeframe, rows):
+        directory = self.__dir(symbol, timeframe)
+        os.makedirs(directory, exist_ok=True)
+        versions = [name for name in os.listdir(directory) if name.startswith('v') and name[1:].isdigit()]
+        version = f'v{max((int(name[1:]) for name in versions), default=0) + 1}'
+        self.__write(os.path.join(directory, version), rows)
+        manifest = os.path.join(directory, MANIFEST)
+        with open(manifest + '.tmp', 'w') as file:
+            file.write(version)
+        os.replace(manifest + '.tmp', manifest)
+
+        for name in versions:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+        for column in COLUMN_TYPES: # колонки старого формата без версий
+            path = self.__file(directory, column)
+            if os.path.exists(path):
+                os.remove(path)
+
+    # Columns {'Time', 'Open', ...} as read-only memmaps, sliced to [start, end) by time
+    def read(self, symbol, timeframe, start=None, end=None):
+        while True:
+            directory = self.__current(symbol, timeframe)
+            try:
+                length = self.__len(directory)
+                columns = {column: self.__column(directory, column, length) for column in COLUMN_TYPES}
+            except FileNotFoundError:
+                continue # merge() переключил версию и удалил прочитанную - берем новую
+            if self.__current(symbol, timeframe) == directory: # версия не сменилась, пока открывали файлы
+                break
+        times = columns['Time']
+        first = 0 if start == None else int(np.searchsorted(times, start, side='left'))
+        last = length if end == None else int(np.searchsorted(times, end, side='left'))
+        return {column: values[first:last] for column, values in columns.items()}
+
+    # DataFrame like Bybit.klines() (copies the slice)
+    def read_dataframe(self, symbol, timeframe, start=None, end=None):
+        columns = self.read(symbol, timeframe, start, end)
+        return pd.DataFrame({name: columns[name] for name in KLINE_COLUMNS},
+                            index=pd.Index(np.array(columns['Time']), name='Time'))
+
+    def last_time(self, symbol, timeframe):
+        times = self.read(symbol, timeframe)['Time']
+        if len(times) == 0:
+            return None
+        return int(times[-1])
+
+    # Appending rows [Time, Open, High, Low, Close, Volume, Turnover] sorted by Time; older rows are ignored
+    # (use merge() for them). Returns the number of appended rows
+    def append(self, symbol, timeframe, rows):
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(COLUMN_TYPES))
+        with self.__key_lock(symbol, timeframe):
+            directory = self.__current(symbol, timeframe)
+            self.__truncate(directory, self.__len(directory)) # хвост от оборванной записи
+            last = self.last_time(symbol, timeframe)
+            if last != None:
+                rows = rows[rows[:, 0] > last]
+            if len(rows) == 0:
+                return 0
+
+            self.__warn_gap(symbol, timeframe, last, rows[0, 0])
+            self.__write(directory, rows)
+            return len(rows)
+
+    # Rows written after the last stored candle should continue it without a hole
+    def __warn_gap(self, symbol, timeframe, last, first):
+        step = timeframe_ms.get(str(timeframe))
+        if last != None and step != None and first - last > step:
+            self.__logger.warning(f'Gap in {symbol} {timeframe} candles: {last} -> {int(first)}')
+
+    # Inserting rows anywhere (backfill): merge by Time (new rows win) into a new version of the series
+    def merge(self, symbol, timeframe, rows):
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, len(COLUMN_TYPES))
+        if len(rows) == 0:
+            return 0
+        with self.__key_lock(symbol, timeframe):
+            directory = self.__current(symbol, timeframe)
+            self.__truncate(directory, self.__len(directory))
+            columns = self.read(symbol, timeframe)
+            # все строки новее последней свечи (rows не обязаны быть отсортированы) - дописываем в текущую версию
+            if len(columns['Time']) > 0 and rows[:, 0].min() > columns['Time'][-1]:
+                rows = rows[np.unique(rows[:, 0], return_index=True)[1]]
+                self.__warn_gap(symbol, timeframe, int(columns['Time'][-1]), rows[0, 0])
+                self.__write(directory, rows)
+                return len(rows)
+
+            old = np.column_stack([columns[column].astype(np.float64) for column in COLUMN_TYPES])
+            merged = np.concatenate([rows, old]) # np.unique оставляет первое вхождение - новые строки
+            merged = merged[np.unique(merged[:, 0], return_index=True)[1]]
+            del columns, old # закрываем memmap перед удалением старой версии
+            self.__switch(symbol, timeframe, merged)
+            self.__logger.info(f'Merged {len(rows)} candles into {symbol} {timeframe}, total {len(merged)}')
+            return len(rows)
+
+    # Missing ranges [from, to) inside the stored series
+    def gaps(self, symbol, timeframe):
+        step = timeframe_ms.get(str(timeframe))
+        times = self.read(symbol, timeframe)['Time']
+        if step == None or len(times) < 2:
+            return []
+        holes = np.flatnonzero(np.diff(times) > step)
+        return [(int(times[i]) + step, int(times[i + 1])) for i in holes]
+
+    # Filling gaps with fetch(symbol, timeframe, start, end) -> rows, e.g. KlineDownloader.download
+    def backfill(self, symbol, timeframe, fetch):
+        filled = 0
+        for start, end in self.gaps(symbol, timeframe):
+            filled += self.merge(symbol, timeframe, fetch(symbol, timeframe, start, end))
+        return filled
+
+candle_store = CandleStore(config.CANDLE_STORE_DIR)
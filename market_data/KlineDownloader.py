@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep
+import datetime as dt
+import numpy as np
+from logs.logger import get_logger
+from bybit.RateLimiter import public_session
+from bybit.KlineParser import parse_klines, Klines
+from market_data.KlineStream import KLINE_COLUMNS, timeframe_ms, candle_start, candle_close
+
+PAGE_LIMIT = 1000 # максимум свечей в одном ответе get_kline
+
+# Date 'YYYY-MM-DD', datetime or ms -> ms. The date string and naive datetimes are local time,
+# as Bybit.klines(start_date=...) always parsed them; pass an aware datetime or ms for UTC
+def to_ms(value):
+    if isinstance(value, str):
+        value = dt.datetime.strptime(value, '%Y-%m-%d')
+    if isinstance(value, dt.datetime):
+        return int(value.timestamp() * 1000)
+    return int(value)
+
+# Closed candles [start, end) aligned to the timeframe and pages (page_start, page_end) of at most PAGE_LIMIT candles.
+# Shared by KlineDownloader and AsyncBybit.klines, which only differ in how a page is fetched
+def kline_pages(timeframe, start, end=None):
+    timeframe = str(timeframe)
+    if timeframe not in timeframe_ms and timeframe != 'M':
+        raise ValueError(f'Unsupported timeframe for download: {timeframe}')
+    start = candle_start(timeframe, to_ms(start))
+    now = int(dt.datetime.now(dt.timezone.utc).timestamp() * 1000)
+    end = candle_start(timeframe, min(to_ms(end), now) if end != None else now) # без незакрытой свечи
+    if timeframe == 'M':
+        # месяц разной длины - шага в ms нет; 1000 месяцев (83 года) всегда умещаются в одну страницу
+        return start, end, [(start, end)] if start < end else []
+    step = timeframe_ms[timeframe]
+    return start, end, [(page, min(page + PAGE_LIMIT * step, end)) for page in range(start, end, PAGE_LIMIT * step)]
+
+# Pages parsed by parse_klines -> rows in [start, end) sorted by Time (без дублей на стыках страниц)
+def stitch_pages(chunks, start, end):
+    rows = np.concatenate(chunks) if chunks else np.empty((0, len(KLINE_COLUMNS) + 1))
+    rows = rows[(rows[:, 0] >= start) & (rows[:, 0] < end)]
+    _, unique = np.unique(rows[:, 0], return_index=True)
+    return rows[unique]
+
+# Загрузка истории свечей за любой период: диапазон режется на страницы по 1000 свечей,
+# страницы качаются параллельно через общий лимитер (публичная группа), затем склеиваются без дублей.
+class KlineDownloader:
+    # retry_delay - pause before the first repeat of a failed page, doubled for each next one
+    def __init__(self, workers=8, session=public_session, retries=1, retry_delay=0.5):
+        self.__logger = get_logger('kline_downloader')
+        self.__session = session
+        self.__workers = workers
+        self.__retries = retries
+        self.__retry_delay = retry_delay
+
+    # One page; a failed request (network, 5xx - 10006 is retried by the limiter) is repeated retries times with backoff
+    def __fetch_page(self, symbol, timeframe, start, end):
+        for attempt in range(self.__retries + 1):
+            try:
+                resp = self.__session.get_kline(category='linear', symbol=symbol, interval=timeframe,
+                                                start=start, end=end - 1, limit=PAGE_LIMIT)['result']['list']
+                return parse_klines(resp).reshape(-1, len(KLINE_COLUMNS) + 1)
+            except Exception as err:
+                if attempt == self.__retries:
+                    raise
+                self.__logger.warning(f'Cannot download klines page {start} for {symbol} {timeframe}, retrying: {err}')
+                sleep(self.__retry_delay * 2 ** attempt) # сразу повторять при сбросе соединения или 5xx бесполезно
+
+    # Closed candles [start, end) as rows [Time, Open, High, Low, Close, Volume, Turnover] sorted by Time.
+    # path - .npy file in the backtest layout (rows = columns, see backtest.Optimizer.load_candles),
+    # store - CandleStore to merge the candles into
+    def download(self, symbol, timeframe, start, end=None, path=None, store=None):
+        timeframe = str(timeframe)
+        start, end, pages = kline_pages(timeframe, start, end)
+        self.__logger.info(f'Start downloading {len(pages)} pages of klines for {symbol} {timeframe}')
+        with ThreadPoolExecutor(max_workers=self.__workers) as pool:
+            chunks = list(pool.map(lambda page: self.__fetch_page(symbol, timeframe, *page), pages))
+        rows = stitch_pages(chunks, start, end)
+
+        missing = (end - start) // timeframe_ms[timeframe] - len(rows) if timeframe != 'M' else 0
+        if missing > 0:
+            self.__logger.warning(f'{missing} klines are missing for {symbol} {timeframe} (exchange gaps or listing date)')
+        self.__logger.info(f'Successfully downloaded {len(rows)} klines for {symbol} {timeframe}')
+
+        if path != None:
+            np.save(path, np.ascontiguousarray(rows.T))
+        if store != None:
+            store.merge(symbol, timeframe, rows)
+        return rows
+
+    # Incremental update of the store: candles after its last one (from start if the store is empty)
+    def update_store(self, store, symbol, timeframe, start):
+        timeframe = str(timeframe)
+        last = store.last_time(symbol, timeframe)
+        rows = self.download(symbol, timeframe, start if last == None else candle_close(timeframe, last))
+        return store.append(symbol, timeframe, rows)
+
+    # Same as download(), but a DataFrame like Bybit.klines()
+    def download_dataframe(self, symbol, timeframe, start, end=None):
+        return Klines(self.download(symbol, timeframe, start, end)).to_dataframe()
+
+kline_downloader = KlineDownloader()
@@ -0,0 +1,220 @@
+from threading import Lock, Condition
+import datetime as dt
+import numpy as np
+import pandas as pd
+from logs.logger import get_logger
+from bybit.ClockSync import clock_sync
+from bybit.RateLimiter import public_session
+from bybit.Endpoints import make_websocket
+from bybit.KlineParser import parse_klines
+
+KLINE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume', 'Turnover']
+
+# Длительность свечи в мс (для 'M' длина плавающая - разрывы не проверяем)
+timeframe_ms = {
+    '1': 60_000, '3': 180_000, '5': 300_000, '15': 900_000, '30': 1_800_000,
+    '60': 3_600_000, '120': 7_200_000, '240': 14_400_000, '360': 21_600_000, '720': 43_200_000,
+    'D': 86_400_000, 'W': 604_800_000
+}
+WEEK_SHIFT_MS = 345_600_000 # недельные свечи Bybit начинаются в понедельник, а 01.01.1970 - четверг
+
+# Start time (ms) of the candle containing time_ms
+def candle_start(timeframe, time_ms):
+    timeframe = str(timeframe)
+    time_ms = int(time_ms)
+    if timeframe == 'M':
+        date = dt.datetime.fromtimestamp(time_ms / 1000, dt.timezone.utc)
+        return int(date.replace(day=1, hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000)
+    if timeframe == 'W':
+        return (time_ms - WEEK_SHIFT_MS) // timeframe_ms['W'] * timeframe_ms['W'] + WEEK_SHIFT_MS
+    return time_ms // timeframe_ms[timeframe] * timeframe_ms[timeframe]
+
+# Close time (ms) of the candle containing time_ms, i.e. start of the next one
+def candle_close(timeframe, time_ms):
+    start = candle_start(timeframe, time_ms)
+    if str(timeframe) == 'M':
+        date = dt.datetime.fromtimestamp(start / 1000, dt.timezone.utc)
+        date = date.replace(year=date.year + date.month // 12, month=date.month % 12 + 1)
+        return int(date.timestamp() * 1000)
+    return start + timeframe_ms[str(timeframe)]
+
+# REST snapshot rows (ascending) -> closed rows and the live candle. The last row is live only if it is
+# the current candle: right after the close (or for an illiquid symbol) it is already closed
+def split_snapshot(timeframe, rows, now_ms):
+    if rows[-1][0] >= candle_start(timeframe, now_ms):
+        return rows[:-1], rows[-1]
+    return rows, None
+
+# Кольцевой буфер свечей фиксированного размера: строки [Time, Open, High, Low, Close, Volume, Turnover]
+class CandleRingBuffer:
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self.__rows = np.full((capacity, 7), np.nan)
+        self.__head = 0 # куда пишем следующую закрытую свечу
+        self.__size = 0
+        self.__live = None # текущая (незакрытая) свеча
+        self.__lock = Lock()
+        self.__appended = Condition(self.__lock)
+        self.stale = True # нужен REST снимок (холодный старт или разрыв)
+
+    def __len__(self):
+        return self.__size
+
+    def last_time(self):
+        with self.__lock:
+            if self.__size == 0:
+                return None
+            return int(self.__rows[(self.__head - 1) % self.capacity, 0])
+
+    def reset(self, closed_rows, live_row=None):
+        with self.__lock:
+            closed_rows = closed_rows[-self.capacity:]
+            self.__size = len(closed_rows)
+            self.__rows[:self.__size] = closed_rows
+            self.__head = self.__size % self.capacity
+            self.__live = live_row
+            self.stale = False
+            self.__appended.notify_all()
+
+    def append(self, row):
+        with self.__lock:
+            self.__rows[self.__head] = row
+            self.__head = (self.__head + 1) % self.capacity
+            self.__size = min(self.__size + 1, self.capacity)
+            if self.__live is not None and self.__live[0] <= row[0]:
+                self.__live = None
+            self.__appended.notify_all()
+
+    # Waiting until the candle with start time_ms is closed. Returns False on timeout
+    def wait_for(self, time_ms, timeout):
+        with self.__lock:
+            return self.__appended.wait_for(
+                lambda: self.__size > 0 and self.__rows[(self.__head - 1) % self.capacity, 0] >= time_ms, timeout)
+
+    def set_live(self, row):
+        with self.__lock:
+            self.__live = row
+
+    # Closed candles in ascending time order (copy), optionally with the current unclosed one
+    def to_array(self, include_live=False):
+        with self.__lock:
+            if self.__size < self.capacity:
+                rows = self.__rows[:self.__size].copy()
+            else:
+                rows = np.roll(self.__rows, -self.__head, axis=0)
+            if include_live and self.__live is not None:
+                rows = np.vstack([rows, self.__live])
+        return rows
+
+    # Same format as Bybit.klines(): index Time, columns Open..Turnover
+    def to_dataframe(self, include_live=False):
+        rows = self.to_array(include_live)
+        return pd.DataFrame(rows[:, 1:], columns=KLINE_COLUMNS,
+                            index=pd.Index(rows[:, 0].astype(np.int64), name='Time'))
+
+
+# Публичный WebSocket kline-стрим: по одному кольцевому буферу на (symbol, timeframe)
+class KlineStream:
+    def __init__(self, capacity=200):
+        self.__capacity = capacity
+        self.__session = public_session
+        self.__ws = None
+        self.__buffers = {}
+        self.__lock = Lock()
+        self.__logger = get_logger('klineStream')
+
+    def __kline_callback(self, message):
+        try:
+            _, timeframe, symbol = message['topic'].split('.')
+            buffer = self.__buffers.get((symbol, timeframe))
+            if buffer == None:
+                return
+
+            for candle in message['data']:
+                row = np.array([candle['start'], candle['open'], candle['high'], candle['low'],
+                                candle['close'], candle['volume'], candle['turnover']], dtype=np.float64)
+                if not candle['confirm']:
+                    buffer.set_live(row)
+                    continue
+
+                last_time = buffer.last_time()
+                if last_time != None and row[0] <= last_time:
+                    continue # дубль уже сохраненной свечи
+                step = timeframe_ms.get(timeframe)
+                if last_time == None or (step != None and row[0] - last_time != step):
+                    # разрыв - перезагрузим снимок при следующем чтении
+                    self.__logger.warning(f'Gap in klines stream for {symbol} {timeframe}')
+                    buffer.stale = True
+                buffer.append(row)
+
+        except Exception as err:
+            print(err)
+            self.__logger.error('Error in kline_callback')
+
+    # REST snapshot: Bybit returns newest first, the first element is usually the unclosed candle
+    def __load_snapshot(self, symbol, timeframe, buffer):
+        try:
+            resp = self.__session.get_kline(category='linear', symbol=symbol,
+                                            interval=timeframe, limit=self.__capacity + 1)['result']['list']
+            rows = parse_klines(resp)
+            if len(rows) == 0:
+                return False
+
+            buffer.reset(*split_snapshot(timeframe, rows, clock_sync.now_ms()))
+            self.__logger.info(f'Successfully loaded klines snapshot for {symbol} {timeframe}')
+            return True
+
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot load klines snapshot for {symbol} {timeframe}')
+            return False
+
+    def __subscribe(self, symbol, timeframe):
+        buffer = CandleRingBuffer(self.__capacity)
+        self.__buffers[(symbol, timeframe)] = buffer
+        try:
+            if self.__ws == None:
+                self.__ws = make_websocket('linear')
+            interval = int(timeframe) if timeframe.isdigit() else timeframe
+            self.__ws.kline_stream(interval=interval, symbol=symbol, callback=self.__kline_callback)
+            self.__logger.info(f'Successfully subscribed to klines for {symbol} {timeframe}')
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Cannot subscribe to klines for {symbol} {timeframe}')
+        return buffer
+
+    def get_buffer(self, symbol, timeframe):
+        timeframe = str(timeframe)
+        with self.__lock:
+            buffer = self.__buffers.get((symbol, timeframe))
+            if buffer == None:
+                buffer = self.__subscribe(symbol, timeframe)
+            if buffer.stale:
+                self.__load_snapshot(symbol, timeframe, buffer)
+        return buffer
+
+    # Candles without network I/O in steady state. Empty DataFrame if nothing is loaded.
+    # Right after the candle close waits up to timeout seconds for its confirm message
+    def get_candles(self, symbol, timeframe, include_live=False, timeout=2):
+        buffer = self.get_buffer(symbol, timeframe)
+        if len(buffer) == 0:
+            return pd.DataFrame()
+
+        last_closed = candle_start(timeframe, candle_start(timeframe, clock_sync.now_ms()) - 1)
+        if not buffer.wait_for(last_closed, timeout):
+            self.__logger.warning(f'No confirmed candle from stream for {symbol} {timeframe}, reloading snapshot')
+            buffer.stale = True
+            buffer = self.get_buffer(symbol, timeframe)
+        return buffer.to_dataframe(include_live)
+
+    def stop(self):
+        try:
+            if self.__ws != None:
+                self.__ws.exit()
+                self.__ws = None
+            self.__logger.info('Successfully stopped klines stream')
+        except Exception as err:
+            print(err)
+            self.__logger.error('Cannot stop klines stream')
+
+kline_stream = KlineStream()
@@ -0,0 +1,135 @@
+from threading import Lock
+import numpy as np
+import pandas as pd
+from logs.logger import get_logger
+from bybit.ClockSync import clock_sync
+from config import config
+from market_data.KlineStream import kline_stream, candle_start
+from market_data.SharedCandles import shared_candles
+from strategies.Indicators import IndicatorSet, INDICATOR_TYPES
+
+# Общие для всех стратегий свечи и индикаторы: на каждом тике по (symbol, timeframe) один DataFrame
+# и один расчет каждого индикатора с одинаковыми параметрами, сколько бы стратегий их ни запросило.
+# Стратегии получают read-only объекты - запись в них бросает ValueError, а не портит данные соседям.
+# Свечи из общей памяти (SharedCandles) не копируются: после построения кадра и индикаторов хаб проверяет
+# их seq и перечитывает, если публикатор успел перезаписать слот.
+
+# DataFrame/Series over a read-only array: a copy, unless the data is already read-only (shared memory)
+def read_only(data):
+    values = data.to_numpy(dtype=np.float64)
+    if values.flags.writeable:
+        values = np.array(values)
+        values.setflags(write=False)
+    if isinstance(data, pd.Series):
+        return pd.Series(values, index=data.index, name=data.name, copy=False)
+    return pd.DataFrame(values, index=data.index, columns=data.columns, copy=False)
+
+
+class MarketDataHub:
+    def __init__(self, stream=kline_stream):
+        self.__logger = get_logger('market_data_hub')
+        self.__stream = stream
+        self.__lock = Lock()
+        self.__key_locks = {}
+        self.__candles = {} # (symbol, timeframe) -> (тик, DataFrame, seq общей памяти или None)
+        self.__indicators = {} # (symbol, timeframe, name, params) -> {'set', 'data', 'value'}
+        self.__hits = {'candles': 0, 'indicators': 0}
+        self.__misses = {'candles': 0, 'indicators': 0}
+
+    # Lock per cache key: the first strategy computes, the others wait and reuse
+    def __key_lock(self, key):
+        with self.__lock:
+            lock = self.__key_locks.get(key)
+            if lock == None:
+                lock = self.__key_locks[key] = Lock()
+            return lock
+
+    def __count(self, kind, hit):
+        with self.__lock:
+            if hit:
+                self.__hits[kind] += 1
+            else:
+                self.__misses[kind] += 1
+
+    # Candles from the stream and their seq, if the stream is shared memory (see SharedCandles.snapshot)
+    def __read(self, symbol, timeframe):
+        if hasattr(self.__stream, 'snapshot'):
+            return self.__stream.snapshot(symbol, timeframe)
+        return None, self.__stream.get_candles(symbol, timeframe)
+
+    # Whether data from get_candles() is still intact; a stale cache entry is dropped so the next call re-reads
+    def __intact(self, symbol, timeframe, data):
+        key = (symbol, timeframe)
+        with self.__lock:
+            cached = self.__candles.get(key)
+        if cached == None or cached[1] is not data or cached[2] == None:
+            return True
+        if self.__stream.valid(symbol, timeframe, cached[2]):
+            return True
+        self.__logger.warning(f'Shared candles for {symbol} {timeframe} were overwritten while in use, re-reading')
+        with self.__lock:
+            if self.__candles.get(key) is cached:
+                del self.__candles[key]
+        return False
+
+    # Closed candles of the current tick (see KlineStream.get_candles), shared by all strategies
+    def get_candles(self, symbol, timeframe):
+        timeframe = str(timeframe)
+        key = (symbol, timeframe)
+        tick = candle_start(timeframe, clock_sync.now_ms())
+        with self.__key_lock(key):
+            cached = self.__candles.get(key)
+            if cached != None and cached[0] == tick:
+                self.__count('candles', True)
+                return cached[1]
+
+            self.__count('candles', False)
+            while True:
+                seq, data = self.__read(symbol, timeframe)
+                if data.empty:
+                    return data # не кэшируем - следующая стратегия попробует снова
+                data = read_only(data)
+                if seq == None or self.__stream.valid(symbol, timeframe, seq):
+                    break
+            self.__candles[key] = (tick, data, seq)
+            return data
+
+    # Indicator from INDICATOR_TYPES over get_candles(), e.g. indicator('BNBUSDT', '1', 'EMA', 10).
+    # Stochastic gives a DataFrame (k, d), the rest - Series
+    def indicator(self, symbol, timeframe, name, *params):
+        timeframe = str(timeframe)
+        key = (symbol, timeframe, name, params)
+        while True:
+            data = self.get_candles(symbol, timeframe)
+            if data.empty:
+                return pd.Series(dtype=np.float64)
+
+            with self.__key_lock(key):
+                entry = self.__indicators.get(key)
+                if entry != None and entry['data'] is data:
+                    self.__count('indicators', True)
+                    return entry['value']
+
+                self.__count('indicators', False)
+                if entry == None:
+                    entry = self.__indicators[key] = {'set': IndicatorSet({name: INDICATOR_TYPES[name](*params)})}
+                entry['set'].update(data)
+                value = read_only(entry['set'].series(name, data.index))
+                if self.__intact(symbol, timeframe, data): # свечи не перезаписали, пока считали
+                    entry['data'] = data
+                    entry['value'] = value
+                    return value
+                del self.__indicators[key] # состояние IndicatorSet могло впитать рваные свечи - считаем заново
+
+    def stats(self):
+        with self.__lock:
+            result = {}
+            for kind in self.__hits:
+                total = self.__hits[kind] + self.__misses[kind]
+                result[kind] = {'hits': self.__hits[kind], 'misses': self.__misses[kind],
+                                'hit_ratio': self.__hits[kind] / total if total else 0.0}
+            hits, total = sum(self.__hits.values()), sum(self.__hits.values()) + sum(self.__misses.values())
+            result['hit_ratio'] = hits / total if total else 0.0
+            return result
+
+market_data_hub = MarketDataHub(shared_candles if config.SHARED_CANDLES else kline_stream)
@@ -0,0 +1,227 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Process, Event, shared_memory, resource_tracker
+from threading import Lock
+from time import time, sleep
+import numpy as np
+import pandas as pd
+from logs.logger import get_logger
+from config import config
+from bybit.ClockSync import clock_sync
+from market_data.KlineStream import kline_stream, KLINE_COLUMNS, candle_start, candle_close
+
+# Закрытые свечи в общей памяти: один сегмент на (symbol, timeframe), пишет один процесс market data,
+# процессы стратегий читают без копирования. В сегменте два слота: запись идет в неактивный,
+# затем счетчик seq переключает читателей на него (seqlock: нечетный seq - запись в процессе).
+# Читатель проверяет seq после чтения и повторяет, если писатель успел дойти до его слота,
+# поэтому рваных свечей не видит. Выданный вид остается целым до второй следующей публикации,
+# то есть минимум до конца тика своего таймфрейма; valid(seq) проверяет это после использования данных.
+
+HEADER = 4 # int64: seq, capacity, count слота 0, count слота 1
+ROW = 7 # Time, Open, High, Low, Close, Volume, Turnover
+
+def segment_name(prefix, symbol, timeframe):
+    return f'{prefix}-{symbol}-{timeframe}'
+
+def segment_size(capacity):
+    return HEADER * 8 + 2 * capacity * ROW * 8
+
+# Attaching to an existing segment without handing it to this process's resource_tracker
+# (before 3.13 it would unlink the segment when the reader exits)
+attach_lock = Lock()
+def attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    with attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+# Same format as KlineStream.get_candles(), over the rows without copying
+def to_dataframe(rows):
+    return pd.DataFrame(rows[:, 1:], columns=KLINE_COLUMNS, index=pd.Index(rows[:, 0].astype(np.int64), name='Time'),
+                        copy=False)
+
+
+class CandleSegment:
+    def __init__(self, name, capacity=200, create=False):
+        self.name = name
+        self.owner = create
+        if create:
+            try:
+                stale = attach(name) # остался от упавшего запуска
+                stale.close()
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+            self.__shm = shared_memory.SharedMemory(name=name, create=True, size=segment_size(capacity))
+        else:
+            self.__shm = attach(name)
+        self.__header = np.ndarray((HEADER,), np.int64, self.__shm.buf)
+        if create:
+            self.__header[:] = [0, capacity, 0, 0]
+        self.capacity = int(self.__header[1])
+        self.__slots = np.ndarray((2, self.capacity, ROW), np.float64, self.__shm.buf, offset=HEADER * 8)
+
+    # Writer only: filling the inactive slot and switching readers to it
+    def publish(self, rows):
+        rows = rows[-self.capacity:]
+        seq = int(self.__header[0])
+        slot = (seq // 2 + 1) % 2
+        self.__header[0] = seq + 1
+        self.__slots[slot, :len(rows)] = rows
+        self.__header[2 + slot] = len(rows)
+        self.__header[0] = seq + 2
+
+    # Last published candles as a read-only view into the segment and its seq (0 - nothing published yet)
+    def read(self):
+        while True:
+            seq = int(self.__header[0])
+            stable = seq - seq % 2
+            slot = stable // 2 % 2
+            rows = self.__slots[slot, :int(self.__header[2 + slot])]
+            if int(self.__header[0]) < stable + 3: # писатель не начал перезаписывать этот слот
+                break
+        rows = rows.view()
+        rows.setflags(write=False)
+        return stable, rows
+
+    # Whether rows read at seq are still intact
+    def valid(self, seq):
+        return int(self.__header[0]) < seq + 3
+
+    def close(self):
+        try:
+            self.__shm.close()
+        except BufferError:
+            pass # на сегмент еще ссылаются DataFrame стратегий - отображение снимется при выходе процесса
+        if self.owner:
+            self.__shm.unlink()
+
+
+# Candle source for MarketDataHub in strategy processes (same get_candles() as KlineStream)
+class SharedCandles:
+    def __init__(self, prefix, poll_interval=0.005):
+        self.__prefix = prefix
+        self.__poll_interval = poll_interval
+        self.__segments = {}
+        self.__missed = {} # (symbol, timeframe) -> закрытие, которого не дождались
+        self.__lock = Lock()
+        self.__logger = get_logger('sharedCandles')
+
+    def __segment(self, symbol, timeframe):
+        with self.__lock:
+            segment = self.__segments.get((symbol, timeframe))
+            if segment == None:
+                try:
+                    segment = self.__segments[(symbol, timeframe)] = CandleSegment(segment_name(self.__prefix, symbol, timeframe))
+                except FileNotFoundError:
+                    self.__logger.error(f'No shared candles for {symbol} {timeframe}: is it in the publisher pairs?')
+            return segment
+
+    # Closed candles without copying and the seq they were read at (for valid()). Right after the candle close
+    # waits up to timeout seconds for the publisher; (None, empty DataFrame) if it did not publish the candle
+    # (once per close, then immediately)
+    def snapshot(self, symbol, timeframe, timeout=2):
+        timeframe = str(timeframe)
+        segment = self.__segment(symbol, timeframe)
+        if segment == None:
+            return None, pd.DataFrame()
+
+        last_closed = candle_start(timeframe, candle_start(timeframe, clock_sync.now_ms()) - 1)
+        deadline = time() + timeout
+        while True:
+            seq, rows = segment.read()
+            if len(rows) > 0 and rows[-1, 0] >= last_closed:
+                data = to_dataframe(rows) # индекс - копия колонки Time, ее тоже надо прочитать целой
+                if segment.valid(seq):
+                    return seq, data
+                continue
+            if self.__missed.get((symbol, timeframe)) == last_closed or time() >= deadline:
+                break
+            sleep(self.__poll_interval)
+
+        if self.__missed.get((symbol, timeframe)) != last_closed:
+            self.__missed[(symbol, timeframe)] = last_closed
+            self.__logger.warning(f'Shared candles for {symbol} {timeframe} are not published for {last_closed}')
+        return None, pd.DataFrame()
+
+    # Closed candles without copying (same as KlineStream.get_candles())
+    def get_candles(self, symbol, timeframe, timeout=2):
+        return self.snapshot(symbol, timeframe, timeout)[1]
+
+    # Whether candles of snapshot() at seq are still intact: the publisher has not started to overwrite them
+    def valid(self, symbol, timeframe, seq):
+        segment = self.__segments.get((symbol, str(timeframe)))
+        return segment != None and segment.valid(seq)
+
+    def close(self):
+        with self.__lock:
+            for segment in self.__segments.values():
+                segment.close()
+            self.__segments = {}
+
+
+# Market data process: keeps KlineStream subscriptions and publishes closed candles on every close of their timeframe
+def run_publisher(prefix, pairs, stop, fire_delay=0.05):
+    logger = get_logger('candlePublisher')
+    clock_sync.start()
+    segments = {(symbol, timeframe): CandleSegment(segment_name(prefix, symbol, timeframe)) for symbol, timeframe in pairs}
+
+    def publish(pair):
+        symbol, timeframe = pair
+        try:
+            data = kline_stream.get_candles(symbol, timeframe) # ждет confirm только своей пары
+            if data.empty:
+                logger.warning(f'No candles to publish for {symbol} {timeframe}')
+                return
+            segments[pair].publish(np.column_stack([data.index.to_numpy(np.float64), data.to_numpy(np.float64)]))
+        except Exception as err:
+            print(err)
+            logger.error(f'Cannot publish candles for {symbol} {timeframe}: {err}')
+
+    # Пары публикуются параллельно: каждая, как только пришла ее закрытая свеча, не дожидаясь опоздавших
+    with ThreadPoolExecutor(max_workers=max(len(pairs), 1), thread_name_prefix='candlePublisher') as executor:
+        list(executor.map(publish, pairs))
+        logger.info(f'Publishing candles for {len(pairs)} pairs')
+
+        while not stop.is_set():
+            close_ms = candle_close('1', clock_sync.now_ms())
+            clock_sync.sleep_until(close_ms + fire_delay * 1000 + clock_sync.error_ms())
+            list(executor.map(publish, [pair for pair in pairs if candle_close(pair[1], close_ms - 1) == close_ms]))
+    kline_stream.stop()
+
+
+# Owner of the segments in the main process: creates them and runs the publisher process
+class CandlePublisher:
+    def __init__(self, prefix, pairs, capacity=200):
+        self.__prefix = prefix
+        self.__pairs = [(symbol, str(timeframe)) for symbol, timeframe in pairs]
+        self.__capacity = capacity
+        self.__segments = []
+        self.__stop = Event()
+        self.__process = None
+
+    def start(self):
+        self.__segments = [CandleSegment(segment_name(self.__prefix, symbol, timeframe), self.__capacity, create=True)
+                           for symbol, timeframe in self.__pairs]
+        self.__process = Process(target=run_publisher, args=(self.__prefix, self.__pairs, self.__stop),
+                                 daemon=True, name='candlePublisher')
+        self.__process.start()
+
+    def is_alive(self):
+        return self.__process != None and self.__process.is_alive()
+
+    def stop(self, timeout=5):
+        self.__stop.set()
+        if self.__process != None:
+            self.__process.terminate() # может спать до закрытия свечи
+            self.__process.join(timeout)
+        for segment in self.__segments:
+            segment.close()
+        self.__segments = []
+
+shared_candles = SharedCandles(config.SHARED_CANDLES)
@@ -0,0 +1,73 @@
+import os
+from threading import Thread, Event
+import numpy as np
+from market_data.CandleStore import CandleStore
+
+STEP = 60_000
+
+# Свечи с Time = i * STEP, все остальные колонки равны value (по ним видно, из какой записи строка)
+def candles(first, count, value=None):
+    times = (np.arange(first, first + count) * STEP).astype(np.float64)
+    values = times / STEP if value == None else np.full(count, float(value))
+    return np.column_stack([times] + [values] * 6)
+
+def test_merge_append_read_round_trip(tmp_path):
+    store = CandleStore(str(tmp_path))
+    assert store.append('BTCUSDT', '1', candles(10, 5)) == 5
+    assert store.append('BTCUSDT', '1', candles(12, 5)) == 2 # старые строки пропускаются
+    assert store.gaps('BTCUSDT', '1') == []
+
+    before = store.read('BTCUSDT', '1')
+    assert store.merge('BTCUSDT', '1', candles(0, 3)) == 3 # раньше истории - новая версия
+    assert store.gaps('BTCUSDT', '1') == [(3 * STEP, 10 * STEP)]
+    assert store.merge('BTCUSDT', '1', candles(3, 8, value=-1)) == 8 # перекрывает свечу 10 - новые строки побеждают
+    assert store.append('BTCUSDT', '1', candles(17, 3)) == 3
+    assert store.last_time('BTCUSDT', '1') == 19 * STEP
+
+    data = store.read_dataframe('BTCUSDT', '1')
+    assert list(data.index) == list(np.arange(20) * STEP)
+    expected = np.arange(20, dtype=np.float64)
+    expected[3:11] = -1
+    for column in data.columns:
+        np.testing.assert_array_equal(data[column].to_numpy(), expected)
+
+    # прочитанное до merge осталось старой версией целиком
+    np.testing.assert_array_equal(before['Time'], np.arange(10, 17) * STEP)
+    np.testing.assert_array_equal(before['Close'], np.arange(10, 17))
+    assert sorted(os.listdir(tmp_path / 'BTCUSDT' / '1')) == ['CURRENT', 'v2']
+
+    sliced = store.read('BTCUSDT', '1', start=5 * STEP, end=8 * STEP)
+    np.testing.assert_array_equal(sliced['Time'], np.arange(5, 8) * STEP)
+
+def test_read_during_merges_sees_one_version(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.append('BTCUSDT', '1', candles(100, 50, value=0))
+    stop = Event()
+
+    def writer():
+        for version in range(1, 100):
+            store.merge('BTCUSDT', '1', candles(100 - version, 50 + version, value=version))
+        stop.set()
+
+    thread = Thread(target=writer)
+    thread.start()
+    reads = 0
+    while not stop.is_set():
+        columns = store.read('BTCUSDT', '1')
+        version = columns['Open'][0]
+        assert len(columns['Time']) == 50 + version
+        for name, values in columns.items():
+            if name != 'Time':
+                assert (values == version).all()
+        reads += 1
+    thread.join()
+    assert reads > 0
+
+def test_merge_of_unsorted_newer_rows_appends_with_gap_warning(tmp_path, caplog):
+    store = CandleStore(str(tmp_path))
+    store.append('BTCUSDT', '1', candles(0, 5))
+    newer = candles(8, 4)[::-1] # новее последней свечи, но в обратном порядке (как отдает Bybit)
+    assert store.merge('BTCUSDT', '1', newer) == 4
+    assert list(store.read('BTCUSDT', '1')['Time']) == [t * STEP for t in [0, 1, 2, 3, 4, 8, 9, 10, 11]]
+    assert store.gaps('BTCUSDT', '1') == [(5 * STEP, 8 * STEP)]
+    assert 'Gap in BTCUSDT 1 candles' in caplog.text
@@ -0,0 +1,62 @@
+import datetime as dt
+from threading import Lock
+from time import time
+import numpy as np
+import pytest
+from market_data.KlineDownloader import KlineDownloader, to_ms, PAGE_LIMIT
+from market_data.KlineStream import candle_close
+
+STEP = 60_000
+
+# get_kline как у pybit: свечи [start, end] новыми первыми; первый запрос каждой страницы из fail_pages падает
+class FakeSession:
+    def __init__(self, fail_pages=(), failures=1):
+        self.calls = []
+        self.times = []
+        self.__failures = {page: failures for page in fail_pages}
+        self.__lock = Lock()
+
+    def get_kline(self, category, symbol, interval, start, end, limit):
+        with self.__lock:
+            self.calls.append(start)
+            self.times.append(time())
+            if self.__failures.get(start, 0) > 0:
+                self.__failures[start] -= 1
+                raise ConnectionError('Connection reset by peer')
+        if interval == 'M':
+            times = [start]
+            while candle_close('M', times[-1]) <= end:
+                times.append(candle_close('M', times[-1]))
+        else:
+            times = list(range(start, end + 1, STEP))[:limit]
+        rows = [[str(t), *(str(t // STEP),) * 4, '1', '1'] for t in times]
+        return {'result': {'list': rows[::-1]}}
+
+def test_pages_are_stitched_and_failed_page_is_retried():
+    session = FakeSession(fail_pages=[PAGE_LIMIT * STEP])
+    downloader = KlineDownloader(workers=4, session=session, retry_delay=0.2)
+    end = 2500 * STEP
+    rows = downloader.download('BTCUSDT', '1', 0, end)
+    np.testing.assert_array_equal(rows[:, 0], np.arange(2500) * STEP)
+    np.testing.assert_array_equal(rows[:, 4], np.arange(2500))
+    assert sorted(session.calls) == [0, PAGE_LIMIT * STEP, PAGE_LIMIT * STEP, 2 * PAGE_LIMIT * STEP]
+    retried = [t for start, t in zip(session.calls, session.times) if start == PAGE_LIMIT * STEP]
+    assert retried[1] - retried[0] >= 0.2 # повтор после паузы, а не сразу
+
+def test_page_failing_twice_fails_download():
+    downloader = KlineDownloader(workers=2, session=FakeSession(fail_pages=[0], failures=2), retry_delay=0)
+    with pytest.raises(ConnectionError):
+        downloader.download('BTCUSDT', '1', 0, 10 * STEP)
+
+def test_date_string_is_local_time():
+    assert to_ms('2024-03-01') == int(dt.datetime(2024, 3, 1).timestamp() * 1000)
+    assert to_ms(dt.datetime(2024, 3, 1, tzinfo=dt.timezone.utc)) == 1_709_251_200_000
+    assert to_ms(1_709_251_200_000) == 1_709_251_200_000
+
+def test_monthly_klines_are_calendar_months():
+    session = FakeSession()
+    start = to_ms(dt.datetime(2023, 11, 15, tzinfo=dt.timezone.utc))
+    rows = KlineDownloader(session=session).download('BTCUSDT', 'M', start, to_ms(dt.datetime(2024, 3, 10, tzinfo=dt.timezone.utc)))
+    months = [dt.datetime.fromtimestamp(t / 1000, dt.timezone.utc).strftime('%Y-%m') for t in rows[:, 0]]
+    assert months == ['2023-11', '2023-12', '2024-01', '2024-02'] # мартовская свеча еще не закрыта
+    assert len(session.calls) == 1
@@ -0,0 +1,41 @@
+import numpy as np
+from market_data.KlineStream import CandleRingBuffer, split_snapshot
+
+STEP = 60_000
+
+def row(i, value=None):
+    return np.array([i * STEP] + [float(i if value == None else value)] * 6)
+
+def test_append_wraps_around_and_keeps_order():
+    buffer = CandleRingBuffer(capacity=3)
+    buffer.reset(np.array([row(0), row(1)]))
+    for i in range(2, 6):
+        buffer.append(row(i))
+    assert len(buffer) == 3 and buffer.last_time() == 5 * STEP
+    assert list(buffer.to_array()[:, 0]) == [3 * STEP, 4 * STEP, 5 * STEP]
+    assert list(buffer.to_dataframe().index) == [3 * STEP, 4 * STEP, 5 * STEP]
+
+def test_confirmed_candle_replaces_live_one():
+    buffer = CandleRingBuffer(capacity=5)
+    buffer.reset(np.array([row(0), row(1)]), row(2, value=-1))
+    assert buffer.to_array(include_live=True)[-1, 4] == -1
+    buffer.set_live(row(2, value=-2)) # обновление незакрытой свечи
+    assert buffer.to_array(include_live=True)[-1, 4] == -2
+    assert not buffer.wait_for(2 * STEP, timeout=0)
+
+    buffer.append(row(2)) # confirm
+    assert buffer.wait_for(2 * STEP, timeout=0)
+    assert list(buffer.to_array(include_live=True)[:, 0]) == [0, STEP, 2 * STEP] # live сброшена
+
+def test_snapshot_last_row_is_live_only_for_current_candle():
+    rows = np.array([row(0), row(1), row(2)])
+    closed, live = split_snapshot('1', rows, 2 * STEP + 30_000) # свеча 2 еще идет
+    assert list(closed[:, 0]) == [0, STEP] and live[0] == 2 * STEP
+
+    closed, live = split_snapshot('1', rows, 3 * STEP + 100) # свеча 3 еще не пришла - 2 уже закрыта
+    assert list(closed[:, 0]) == [0, STEP, 2 * STEP] and live is None
+
+    buffer = CandleRingBuffer(capacity=2)
+    buffer.reset(closed, live)
+    assert buffer.last_time() == 2 * STEP and not buffer.stale
+    assert buffer.wait_for(2 * STEP, timeout=0) # get_candles не ждет confirm уже закрытой свечи
@@ -0,0 +1,77 @@
+import os
+from multiprocessing import Process, Event
+import numpy as np
+import pytest
+from bybit.ClockSync import clock_sync
+from market_data.KlineStream import candle_start
+from market_data.SharedCandles import CandleSegment, SharedCandles, segment_name
+from market_data.MarketDataHub import MarketDataHub
+
+PREFIX = f'test-candles-{os.getpid()}'
+STEP = 60_000
+
+# 200 одинаковых строк со значением value: рваное чтение смешало бы значения двух публикаций
+def rows_of(value, capacity=200):
+    return np.full((capacity, 7), float(value))
+
+# Закрытые свечи 1m до последней закрытой, все цены равны value
+def candles(value, count=50):
+    last_closed = candle_start('1', candle_start('1', clock_sync.now_ms()) - 1)
+    times = last_closed - np.arange(count)[::-1] * STEP
+    return np.column_stack([times] + [np.full(count, float(value))] * 6)
+
+@pytest.fixture
+def segment():
+    owner = CandleSegment(segment_name(PREFIX, 'BTCUSDT', '1'), create=True)
+    yield owner
+    owner.close()
+
+def hammer(name, publishes, started):
+    writer = CandleSegment(name)
+    started.set()
+    for value in range(1, publishes + 1):
+        writer.publish(rows_of(value))
+    writer.close()
+
+def test_no_torn_reads_under_publishing(segment):
+    started = Event()
+    writer = Process(target=hammer, args=(segment.name, 300_000, started), daemon=True)
+    writer.start()
+    started.wait(10)
+
+    validated = 0
+    while writer.is_alive():
+        seq, rows = segment.read()
+        values = np.array(rows) # данные используются после read(), проверка seq - после использования
+        if segment.valid(seq) and len(values):
+            assert (values == values[0, 0]).all()
+            validated += 1
+    writer.join()
+    assert writer.exitcode == 0
+    assert validated > 0
+    seq, rows = segment.read()
+    assert seq == 600_000 and (rows == 300_000).all()
+
+def test_view_is_valid_until_second_next_publish(segment):
+    segment.publish(rows_of(1))
+    seq, rows = segment.read()
+    assert not rows.flags.writeable
+    segment.publish(rows_of(2))
+    assert segment.valid(seq) and (rows == 1).all()
+    segment.publish(rows_of(3))
+    assert not segment.valid(seq)
+
+def test_hub_rereads_candles_overwritten_during_indicator(segment):
+    shared = SharedCandles(PREFIX)
+    hub = MarketDataHub(shared)
+    segment.publish(candles(1))
+    data = hub.get_candles('BTCUSDT', '1')
+    assert (data['Close'] == 1).all() and not data['Close'].to_numpy().flags.writeable
+
+    segment.publish(candles(2))
+    segment.publish(candles(3, count=60)) # слот, на который смотрит закэшированный кадр, перезаписан
+    ema = hub.indicator('BTCUSDT', '1', 'EMA', 10)
+    assert len(ema) == 60 and ema.iloc[-1] == pytest.approx(3)
+    data = hub.get_candles('BTCUSDT', '1')
+    assert len(data) == 60 and (data['Close'] == 3).all()
+    shared.close()
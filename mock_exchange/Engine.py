@@ -0,0 +1,302 @@
+from collections import deque
+from itertools import count
+from threading import Lock
+from time import time
+
+# Движок исполнения mock-биржи: счета пользователей, one-way позиции, рыночные, лимитные и условные ордера, TP/SL.
+# Ответы и сообщения в формате Bybit v5. Ошибки - (retCode, retMsg) как у биржи
+
+class ExchangeError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def fmt(value):
+    return f'{value:.10f}'.rstrip('0').rstrip('.') if value != None else ''
+
+def now_ms():
+    return int(time() * 1000)
+
+
+class Account:
+    def __init__(self, api, secret, balance):
+        self.api = api
+        self.secret = secret
+        self.balance = balance
+        self.positions = {} # symbol -> {'size' (со знаком), 'avgPrice', 'takeProfit', 'stopLoss'}
+        self.leverage = {} # symbol -> float
+        self.trade_mode = {} # symbol -> 0 cross / 1 isolated
+        self.orders = {} # orderId -> order (открытые)
+        self.closed_pnl = deque(maxlen=200)
+
+
+class MatchingEngine:
+    def __init__(self, market, taker_fee=0.00055, maker_fee=0.0002, balance=10000, publish=None):
+        self.market = market
+        self.taker_fee = taker_fee
+        self.maker_fee = maker_fee
+        self.__balance = balance
+        self.__publish = publish or (lambda api, topic, data: None) # publish(api, topic, data) - приватные WS топики
+        self.__lock = Lock()
+        self.__ids = count(1)
+        self.accounts = {} # api -> Account
+        self.__book = {} # symbol -> {orderId: (account, order)} - открытые ордера для проверки на каждом тике
+        self.__protected = {} # symbol -> {api: account} - позиции с TP/SL
+        self.fills = 0
+        self.orders_placed = 0
+
+    def add_account(self, api, secret, balance=None):
+        self.accounts[api] = Account(api, secret, self.__balance if balance == None else balance)
+        return self.accounts[api]
+
+    def __spec(self, symbol):
+        if symbol not in self.market.instruments:
+            raise ExchangeError(10001, f'params error: symbol invalid {symbol}')
+        return self.market.instruments[symbol]
+
+    # --- account data in REST format ---
+
+    def __unrealised(self, account, symbol):
+        pos = account.positions.get(symbol)
+        if pos == None:
+            return 0
+        return (self.market.price(symbol) - pos['avgPrice']) * pos['size']
+
+    def __used_margin(self, account):
+        margin = 0
+        for symbol, pos in account.positions.items():
+            margin += abs(pos['size']) * pos['avgPrice'] / account.leverage.get(symbol, 10)
+        for order in account.orders.values():
+            price = float(order['price']) if float(order['price']) > 0 else self.market.price(order['symbol'])
+            margin += float(order['leavesQty']) * price / account.leverage.get(order['symbol'], 10)
+        return margin
+
+    def available(self, account):
+        return max(account.balance - self.__used_margin(account), 0)
+
+    def wallet(self, account):
+        unrealised = sum(self.__unrealised(account, symbol) for symbol in account.positions)
+        return {'accountType': 'UNIFIED', 'totalEquity': fmt(account.balance + unrealised),
+                'coin': [{'coin': 'USDT', 'walletBalance': fmt(account.balance), 'equity': fmt(account.balance + unrealised),
+                          'unrealisedPnl': fmt(unrealised), 'availableToWithdraw': fmt(self.available(account))}]}
+
+    def position(self, account, symbol):
+        pos = account.positions.get(symbol)
+        size = pos['size'] if pos != None else 0
+        return {'category': 'linear', 'symbol': symbol, 'positionIdx': 0,
+                'side': 'Buy' if size > 0 else 'Sell' if size < 0 else '', 'size': fmt(abs(size)),
+                'avgPrice': fmt(pos['avgPrice'] if pos != None else 0), 'entryPrice': fmt(pos['avgPrice'] if pos != None else 0),
+                'markPrice': fmt(self.market.price(symbol)), 'leverage': fmt(account.leverage.get(symbol, 10)),
+                'tradeMode': account.trade_mode.get(symbol, 0), 'positionValue': fmt(abs(size) * self.market.price(symbol)),
+                'unrealisedPnl': fmt(self.__unrealised(account, symbol)),
+                'takeProfit': fmt(pos['takeProfit']) if pos != None and pos['takeProfit'] else '',
+                'stopLoss': fmt(pos['stopLoss']) if pos != None and pos['stopLoss'] else '',
+                'updatedTime': str(now_ms())}
+
+    def positions(self, account, symbol=None):
+        with self.__lock:
+            symbols = [symbol] if symbol != None else list(account.positions)
+            return [self.position(account, s) for s in symbols if s in self.market.instruments]
+
+    def open_orders(self, account, symbol=None):
+        with self.__lock:
+            return [dict(order) for order in account.orders.values() if symbol == None or order['symbol'] == symbol]
+
+    # --- settings ---
+
+    def set_leverage(self, account, symbol, leverage):
+        max_leverage = float(self.__spec(symbol)[4])
+        with self.__lock:
+            if not 1 <= leverage <= max_leverage:
+                raise ExchangeError(10001, 'leverage invalid')
+            if account.leverage.get(symbol, 10) == leverage:
+                raise ExchangeError(110043, 'leverage not modified')
+            account.leverage[symbol] = leverage
+            self.__publish(account.api, 'position', [self.position(account, symbol)])
+
+    def switch_mode(self, account, symbol, mode, leverage):
+        self.__spec(symbol)
+        with self.__lock:
+            if account.trade_mode.get(symbol, 0) == mode and account.leverage.get(symbol, 10) == leverage:
+                raise ExchangeError(110026, 'Cross/isolated margin mode is not modified')
+            account.trade_mode[symbol] = mode
+            account.leverage[symbol] = leverage
+
+    # --- orders ---
+
+    def place_order(self, account, params):
+        symbol = params.get('symbol')
+        _, _, qty_step, min_qty, _ = self.__spec(symbol)
+        side = params.get('side')
+        if side not in ('Buy', 'Sell'):
+            raise ExchangeError(10001, 'params error: side invalid')
+        try:
+            qty = float(params['qty'])
+            price = float(params.get('price') or 0)
+            trigger = float(params.get('triggerPrice') or 0)
+        except (KeyError, ValueError):
+            raise ExchangeError(10001, 'params error: qty or price invalid')
+        if qty < float(min_qty) or abs(round(qty / float(qty_step)) * float(qty_step) - qty) > 1e-9:
+            raise ExchangeError(10001, 'Qty invalid')
+        order_type = params.get('orderType', 'Market')
+
+        with self.__lock:
+            margin_price = price or trigger or self.market.price(symbol)
+            if not self.__reduces(account, symbol, side, qty) and \
+                    qty * margin_price / account.leverage.get(symbol, 10) > self.available(account):
+                raise ExchangeError(110007, 'ab not enough for new order')
+
+            order_id = f'{next(self.__ids):012d}'
+            created = str(now_ms())
+            order = {'category': 'linear', 'symbol': symbol, 'orderId': order_id, 'orderLinkId': params.get('orderLinkId', ''),
+                     'side': side, 'orderType': order_type, 'price': fmt(price), 'qty': fmt(qty), 'leavesQty': fmt(qty),
+                     'cumExecQty': '0', 'cumExecValue': '0', 'cumExecFee': '0', 'avgPrice': '',
+                     'orderStatus': 'Untriggered' if trigger else 'New', 'rejectReason': 'EC_NoError',
+                     'triggerPrice': fmt(trigger) if trigger else '', 'triggerDirection': int(params.get('triggerDirection', 0)),
+                     'stopOrderType': 'Stop' if trigger else '', 'takeProfit': params.get('takeProfit', ''),
+                     'stopLoss': params.get('stopLoss', ''), 'timeInForce': 'IOC' if order_type == 'Market' else 'GTC',
+                     'positionIdx': 0, 'createdTime': created, 'updatedTime': created}
+            self.orders_placed += 1
+            account.orders[order_id] = order
+            self.__book.setdefault(symbol, {})[order_id] = (account, order)
+            self.__publish(account.api, 'order', [dict(order)])
+            self.__match(account, order, self.market.price(symbol), resting=False)
+        return {'orderId': order_id, 'orderLinkId': order['orderLinkId']}
+
+    def __reduces(self, account, symbol, side, qty):
+        size = account.positions.get(symbol, {}).get('size', 0)
+        return (size > 0 and side == 'Sell' or size < 0 and side == 'Buy') and qty <= abs(size)
+
+    def cancel_order(self, account, symbol, order_id):
+        with self.__lock:
+            order = account.orders.get(order_id)
+            if order == None or order['symbol'] != symbol:
+                raise ExchangeError(110001, 'order not exists or too late to cancel')
+            self.__close_order(account, order, 'Cancelled')
+        return {'orderId': order_id, 'orderLinkId': order['orderLinkId']}
+
+    def cancel_all(self, account, symbol=None):
+        with self.__lock:
+            orders = [order for order in account.orders.values() if symbol == None or order['symbol'] == symbol]
+            for order in orders:
+                self.__close_order(account, order, 'Cancelled')
+        return [{'orderId': order['orderId'], 'orderLinkId': order['orderLinkId']} for order in orders]
+
+    def __close_order(self, account, order, status):
+        order['orderStatus'] = status
+        order['updatedTime'] = str(now_ms())
+        account.orders.pop(order['orderId'], None)
+        self.__book.get(order['symbol'], {}).pop(order['orderId'], None)
+        self.__publish(account.api, 'order', [dict(order)])
+
+    # Trigger / fill of one order at the current price. resting=False - the order is being placed (taker)
+    def __match(self, account, order, price, resting=True):
+        if order['orderStatus'] == 'Untriggered':
+            trigger = float(order['triggerPrice'])
+            rising = order['triggerDirection'] == 1
+            if rising and price < trigger or not rising and price > trigger:
+                return
+            order['orderStatus'] = 'New'
+            order['stopOrderType'] = ''
+            self.__publish(account.api, 'order', [dict(order)])
+            resting = False # сработавший условный ордер исполняется как taker
+
+        limit = float(order['price'])
+        if order['orderType'] == 'Market' or limit == 0:
+            self.__fill(account, order, price, maker=False)
+        elif order['side'] == 'Buy' and price <= limit or order['side'] == 'Sell' and price >= limit:
+            # маркетабельный лимитный ордер при выставлении берет рынок по текущей цене, не хуже лимита
+            self.__fill(account, order, limit if resting else price, maker=resting)
+
+    def __fill(self, account, order, price, maker):
+        symbol = order['symbol']
+        qty = float(order['leavesQty'])
+        signed = qty if order['side'] == 'Buy' else -qty
+        fee = qty * price * (self.maker_fee if maker else self.taker_fee)
+
+        pos = account.positions.get(symbol)
+        size = pos['size'] if pos != None else 0
+        closed = 0
+        if size != 0 and (size > 0) != (signed > 0):
+            closed = min(abs(size), qty)
+            pnl = (price - pos['avgPrice']) * closed * (1 if size > 0 else -1)
+            account.balance += pnl
+            account.closed_pnl.appendleft({'symbol': symbol, 'orderId': order['orderId'], 'side': order['side'],
+                                           'qty': fmt(closed), 'avgEntryPrice': fmt(pos['avgPrice']), 'avgExitPrice': fmt(price),
+                                           'closedPnl': fmt(pnl - fee), 'orderType': order['orderType'],
+                                           'leverage': fmt(account.leverage.get(symbol, 10)), 'createdTime': str(now_ms()),
+                                           'updatedTime': str(now_ms())})
+        new_size = round(size + signed, 10)
+        if new_size == 0:
+            account.positions.pop(symbol, None)
+        elif size == 0 or (size > 0) != (new_size > 0):
+            account.positions[symbol] = {'size': new_size, 'avgPrice': price, 'takeProfit': 0, 'stopLoss': 0}
+        elif abs(new_size) > abs(size):
+            pos['avgPrice'] = (pos['avgPrice'] * abs(size) + price * qty) / abs(new_size)
+            pos['size'] = new_size
+        else:
+            pos['size'] = new_size
+        account.balance -= fee
+
+        pos = account.positions.get(symbol)
+        if pos != None and (order['takeProfit'] or order['stopLoss']):
+            pos['takeProfit'] = float(order['takeProfit'] or 0)
+            pos['stopLoss'] = float(order['stopLoss'] or 0)
+        if pos != None and (pos['takeProfit'] or pos['stopLoss']):
+            self.__protected.setdefault(symbol, {})[account.api] = account
+        else:
+            self.__protected.get(symbol, {}).pop(account.api, None)
+
+        order.update({'cumExecQty': order['qty'], 'cumExecValue': fmt(qty * price), 'cumExecFee': fmt(fee),
+                      'avgPrice': fmt(price), 'leavesQty': '0'})
+        self.__close_order(account, order, 'Filled')
+        self.fills += 1
+        self.__publish(account.api, 'execution', [{'category': 'linear', 'symbol': symbol, 'orderId': order['orderId'],
+                                                   'execId': f'{order["orderId"]}-1', 'side': order['side'],
+                                                   'orderType': order['orderType'], 'execType': 'Trade',
+                                                   'execPrice': fmt(price), 'execQty': fmt(qty), 'execValue': fmt(qty * price),
+                                                   'execFee': fmt(fee), 'feeRate': fmt(self.maker_fee if maker else self.taker_fee),
+                                                   'isMaker': maker, 'closedSize': fmt(closed), 'execTime': str(now_ms())}])
+        self.__publish(account.api, 'position', [self.position(account, symbol)])
+        self.__publish(account.api, 'wallet', [self.wallet(account)])
+
+    # New prices: triggers, resting limit orders and TP/SL of positions
+    def on_prices(self, symbols):
+        with self.__lock:
+            for symbol in symbols:
+                price = self.market.price(symbol)
+                for account, order in list(self.__book.get(symbol, {}).values()):
+                    if order['orderId'] in account.orders:
+                        self.__match(account, order, price)
+                for account in list(self.__protected.get(symbol, {}).values()):
+                    pos = account.positions.get(symbol)
+                    if pos == None:
+                        continue
+                    long = pos['size'] > 0
+                    hit_tp = pos['takeProfit'] and (price >= pos['takeProfit'] if long else price <= pos['takeProfit'])
+                    hit_sl = pos['stopLoss'] and (price <= pos['stopLoss'] if long else price >= pos['stopLoss'])
+                    if hit_tp or hit_sl:
+                        self.__close_position(account, symbol, 'TakeProfit' if hit_tp else 'StopLoss')
+
+    def __close_position(self, account, symbol, stop_type):
+        pos = account.positions[symbol]
+        order_id = f'{next(self.__ids):012d}'
+        created = str(now_ms())
+        order = {'category': 'linear', 'symbol': symbol, 'orderId': order_id, 'orderLinkId': '',
+                 'side': 'Sell' if pos['size'] > 0 else 'Buy', 'orderType': 'Market', 'price': '0',
+                 'qty': fmt(abs(pos['size'])), 'leavesQty': fmt(abs(pos['size'])), 'cumExecQty': '0', 'cumExecValue': '0',
+                 'cumExecFee': '0', 'avgPrice': '', 'orderStatus': 'New', 'rejectReason': 'EC_NoError', 'triggerPrice': '',
+                 'triggerDirection': 0, 'stopOrderType': stop_type, 'takeProfit': '', 'stopLoss': '', 'timeInForce': 'IOC',
+                 'positionIdx': 0, 'createdTime': created, 'updatedTime': created}
+        account.orders[order_id] = order
+        self.__fill(account, order, self.market.price(symbol), maker=False)
+
+    def fee_rate(self, symbol):
+        return {'symbol': symbol, 'takerFeeRate': fmt(self.taker_fee), 'makerFeeRate': fmt(self.maker_fee)}
+
+    def stats(self):
+        with self.__lock:
+            return {'accounts': len(self.accounts), 'orders_placed': self.orders_placed, 'fills': self.fills,
+                    'open_orders': sum(len(book) for book in self.__book.values())}
@@ -0,0 +1,104 @@
+import numpy as np
+
+# Рынок mock-биржи: цены инструментов - случайное блуждание, история - минутные свечи,
+# остальные таймфреймы собираются из минуток при запросе
+
+INTERVAL_MS = {'1': 60_000, '3': 180_000, '5': 300_000, '15': 900_000, '30': 1_800_000, '60': 3_600_000,
+               '120': 7_200_000, '240': 14_400_000, '360': 21_600_000, '720': 43_200_000, 'D': 86_400_000}
+
+# symbol -> (start price, tickSize, qtyStep, minOrderQty, maxLeverage)
+DEFAULT_INSTRUMENTS = {
+    'BTCUSDT': (60000, '0.1', '0.001', '0.001', '100'),
+    'ETHUSDT': (3000, '0.01', '0.01', '0.01', '100'),
+    'BNBUSDT': (600, '0.01', '0.01', '0.01', '75'),
+    'SOLUSDT': (150, '0.01', '0.1', '0.1', '75'),
+    'XRPUSDT': (0.5, '0.0001', '1', '1', '75')
+}
+
+class Market:
+    def __init__(self, now_ms, instruments=DEFAULT_INSTRUMENTS, history_days=30, volatility=0.001, seed=None):
+        self.__rng = np.random.default_rng(seed)
+        self.__volatility = volatility # стандартное отклонение доходности за минуту
+        self.instruments = instruments
+        self.__candles = {} # symbol -> (capacity, 7) float64, последняя строка - незакрытая свеча
+        self.__length = {}
+        minute = now_ms - now_ms % 60_000
+        history = history_days * 1440
+        for symbol, (price, tick, *_) in instruments.items():
+            self.__candles[symbol], self.__length[symbol] = self.__history(price, float(tick), minute, history)
+
+    # Random walk ending at the start price: rows [Time, Open, High, Low, Close, Volume, Turnover], last - live candle
+    def __history(self, price, tick, minute, history):
+        returns = self.__rng.normal(0, self.__volatility, history)
+        path = returns.cumsum()
+        close = price * np.exp(path - path[-1])
+        open_ = np.r_[close[0], close[:-1]]
+        noise = np.abs(self.__rng.normal(0, self.__volatility / 2, (2, history))) * close
+        rows = np.empty((history * 2, 7))
+        rows[:history, 0] = minute - np.arange(history - 1, -1, -1) * 60_000
+        rows[:history, 1] = open_
+        rows[:history, 2] = np.maximum(open_, close) + noise[0]
+        rows[:history, 3] = np.maximum(np.minimum(open_, close) - noise[1], tick)
+        rows[:history, 4] = close
+        rows[:history, 5] = self.__rng.exponential(100, history)
+        rows[:history, 6] = rows[:history, 5] * close
+        rows[:history, 1:5] = np.round(rows[:history, 1:5] / tick) * tick
+        rows[history - 1, 1:5] = rows[history - 1, 1] # живая свеча только началась
+        rows[history - 1, 5:] = 0
+        return rows, history
+
+    def price(self, symbol):
+        return self.__candles[symbol][self.__length[symbol] - 1, 4]
+
+    # Advancing prices to now_ms. Returns {symbol: closed candle row or None}
+    def tick(self, now_ms, dt):
+        minute = now_ms - now_ms % 60_000
+        closed = {}
+        for symbol, candles in self.__candles.items():
+            tick = float(self.instruments[symbol][1])
+            length = self.__length[symbol]
+            live = candles[length - 1]
+            closed[symbol] = None
+            if minute > live[0]:
+                closed[symbol] = live.copy()
+                if length == len(candles):
+                    candles = self.__candles[symbol] = np.concatenate([candles, np.empty_like(candles)])
+                live = candles[length]
+                live[:] = [minute, closed[symbol][4], closed[symbol][4], closed[symbol][4], closed[symbol][4], 0, 0]
+                self.__length[symbol] = length + 1
+
+            step = self.__rng.normal(0, self.__volatility * np.sqrt(dt / 60))
+            price = max(round(live[4] * np.exp(step) / tick) * tick, tick)
+            volume = self.__rng.exponential(100 * dt / 60)
+            live[2] = max(live[2], price)
+            live[3] = min(live[3], price)
+            live[4] = price
+            live[5] += volume
+            live[6] += volume * price
+        return closed
+
+    # Candles of the interval (closed and live) as rows, oldest first
+    def klines(self, symbol, interval, start=None, end=None, limit=200):
+        step = INTERVAL_MS[interval]
+        candles = self.__candles[symbol][:self.__length[symbol]]
+        if end != None:
+            candles = candles[candles[:, 0] <= end]
+        if start != None:
+            candles = candles[candles[:, 0] >= start - start % step]
+        candles = candles[-limit * (step // 60_000) - step // 60_000:] # с запасом на неполную первую свечу
+        if len(candles) == 0:
+            return candles
+
+        keys = candles[:, 0] - candles[:, 0] % step
+        first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        rows = np.empty((len(first), 7))
+        rows[:, 0] = keys[first]
+        rows[:, 1] = candles[first, 1]
+        rows[:, 2] = np.maximum.reduceat(candles[:, 2], first)
+        rows[:, 3] = np.minimum.reduceat(candles[:, 3], first)
+        rows[:, 4] = candles[np.r_[first[1:] - 1, len(candles) - 1], 4]
+        rows[:, 5] = np.add.reduceat(candles[:, 5], first)
+        rows[:, 6] = np.add.reduceat(candles[:, 6], first)
+        if start != None and rows[0, 0] < start:
+            rows = rows[1:]
+        return rows[-limit:]
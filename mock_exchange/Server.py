@@ -0,0 +1,406 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+from collections import defaultdict, deque
+from itertools import count
+from time import time, time_ns, perf_counter
+import numpy as np
+from aiohttp import web, WSMsgType
+from mock_exchange.Market import Market, INTERVAL_MS
+from mock_exchange.Engine import MatchingEngine, ExchangeError, fmt, now_ms
+
+# Локальная mock-биржа Bybit v5 на aiohttp: REST эндпоинты, которыми пользуется BybitHelper,
+# публичный kline и приватные order / position / execution / wallet WebSocket топики.
+# Задержка ответа и доля ошибок (10016) и лимитов (10006) задаются параметрами - для нагрузочных тестов без биржи.
+#
+# python -m mock_exchange.Server --users 1000 --latency-ms 20 --jitter-ms 10 --error-rate 0.01
+# BYBIT_REST_URL=http://127.0.0.1:8080 BYBIT_WS_URL=ws://127.0.0.1:8080 python main.py
+
+PRIVATE_TOPICS = ('order', 'position', 'execution', 'wallet')
+SUBSCRIBE_ACK_DELAY = 0.02 # секунд
+TICKER_KEY = web.AppKey('ticker', asyncio.Task) # фоновая задача движения цен
+
+# API key and secret of the i-th simulated user
+def user_keys(i):
+    return f'mock-key-{i}', f'mock-secret-{i}'
+
+def ok(result, ext=None):
+    return web.json_response({'retCode': 0, 'retMsg': 'OK', 'result': result, 'retExtInfo': ext or {}, 'time': now_ms()})
+
+def error(code, message, headers=None):
+    return web.json_response({'retCode': code, 'retMsg': message, 'result': {}, 'retExtInfo': {}, 'time': now_ms()},
+                             headers=headers)
+
+def percentiles(values):
+    values = np.array(values) * 1000
+    if len(values) == 0:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    return {f'p{q}': float(np.percentile(values, q)) for q in (50, 95, 99)}
+
+
+# WebSocket client: messages go through its own queue, so a slow reader does not block the exchange
+class Connection:
+    def __init__(self, ws):
+        self.ws = ws
+        self.queue = asyncio.Queue()
+        self.api = None
+        self.topics = set()
+
+    def send(self, message):
+        self.queue.put_nowait(json.dumps(message))
+
+    async def writer(self):
+        while True:
+            message = await self.queue.get()
+            await self.ws.send_str(message)
+
+
+class MockExchange:
+    def __init__(self, users=100, latency_ms=0, jitter_ms=0, error_rate=0, rate_limit_rate=0, tick_interval=0.25, seed=None):
+        self.market = Market(now_ms(), seed=seed)
+        self.engine = MatchingEngine(self.market, publish=self.__publish)
+        for i in range(users):
+            self.engine.add_account(*user_keys(i))
+        self.__rng = random.Random(seed)
+        self.__latency_ms = latency_ms
+        self.__jitter_ms = jitter_ms
+        self.__error_rate = error_rate
+        self.__rate_limit_rate = rate_limit_rate
+        self.__tick_interval = tick_interval
+        self.__private = defaultdict(set) # api -> connections
+        self.__public = defaultdict(set) # topic -> connections
+        self.__conn_ids = count(1)
+        self.__handling = deque(maxlen=10000) # секунды обработки запросов
+        self.__order_times = deque(maxlen=100000) # (ms прихода ордера на биржу, api)
+        self.requests = 0
+        self.injected_errors = 0
+        self.injected_rate_limits = 0
+
+    # --- middleware: latency / error injection and auth ---
+
+    @web.middleware
+    async def __middleware(self, request, handler):
+        if not request.path.startswith('/v5/') or request.headers.get('Upgrade', '').lower() == 'websocket':
+            return await handler(request)
+
+        self.requests += 1
+        start = perf_counter()
+        if self.__latency_ms or self.__jitter_ms:
+            await asyncio.sleep(max(0, self.__rng.gauss(self.__latency_ms, self.__jitter_ms)) / 1000)
+        if self.__rng.random() < self.__rate_limit_rate:
+            self.injected_rate_limits += 1
+            return error(10006, 'Too many visits!', {'X-Bapi-Limit': '10', 'X-Bapi-Limit-Status': '0',
+                                                     'X-Bapi-Limit-Reset-Timestamp': str(now_ms() + 1000)})
+        if self.__rng.random() < self.__error_rate:
+            self.injected_errors += 1
+            return error(10016, 'Internal server error.')
+
+        if request.path in ('/v5/order/create', '/v5/order/create-batch'):
+            self.__order_times.append((now_ms(), request.headers.get('X-BAPI-API-KEY', '')))
+        try:
+            response = await handler(request)
+        except ExchangeError as err:
+            response = error(err.code, err.message)
+        self.__handling.append(perf_counter() - start)
+        return response
+
+    async def __account(self, request):
+        api = request.headers.get('X-BAPI-API-KEY')
+        account = self.engine.accounts.get(api)
+        if account == None:
+            raise ExchangeError(10003, 'API key is invalid.')
+        payload = request.query_string if request.method == 'GET' else await request.text()
+        timestamp = request.headers.get('X-BAPI-TIMESTAMP', '0')
+        recv_window = request.headers.get('X-BAPI-RECV-WINDOW', '5000')
+        sign = hmac.new(account.secret.encode('utf-8'), (timestamp + api + recv_window + payload).encode('utf-8'),
+                        hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(sign, request.headers.get('X-BAPI-SIGN', '')):
+            raise ExchangeError(10004, 'error sign! origin_string[' + timestamp + api + recv_window + payload + ']')
+        if abs(now_ms() - int(timestamp)) > int(recv_window):
+            raise ExchangeError(10002, 'invalid request, please check your server timestamp or recv_window param')
+        return account
+
+    @staticmethod
+    async def __body(request):
+        try:
+            return await request.json()
+        except ValueError:
+            raise ExchangeError(10001, 'params error: invalid json')
+
+    # --- market ---
+
+    async def server_time(self, request):
+        nano = time_ns()
+        return ok({'timeSecond': str(nano // 10**9), 'timeNano': str(nano)})
+
+    async def kline(self, request):
+        query = request.query
+        symbol, interval = query.get('symbol'), query.get('interval')
+        if symbol not in self.market.instruments or interval not in INTERVAL_MS:
+            raise ExchangeError(10001, 'params error: symbol or interval invalid')
+        rows = self.market.klines(symbol, interval, int(query['start']) if 'start' in query else None,
+                                  int(query['end']) if 'end' in query else None, min(int(query.get('limit', 200)), 1000))
+        return ok({'category': 'linear', 'symbol': symbol,
+                   'list': [[str(int(row[0]))] + [fmt(value) for value in row[1:]] for row in rows[::-1]]})
+
+    async def tickers(self, request):
+        symbols = [request.query['symbol']] if 'symbol' in request.query else list(self.market.instruments)
+        result = []
+        for symbol in symbols:
+            if symbol not in self.market.instruments:
+                raise ExchangeError(10001, 'params error: symbol invalid')
+            price = fmt(self.market.price(symbol))
+            result.append({'symbol': symbol, 'lastPrice': price, 'markPrice': price, 'indexPrice': price,
+                           'bid1Price': price, 'ask1Price': price})
+        return ok({'category': 'linear', 'list': result})
+
+    async def instruments_info(self, request):
+        symbols = [request.query['symbol']] if 'symbol' in request.query else list(self.market.instruments)
+        result = []
+        for symbol in symbols:
+            if symbol not in self.market.instruments:
+                raise ExchangeError(10001, 'params error: symbol invalid')
+            _, tick, qty_step, min_qty, max_leverage = self.market.instruments[symbol]
+            result.append({'symbol': symbol, 'contractType': 'LinearPerpetual', 'status': 'Trading',
+                           'baseCoin': symbol[:-4], 'quoteCoin': 'USDT', 'settleCoin': 'USDT',
+                           'priceFilter': {'tickSize': tick, 'minPrice': tick, 'maxPrice': '1999999'},
+                           'lotSizeFilter': {'qtyStep': qty_step, 'minOrderQty': min_qty, 'maxOrderQty': '1000000'},
+                           'leverageFilter': {'minLeverage': '1', 'maxLeverage': max_leverage, 'leverageStep': '0.01'}})
+        return ok({'category': 'linear', 'list': result, 'nextPageCursor': ''})
+
+    # --- account ---
+
+    async def wallet_balance(self, request):
+        return ok({'list': [self.engine.wallet(await self.__account(request))]})
+
+    async def withdrawal(self, request):
+        available = fmt(self.engine.available(await self.__account(request)))
+        return ok({'availableWithdrawal': available, 'availableWithdrawalMap': {'USDT': available}})
+
+    async def fee_rate(self, request):
+        await self.__account(request)
+        symbols = [request.query['symbol']] if 'symbol' in request.query else list(self.market.instruments)
+        return ok({'list': [self.engine.fee_rate(symbol) for symbol in symbols]})
+
+    async def position_list(self, request):
+        account = await self.__account(request)
+        return ok({'category': 'linear', 'list': self.engine.positions(account, request.query.get('symbol')), 'nextPageCursor': ''})
+
+    async def closed_pnl(self, request):
+        account = await self.__account(request)
+        limit = min(int(request.query.get('limit', 50)), 100)
+        return ok({'category': 'linear', 'list': list(account.closed_pnl)[:limit], 'nextPageCursor': ''})
+
+    async def open_orders(self, request):
+        account = await self.__account(request)
+        return ok({'category': 'linear', 'list': self.engine.open_orders(account, request.query.get('symbol')),
+                   'nextPageCursor': ''})
+
+    # --- trading ---
+
+    async def create_order(self, request):
+        account = await self.__account(request)
+        return ok(self.engine.place_order(account, await self.__body(request)))
+
+    async def create_batch(self, request):
+        account = await self.__account(request)
+        placed, statuses = [], []
+        for params in (await self.__body(request)).get('request', []):
+            try:
+                result = self.engine.place_order(account, params)
+                statuses.append({'code': 0, 'msg': 'OK'})
+            except ExchangeError as err:
+                result = {'orderId': '', 'orderLinkId': ''}
+                statuses.append({'code': err.code, 'msg': err.message})
+            placed.append({'category': 'linear', 'symbol': params.get('symbol', ''), 'createAt': str(now_ms()), **result})
+        return ok({'list': placed}, {'list': statuses})
+
+    async def cancel_order(self, request):
+        account = await self.__account(request)
+        body = await self.__body(request)
+        return ok(self.engine.cancel_order(account, body.get('symbol'), body.get('orderId')))
+
+    async def cancel_all(self, request):
+        account = await self.__account(request)
+        body = await self.__body(request)
+        return ok({'list': self.engine.cancel_all(account, body.get('symbol')), 'success': '1'})
+
+    async def set_leverage(self, request):
+        account = await self.__account(request)
+        body = await self.__body(request)
+        self.engine.set_leverage(account, body.get('symbol'), float(body.get('buyLeverage', 0)))
+        return ok({})
+
+    async def switch_isolated(self, request):
+        account = await self.__account(request)
+        body = await self.__body(request)
+        self.engine.switch_mode(account, body.get('symbol'), int(body.get('tradeMode', 0)), float(body.get('buyLeverage', 0)))
+        return ok({})
+
+    # --- WebSocket ---
+
+    def __publish(self, api, topic, data):
+        message = {'id': f'{api}-{now_ms()}', 'topic': topic, 'creationTime': now_ms(), 'data': data}
+        for connection in self.__private.get(api, ()):
+            if topic in connection.topics:
+                connection.send(message)
+
+    async def __serve(self, request, private):
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        connection = Connection(ws)
+        conn_id = str(next(self.__conn_ids))
+        writer = asyncio.create_task(connection.writer())
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                message = json.loads(msg.data)
+                op = message.get('op')
+                if op == 'ping':
+                    connection.send({'success': True, 'ret_msg': 'pong', 'conn_id': conn_id, 'op': 'pong'})
+                elif op == 'auth' and private:
+                    success = self.__ws_auth(connection, message.get('args', []))
+                    connection.send({'success': success, 'ret_msg': '' if success else 'Invalid apikey', 'op': 'auth',
+                                     'conn_id': conn_id})
+                elif op == 'subscribe':
+                    self.__ws_subscribe(connection, message.get('args', []), private)
+                    # pybit запоминает req_id уже после отправки: мгновенный ответ с localhost он не узнает и рвет сокет
+                    await asyncio.sleep(SUBSCRIBE_ACK_DELAY)
+                    connection.send({'success': True, 'ret_msg': '', 'conn_id': conn_id, 'req_id': message.get('req_id', ''),
+                                     'op': 'subscribe'})
+        finally:
+            writer.cancel()
+            if connection.api != None:
+                self.__private[connection.api].discard(connection)
+            for topic in connection.topics:
+                self.__public.get(topic, set()).discard(connection)
+        return ws
+
+    def __ws_auth(self, connection, args):
+        if len(args) != 3 or args[0] not in self.engine.accounts:
+            return False
+        api, expires, signature = args
+        expected = hmac.new(self.engine.accounts[api].secret.encode('utf-8'), f'GET/realtime{expires}'.encode('utf-8'),
+                            hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, signature):
+            return False
+        connection.api = api
+        self.__private[api].add(connection)
+        return True
+
+    def __ws_subscribe(self, connection, topics, private):
+        for topic in topics:
+            connection.topics.add(topic)
+            if not private:
+                self.__public[topic].add(connection)
+
+    async def public_ws(self, request):
+        return await self.__serve(request, private=False)
+
+    async def private_ws(self, request):
+        return await self.__serve(request, private=True)
+
+    # Moving prices, matching orders and pushing klines
+    async def __ticker(self):
+        last = time()
+        while True:
+            await asyncio.sleep(self.__tick_interval)
+            now = time()
+            closed = self.market.tick(int(now * 1000), now - last)
+            last = now
+            self.engine.on_prices(list(closed))
+            for topic, connections in list(self.__public.items()):
+                if not connections or not topic.startswith('kline.'):
+                    continue
+                _, interval, symbol = topic.split('.')
+                if symbol not in self.market.instruments or interval not in INTERVAL_MS:
+                    continue
+                rows = self.market.klines(symbol, interval, limit=2)
+                data = []
+                if closed[symbol] is not None and rows[-1, 0] == closed[symbol][0] + 60_000 and len(rows) > 1:
+                    data.append(self.__kline(rows[-2], interval, True)) # закрылась свеча этого таймфрейма
+                data.append(self.__kline(rows[-1], interval, False))
+                message = {'topic': topic, 'data': data, 'ts': now_ms(), 'type': 'snapshot'}
+                for connection in connections:
+                    connection.send(message)
+
+    @staticmethod
+    def __kline(row, interval, confirm):
+        start = int(row[0])
+        return {'start': start, 'end': start + INTERVAL_MS[interval] - 1, 'interval': interval, 'open': fmt(row[1]),
+                'high': fmt(row[2]), 'low': fmt(row[3]), 'close': fmt(row[4]), 'volume': fmt(row[5]), 'turnover': fmt(row[6]),
+                'confirm': confirm, 'timestamp': now_ms()}
+
+    async def stats(self, request):
+        return web.json_response({
+            'requests': self.requests,
+            'injected_errors': self.injected_errors,
+            'injected_rate_limits': self.injected_rate_limits,
+            'handling_ms': percentiles(self.__handling),
+            'private_connections': sum(len(connections) for connections in self.__private.values()),
+            'public_connections': len({connection for connections in self.__public.values() for connection in connections}),
+            **self.engine.stats()
+        })
+
+    # Arrival times of order requests since ?since=ms (for candle-close latency in loadtest)
+    async def order_times(self, request):
+        since = int(request.query.get('since', 0))
+        return web.json_response({'list': [[ms, api] for ms, api in self.__order_times if ms >= since]})
+
+    def app(self):
+        app = web.Application(middlewares=[self.__middleware])
+        app.add_routes([
+            web.get('/v5/market/time', self.server_time),
+            web.get('/v5/market/kline', self.kline),
+            web.get('/v5/market/tickers', self.tickers),
+            web.get('/v5/market/instruments-info', self.instruments_info),
+            web.get('/v5/account/wallet-balance', self.wallet_balance),
+            web.get('/v5/account/withdrawal', self.withdrawal),
+            web.get('/v5/account/fee-rate', self.fee_rate),
+            web.get('/v5/position/list', self.position_list),
+            web.get('/v5/position/closed-pnl', self.closed_pnl),
+            web.get('/v5/order/realtime', self.open_orders),
+            web.post('/v5/order/create', self.create_order),
+            web.post('/v5/order/create-batch', self.create_batch),
+            web.post('/v5/order/cancel', self.cancel_order),
+            web.post('/v5/order/cancel-all', self.cancel_all),
+            web.post('/v5/position/set-leverage', self.set_leverage),
+            web.post('/v5/position/switch-isolated', self.switch_isolated),
+            web.get('/v5/public/linear', self.public_ws),
+            web.get('/v5/private', self.private_ws),
+            web.get('/mock/stats', self.stats),
+            web.get('/mock/orders', self.order_times)
+        ])
+
+        async def start_ticker(app):
+            app[TICKER_KEY] = asyncio.create_task(self.__ticker())
+
+        async def stop_ticker(app):
+            app[TICKER_KEY].cancel()
+
+        app.on_startup.append(start_ticker)
+        app.on_cleanup.append(stop_ticker)
+        return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local mock of Bybit v5 REST and WebSocket API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--users', type=int, default=100, help='accounts mock-key-<i> / mock-secret-<i>')
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0, help='share of REST requests answered with 10016')
+    parser.add_argument('--rate-limit-rate', type=float, default=0, help='share of REST requests answered with 10006')
+    parser.add_argument('--tick-interval', type=float, default=0.25, help='seconds between price updates')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    exchange = MockExchange(args.users, args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate,
+                            args.tick_interval, args.seed)
+    print(f'BYBIT_REST_URL=http://{args.host}:{args.port} BYBIT_WS_URL=ws://{args.host}:{args.port}')
+    web.run_app(exchange.app(), host=args.host, port=args.port, print=None)
@@ -0,0 +1,25 @@
+import pytest
+from mock_exchange.Market import Market
+from mock_exchange.Engine import MatchingEngine, now_ms
+
+@pytest.fixture
+def engine():
+    engine = MatchingEngine(Market(now_ms(), history_days=1, seed=1), balance=100_000)
+    engine.add_account('key', 'secret')
+    return engine
+
+def test_marketable_limit_order_fills_at_market_price(engine):
+    account = engine.accounts['key']
+    price = engine.market.price('BTCUSDT')
+    engine.place_order(account, {'symbol': 'BTCUSDT', 'side': 'Buy', 'orderType': 'Limit', 'qty': '0.01',
+                                 'price': str(round(price * 1.05, 1))})
+    assert engine.open_orders(account) == []
+    assert account.positions['BTCUSDT']['avgPrice'] == price # не по лимиту на 5% выше рынка
+
+def test_passive_limit_order_rests_in_the_book(engine):
+    account = engine.accounts['key']
+    price = engine.market.price('BTCUSDT')
+    engine.place_order(account, {'symbol': 'BTCUSDT', 'side': 'Buy', 'orderType': 'Limit', 'qty': '0.01',
+                                 'price': str(round(price * 0.95, 1))})
+    assert [order['orderStatus'] for order in engine.open_orders(account)] == ['New']
+    assert 'BTCUSDT' not in account.positions
@@ -0,0 +1,307 @@
+from collections import deque
+import sys
+import numpy as np
+import pandas as pd
+
+# Потоковые индикаторы: состояние обновляется за O(1) на каждую новую закрытую свечу.
+# Формулы повторяют pandas_ta 0.3.14b0, который используют стратегии:
+# ema - с SMA-затравкой и adjust=False, rsi - через rma (ewm adjust=True), stoch - через sma, adosc - ema от ad
+
+# Скользящее среднее по окну length (pandas rolling(length).mean())
+class SMA:
+    def __init__(self, length):
+        self.length = length
+        self.window = deque(maxlen=length)
+        self.total = 0.0
+        self.value = np.nan
+
+    def update(self, x):
+        if len(self.window) == self.length:
+            self.total -= self.window[0]
+        self.window.append(x)
+        self.total += x
+        if len(self.window) == self.length:
+            self.value = self.total / self.length
+        return self.value
+
+    def state(self):
+        return {'length': self.length, 'window': list(self.window), 'total': self.total, 'value': self.value}
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls(state['length'])
+        obj.window.extend(state['window'])
+        obj.total = state['total']
+        obj.value = state['value']
+        return obj
+
+
+# ta.ema: первые length значений - SMA затравка, дальше ewm(span=length, adjust=False)
+class EMA:
+    def __init__(self, length=10):
+        self.length = length
+        self.alpha = 2 / (length + 1)
+        self.count = 0
+        self.total = 0.0
+        self.value = np.nan
+
+    def update(self, x):
+        self.count += 1
+        if self.count < self.length:
+            self.total += x
+        elif self.count == self.length:
+            self.total += x
+            self.value = self.total / self.length
+        else:
+            self.value = self.alpha * x + (1 - self.alpha) * self.value
+        return self.value
+
+    def update_candle(self, candle):
+        return self.update(candle.Close)
+
+    def state(self):
+        return {'length': self.length, 'count': self.count, 'total': self.total, 'value': self.value}
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls(state['length'])
+        obj.count = state['count']
+        obj.total = state['total']
+        obj.value = state['value']
+        return obj
+
+
+# ta.rma: ewm(alpha=1/length, min_periods=length) с adjust=True - храним числитель и знаменатель весов
+class RMA:
+    def __init__(self, length=14):
+        self.length = length
+        self.decay = 1 - 1 / length
+        self.count = 0
+        self.numerator = 0.0
+        self.denominator = 0.0
+        self.value = np.nan
+
+    def update(self, x):
+        self.count += 1
+        self.numerator = x + self.decay * self.numerator
+        self.denominator = 1 + self.decay * self.denominator
+        if self.count >= self.length:
+            self.value = self.numerator / self.denominator
+        return self.value
+
+    def state(self):
+        return {'length': self.length, 'count': self.count, 'numerator': self.numerator,
+                'denominator': self.denominator, 'value': self.value}
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls(state['length'])
+        obj.count = state['count']
+        obj.numerator = state['numerator']
+        obj.denominator = state['denominator']
+        obj.value = state['value']
+        return obj
+
+
+# ta.rsi(close, length)
+class RSI:
+    def __init__(self, length=14):
+        self.length = length
+        self.prev_close = None
+        self.positive = RMA(length)
+        self.negative = RMA(length)
+        self.value = np.nan
+
+    def update(self, close):
+        if self.prev_close == None:
+            self.prev_close = close
+            return self.value
+
+        diff = close - self.prev_close
+        self.prev_close = close
+        positive_avg = self.positive.update(max(diff, 0.0))
+        negative_avg = abs(self.negative.update(min(diff, 0.0)))
+        if self.positive.count >= self.length:
+            total = positive_avg + negative_avg
+            self.value = 100 * positive_avg / total if total != 0 else np.nan
+        return self.value
+
+    def update_candle(self, candle):
+        return self.update(candle.Close)
+
+    def state(self):
+        return {'length': self.length, 'prev_close': self.prev_close, 'positive': self.positive.state(),
+                'negative': self.negative.state(), 'value': self.value}
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls(state['length'])
+        obj.prev_close = state['prev_close']
+        obj.positive = RMA.from_state(state['positive'])
+        obj.negative = RMA.from_state(state['negative'])
+        obj.value = state['value']
+        return obj
+
+
+# Минимум/максимум в скользящем окне на монотонной очереди (амортизированно O(1))
+class RollingExtremum:
+    def __init__(self, length, maximum=False):
+        self.length = length
+        self.maximum = maximum
+        self.count = 0
+        self.queue = deque() # пары (номер свечи, значение)
+
+    def update(self, x):
+        while self.queue and (self.queue[-1][1] <= x if self.maximum else self.queue[-1][1] >= x):
+            self.queue.pop()
+        self.queue.append((self.count, x))
+        if self.queue[0][0] <= self.count - self.length:
+            self.queue.popleft()
+        self.count += 1
+        if self.count < self.length:
+            return np.nan
+        return self.queue[0][1]
+
+    def state(self):
+        return {'length': self.length, 'maximum': self.maximum, 'count': self.count,
+                'queue': [list(item) for item in self.queue]}
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls(state['length'], state['maximum'])
+        obj.count = state['count']
+        obj.queue.extend(tuple(item) for item in state['queue'])
+        return obj
+
+
+# ta.stoch(high, low, close, k, d, smooth_k) -> (STOCHk, STOCHd)
+class Stochastic:
+    def __init__(self, k=14, d=3, smooth_k=3):
+        self.k = k
+        self.d = d
+        self.smooth_k = smooth_k
+        self.lowest = RollingExtremum(k)
+        self.highest = RollingExtremum(k, maximum=True)
+        self.stoch_k = SMA(smooth_k)
+        self.stoch_d = SMA(d)
+        self.value = (np.nan, np.nan)
+
+    def update(self, high, low, close):
+        lowest_low = self.lowest.update(low)
+        highest_high = self.highest.update(high)
+        if np.isnan(lowest_low):
+            return self.value
+
+        price_range = highest_high - lowest_low
+        if price_range == 0:
+            price_range = sys.float_info.epsilon # как non_zero_range в pandas_ta
+        stoch_k = self.stoch_k.update(100 * (close - lowest_low) / price_range)
+        stoch_d = self.stoch_d.update(stoch_k) if not np.isnan(stoch_k) else np.nan
+        self.value = (stoch_k, stoch_d)
+        return self.value
+
+    def update_candle(self, candle):
+        return self.update(candle.High, candle.Low, candle.Close)
+
+    def state(self):
+        return {'k': self.k, 'd': self.d, 'smooth_k': self.smooth_k, 'lowest': self.lowest.state(),
+                'highest': self.highest.state(), 'stoch_k': self.stoch_k.state(), 'stoch_d': self.stoch_d.state(),
+                'value': list(self.value)}
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls(state['k'], state['d'], state['smooth_k'])
+        obj.lowest = RollingExtremum.from_state(state['lowest'])
+        obj.highest = RollingExtremum.from_state(state['highest'])
+        obj.stoch_k = SMA.from_state(state['stoch_k'])
+        obj.stoch_d = SMA.from_state(state['stoch_d'])
+        obj.value = tuple(state['value'])
+        return obj
+
+
+# ta.adosc(high, low, close, volume, fast, slow): ema(fast) - ema(slow) от линии накопления/распределения
+class ADOSC:
+    def __init__(self, fast=3, slow=10):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.ad = 0.0
+        self.value = np.nan
+
+    def update(self, high, low, close, volume):
+        price_range = high - low
+        if price_range == 0:
+            price_range = sys.float_info.epsilon
+        self.ad += (2 * close - (high + low)) * volume / price_range
+        self.value = self.fast.update(self.ad) - self.slow.update(self.ad)
+        return self.value
+
+    def update_candle(self, candle):
+        return self.update(candle.High, candle.Low, candle.Close, candle.Volume)
+
+    def state(self):
+        return {'fast': self.fast.state(), 'slow': self.slow.state(), 'ad': self.ad, 'value': self.value}
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls()
+        obj.fast = EMA.from_state(state['fast'])
+        obj.slow = EMA.from_state(state['slow'])
+        obj.ad = state['ad']
+        obj.value = state['value']
+        return obj
+
+
+INDICATOR_TYPES = {'EMA': EMA, 'RSI': RSI, 'Stochastic': Stochastic, 'ADOSC': ADOSC}
+
+# Набор индикаторов стратегии + история последних значений (чтобы читать их как Series от pandas_ta)
+class IndicatorSet:
+    def __init__(self, indicators, history=200):
+        self.indicators = indicators
+        self.history = history
+        self.__factories = {name: (type(ind), ind.state()) for name, ind in indicators.items()}
+        self.values = {name: deque(maxlen=history) for name in indicators}
+        self.last_time = None
+
+    def reset(self):
+        for name, (cls, state) in self.__factories.items():
+            self.indicators[name] = cls.from_state(state)
+            self.values[name].clear()
+        self.last_time = None
+
+    # Feeding closed candles newer than last_time. data - DataFrame like Bybit.klines()
+    def update(self, data):
+        if data.empty:
+            return
+        if self.last_time != None and self.last_time not in data.index:
+            self.reset() # разрыв - считаем заново по всему окну
+
+        new_candles = data if self.last_time == None else data[data.index > self.last_time]
+        for candle in new_candles.itertuples():
+            for name, indicator in self.indicators.items():
+                self.values[name].append(indicator.update_candle(candle))
+        self.last_time = data.index[-1]
+
+    # Values aligned to index (NaN where history is shorter). Stochastic gives a DataFrame (k, d)
+    def series(self, name, index):
+        values = np.array(self.values[name], dtype=np.float64)[-len(index):]
+        pad = len(index) - len(values)
+        if values.ndim == 1:
+            return pd.Series(np.concatenate([np.full(pad, np.nan), values]), index=index)
+        values = np.vstack([np.full((pad, values.shape[1]), np.nan), values])
+        return pd.DataFrame(values, index=index)
+
+    def state(self):
+        return {
+            'history': self.history,
+            'last_time': None if self.last_time == None else int(self.last_time),
+            'indicators': {name: [type(ind).__name__, ind.state()] for name, ind in self.indicators.items()},
+            'values': {name: [list(v) if isinstance(v, tuple) else v for v in values] for name, values in self.values.items()}
+        }
+
+    # Warm start from state(), e.g. saved before restart
+    def load_state(self, state):
+        self.indicators = {name: INDICATOR_TYPES[cls_name].from_state(ind_state)
+                           for name, (cls_name, ind_state) in state['indicators'].items()}
+        self.values = {name: deque((tuple(v) if isinstance(v, list) else v for v in values), maxlen=self.history)
+                       for name, values in state['values'].items()}
+        self.last_time = state['last_time']
@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError, wait
+from threading import Lock
+from time import time
+from logs.logger import get_logger
+from bybit.ClockSync import clock_sync
+from market_data.KlineStream import candle_close
+
+# Параллельный запуск стратегий: ограниченный пул потоков,
+# для одного пользователя запуски идут строго по очереди
+class StrategyScheduler:
+    def __init__(self, max_workers=16):
+        self.__pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='strategy')
+        self.__lock = Lock()
+        self.__last_runs = {} # user_id -> Future последнего запуска
+        self.__logger = get_logger('scheduler')
+
+    # Returns finish time of execute()
+    def __run(self, user_id, strategy):
+        try:
+            strategy.execute()
+        except Exception as err:
+            print(err)
+            self.__logger.error(f'Error while executing strategy for user {user_id}: {err}')
+        return time()
+
+    # Resolving future like the pool future of the run
+    @staticmethod
+    def __chain(inner, future):
+        if inner.cancelled(): # пул остановлен с cancel_futures
+            future.set_exception(CancelledError())
+        elif inner.exception() != None:
+            future.set_exception(inner.exception())
+        else:
+            future.set_result(inner.result())
+
+    # Running strategy in the pool. pool.submit raises RuntimeError after shutdown - then the run fails, not the caller
+    def __start(self, user_id, strategy, future):
+        # running - отменить уже нельзя, иначе следующий запуск пользователя стартовал бы параллельно с этим
+        if not future.set_running_or_notify_cancel():
+            return # отменен, пока ждал предыдущий запуск
+        try:
+            inner = self.__pool.submit(self.__run, user_id, strategy)
+        except RuntimeError as err:
+            self.__logger.error(f'Cannot run strategy for user {user_id}: {err}')
+            future.set_exception(err)
+            return
+        inner.add_done_callback(lambda f: self.__chain(f, future))
+
+    def __submit(self, user_id, strategy):
+        future = Future()
+        with self.__lock:
+            prev = self.__last_runs.get(user_id)
+            self.__last_runs[user_id] = future
+        if prev == None or prev.done():
+            self.__start(user_id, strategy, future)
+        else:
+            # Предыдущий запуск еще идет - ставим следующий за ним, не занимая поток ожиданием
+            prev.add_done_callback(lambda _: self.__start(user_id, strategy, future))
+        return future
+
+    # Running all strategies of the tick and waiting until deadline (unix time).
+    # strategies: iterable of (user_id, strategy)
+    def run_tick(self, strategies, deadline):
+        started = time()
+        futures = [self.__submit(user_id, strategy) for user_id, strategy in strategies]
+        done, not_done = wait(futures, timeout=max(0, deadline - started))
+
+        # отмененный или упавший запуск (пул остановлен) не попал в окно
+        finished = [future.result() for future in done if not future.cancelled() and future.exception() == None]
+        in_window = sum(1 for finish in finished if finish <= deadline)
+        stats = {
+            'total': len(futures),
+            'in_window': in_window,
+            'late': len(futures) - in_window,
+            'duration': round(time() - started, 3),
+            'finished': finished # время окончания execute() (unix), для нагрузочного теста
+        }
+
+        if stats['late'] > 0:
+            self.__logger.warning(f'Tick finished: {in_window}/{len(futures)} strategies inside candle-close window')
+        else:
+            self.__logger.info(f'Tick finished: {in_window}/{len(futures)} strategies inside candle-close window in {stats["duration"]} s')
+        return stats
+
+    def shutdown(self):
+        self.__pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Таймер закрытия свечей по серверному времени биржи (clock_sync синхронизируется в фоне).
+# Просыпается на каждой минутной границе и отдает только те группы стратегий, у которых закрылась свеча их таймфрейма
+class CandleCloseTimer:
+    def __init__(self, fire_delay=0.05):
+        self.fire_delay = fire_delay # секунд после закрытия свечи
+        self.__logger = get_logger('candleTimer')
+
+    # Sleeping until the next minute close. Returns close time in exchange ms
+    def wait_next_close(self):
+        close_ms = candle_close('1', clock_sync.now_ms())
+        # + погрешность синхронизации: просыпаемся не раньше закрытия свечи на бирже
+        wake_ms = close_ms + self.fire_delay * 1000 + clock_sync.error_ms()
+        self.__logger.info(f'Waiting {round((wake_ms - clock_sync.now_ms()) / 1000, 3)} seconds')
+        late = clock_sync.sleep_until(wake_ms)
+        self.__logger.info(f'Woke up {round(wake_ms - close_ms + late)} ms after candle close')
+        return close_ms
+
+    # Grouping (user_id, strategy) by timeframe, only for groups whose candle closes at close_ms
+    @staticmethod
+    def closing_groups(strategies, close_ms):
+        groups = {}
+        for user_id, strategy in strategies:
+            timeframe = strategy.strategy_params['timeframe']
+            if candle_close(timeframe, close_ms - 1) == close_ms:
+                groups.setdefault(timeframe, []).append((user_id, strategy))
+        return groups
@@ -0,0 +1,96 @@
+import numpy as np
+
+# Векторный расчет сигналов стратегий сразу по всему ряду свечей.
+# Элемент [t] - то, что стратегия увидела бы, если бы свеча t была последней:
+# в живой торговле берем [-1], в бэктесте - все элементы
+
+# Shifting array right by s positions (values from the past), head is filled with fill
+def shift(arr, s, fill=False):
+    if s == 0:
+        return arr
+    result = np.full_like(arr, fill)
+    result[s:] = arr[:-s]
+    return result
+
+# Crossing of a over b: +1 - crossed up, -1 - crossed down, 0 - nothing
+def cross(a, b):
+    a_prev, b_prev = shift(a, 1, np.nan), shift(b, 1, np.nan)
+    up = (a_prev <= b_prev) & (a > b)
+    down = (a_prev >= b_prev) & (a < b)
+    return up.astype(np.int8) - down.astype(np.int8)
+
+# MyStrategy: stochastic crossover, Chaikin zero-cross, MA breakout on volume within window candles.
+# Returns bull/bear state vectors (n, 3) and final long/short signals (n,)
+def my_strategy_signals(open_, close, volume, ma, stochastic_k, stochastic_d, chaikin, goodvolume, window):
+    open_, close, volume, ma = (np.asarray(x, dtype=np.float64) for x in (open_, close, volume, ma))
+    n = len(close)
+
+    stochastic_cross = cross(np.asarray(stochastic_k, dtype=np.float64), np.asarray(stochastic_d, dtype=np.float64))
+    chaikin_cross = cross(np.asarray(chaikin, dtype=np.float64), np.zeros(n))
+
+    # пробой МА вверх/вниз на хорошем объеме
+    good_volume = (goodvolume[0] <= volume) & (volume <= goodvolume[1])
+    breakout_up = (open_ <= ma) & (close > ma)
+    breakout_down = (open_ >= ma) & (close < ma)
+    # или пробой вверх и следующие 2 свечи бычьи
+    bullish = open_ <= close
+    next_bullish = np.zeros(n, dtype=bool)
+    next_bullish[:-2] = bullish[1:-1] & bullish[2:]
+    graphic_up = breakout_up & good_volume
+    graphic_up_confirmed = graphic_up | (breakout_up & next_bullish)
+    graphic_down = breakout_down & good_volume
+
+    bull = np.zeros((n, 3), dtype=bool)
+    bear = np.zeros((n, 3), dtype=bool)
+    # проходим окно от старой свечи к новой, для всех t сразу: свеча j = t - s
+    for s in range(window - 1, -1, -1):
+        stoch_s = shift(stochastic_cross, s, 0)
+        bull[:, 1] = np.where(stoch_s == 1, True, np.where(stoch_s == -1, False, bull[:, 1]))
+        bear[:, 1] = np.where(stoch_s == -1, True, np.where(stoch_s == 1, False, bear[:, 1]))
+
+        chaikin_s = shift(chaikin_cross, s, 0)
+        bull[:, 2] = np.where(chaikin_s == 1, True, np.where(chaikin_s == -1, False, bull[:, 2]))
+        bear[:, 2] = np.where(chaikin_s == -1, True, np.where(chaikin_s == 1, False, bear[:, 2]))
+
+        # подтверждение следующими свечами доступно, только если они уже есть (s >= 2)
+        up_s = shift(graphic_up_confirmed if s >= 2 else graphic_up, s)
+        set_bull = bull.any(axis=1) & up_s
+        bull[set_bull, 0] = True
+        bear[set_bull, 0] = False
+
+        down_s = shift(graphic_down, s)
+        set_bear = bear.any(axis=1) & down_s
+        bear[set_bear, 0] = True
+        bull[set_bear, 0] = False
+
+    return {
+        'stochastic_cross': stochastic_cross,
+        'chaikin_cross': chaikin_cross,
+        'graphic_up': graphic_up_confirmed,
+        'graphic_down': graphic_down,
+        'bull': bull,
+        'bear': bear,
+        'long': bull.all(axis=1) & (close > ma),
+        'short': bear.all(axis=1) & (close < ma)
+    }
+
+# SimpleStrategy.graphic_signal for every candle: 1 - close crossed MA up, -1 - down, 0 - nothing
+def simple_strategy_signals(close, ma):
+    close, ma = np.asarray(close, dtype=np.float64), np.asarray(ma, dtype=np.float64)
+    close_prev, ma_prev = shift(close, 1, np.nan), shift(ma, 1, np.nan)
+    up = (close_prev < ma_prev) & (close >= ma)
+    down = (close_prev > ma_prev) & (close <= ma)
+    return up.astype(np.int8) - down.astype(np.int8)
+
+# define_stop_candle_index for every candle: index of the nearest extremum (local low for long, high for short)
+def stop_candle_indices(low, high):
+    low, high = np.asarray(low, dtype=np.float64), np.asarray(high, dtype=np.float64)
+    positions = np.arange(len(low))
+    # идем назад, пока предыдущий минимум не выше текущего - останавливаемся на свече, где он выше
+    long_break = np.zeros(len(low), dtype=bool)
+    long_break[1:] = low[:-1] > low[1:]
+    short_break = np.zeros(len(high), dtype=bool)
+    short_break[1:] = high[:-1] < high[1:]
+    long_index = np.maximum.accumulate(np.where(long_break, positions, 0))
+    short_index = np.maximum.accumulate(np.where(short_break, positions, 0))
+    return long_index, short_index
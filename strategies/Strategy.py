@@ -3,6 +3,7 @@ from db.session import DBSessionManager
 from db.crud import *
 from strategies.TechStrategy import SimpleStrategy
 from telebot.types import Message
+from telegram.Notifier import PRIORITY_ERROR
 
 # В конце каждого ТФ нужно обновлять bot.current_balance и all_time_pnl и trade.current_pnl
 
@@ -23,10 +24,14 @@ class Strategy:
         self.broker = Bybit(self.user['api_key'], self.user['api_secret'], self.user['telegram_id'], self.bot)
         self.tech_strategy = SimpleStrategy(self.broker, self.strategy_params['timeframe'], self.strategy_params['leverage'], self.strategy_params['depo_procent'], own_trade=self.only_tech)
 
+    # Releasing the broker's private stream (robot stopped)
+    def close(self):
+        self.broker.close()
+
     def execute(self):
-        # Проверка на доступ к бирже
-        if self.broker.get_balance() == None:
-            self.bot.send_message_to_user(self.user['telegram_id'], 'Произошла ошибка при обращении к Bybit! Робот принудительно остановлен!')
+        # Проверка на доступ к бирже (REST сверка состояния аккаунта раз в reconcile_interval)
+        if not self.broker.sync_account():
+            self.bot.notify(self.user['telegram_id'], 'Произошла ошибка при обращении к Bybit! Робот принудительно остановлен!', PRIORITY_ERROR)
 
             message = Message() # заглушка, чтобы вызвать stop_bot
             message.chat = type("Chat", (), {"id": self.user['telegram_id']})
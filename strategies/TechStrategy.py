@@ -1,5 +1,6 @@
-import pandas_ta as ta
 from bybit.BybitHelper import Bybit
+from market_data.MarketDataHub import market_data_hub
+from strategies.Signals import my_strategy_signals
 
 # !!! ATTENTION !!!
 # -------- 1 --------
@@ -11,23 +12,61 @@ myStrategyVolumes = {
     '60': (2.5e3, 6.9e3, 23.5e3)
 }
 
+def my_strategy_params(timeframe, leverage, depo_procent=100):
+    return {
+        "timeframe": timeframe,
+        "volume_levels": myStrategyVolumes[timeframe],
+        "ma_period": 10,
+        "stochastic_params": (14, 3, 3),
+        "window": 4,
+        "rsi_levels": (30, 70),
+        "max_loss_percent": 2,
+        "leverage": leverage,
+        'depo_part': depo_procent / 100
+    }
+
+def simple_strategy_params(timeframe, leverage, depo_procent=100.0):
+    return {
+        "timeframe": timeframe,
+        "ma_period": 10,
+        "max_loss_percent": 2,
+        "leverage": leverage,
+        'depo_part': depo_procent / 100
+    }
+
+# Размер позиции по риску: cash - доступный баланс (availableWithdrawal)
+def order_size(cash, order_price, stop_price, params, taker_fee, cur_pos=None):
+    # Вычитаем комиссии (в случае максимального входа)
+    # https://www.bybit.com/ru-RU/help-center/article/Order-Cost-USDT-ContractUSDT_Perpetual_Contract
+    # Вычитаем комиссию за открытие по тейкеру
+    cash -= cash * params['leverage'] * taker_fee
+    # Вычитаем комиссию за закрытие по тейкеру (берем шорт как худший вариант)
+    cash -= cash * params['leverage'] * (1 + 1 / params['leverage']) * taker_fee
+
+    if cur_pos != None:
+        cur_margin = cur_pos['entryPrice'] * cur_pos['size'] / params['leverage']
+
+        cur_pnl_by_order_price = cur_pos['size'] * (order_price - cur_pos['entryPrice'])
+        if cur_pos['side'] == 'Sell':
+            cur_pnl_by_order_price *= -1
+
+        cash += cur_margin + cur_pnl_by_order_price
+
+    cash *= params['depo_part'] # берем только торгуемый объем
+
+    max_risk_qty = (cash*params['max_loss_percent']/100) / abs(order_price-stop_price)
+    if max_risk_qty * order_price / params['leverage'] < cash:
+        return max_risk_qty
+    else:
+        return cash * params['leverage'] / order_price
+
 class MyStrategy:
     def __init__(self, broker: Bybit, timeframe, leverage, depo_procent=100, own_trade=False):
         self.__broker = broker
         self.__takerFee = broker.get_fee_rates()[0]
         self.__own_trade = own_trade
 
-        self.params = {
-            "timeframe": timeframe,
-            "volume_levels": myStrategyVolumes[timeframe],
-            "ma_period": 10,
-            "stochastic_params": (14, 3, 3),
-            "window": 4,
-            "rsi_levels": (30, 70),
-            "max_loss_percent": 2,
-            "leverage": leverage,
-            'depo_part': depo_procent / 100
-        }
+        self.params = my_strategy_params(timeframe, leverage, depo_procent)
 
         # Данные
         self.data = None
@@ -41,22 +80,6 @@ class MyStrategy:
         # Интервал хорошего объема пробоя МА
         self.goodvolume = ((self.params['volume_levels'][0] + self.params['volume_levels'][1]) / 2, self.params['volume_levels'][2])
 
-        # Определение цвета свечи
-        self.bullish = lambda x: self.data['Open'].iloc[x] <= self.data['Close'].iloc[x]
-        self.bearish = lambda x: self.data['Open'].iloc[x] > self.data['Close'].iloc[x]
-
-    def graphic_signal(self, ind):
-        if ((self.data['Open'].iloc[ind] <= self.ma.iloc[ind] and self.data['Close'].iloc[ind] > self.ma.iloc[ind] and # пробой
-            self.goodvolume[0] <= self.data['Volume'].iloc[ind] <= self.goodvolume[1]) # на хорошем объеме
-            or
-            (ind < -2 and self.data['Open'].iloc[ind] <= self.ma.iloc[ind] and self.data['Close'].iloc[ind] > self.ma.iloc[ind] and # пробой
-            self.bullish(ind + 1) and self.bullish(ind + 2))): # и следующие 2 свечи бычьи
-            return 1 # long
-        if (self.data['Open'].iloc[ind] >= self.ma.iloc[ind] and self.data['Close'].iloc[ind] < self.ma.iloc[ind] and # пробой
-            self.goodvolume[0] <= self.data['Volume'].iloc[ind] <= self.goodvolume[1]): # на хорошем объеме
-            return -1 # short
-        return 0 # nothing
-
     # стоп - ближайший экстремум
     def define_stop_candle_index(self, side):
         ind = -1
@@ -69,97 +92,51 @@ class MyStrategy:
         return ind
 
     def calculate_order_size(self, order_price, stop_price, cur_pos=None):
-        cash = self.__broker.get_availableWithdrawal_balance()
+        cash = self.__broker.account.get_available_balance()
         if cash == None:
             return None
-        
-        # Вычитаем комиссии (в случае максимального входа)
-        # https://www.bybit.com/ru-RU/help-center/article/Order-Cost-USDT-ContractUSDT_Perpetual_Contract
-        # Вычитаем комиссию за открытие по тейкеру
-        cash -= cash * self.params['leverage'] * self.__takerFee
-        # Вычитаем комиссию за закрытие по тейкеру (берем шорт как худший вариант)
-        cash -= cash * self.params['leverage'] * (1 + 1 / self.params['leverage']) * self.__takerFee
-
-        if cur_pos != None:
-            cur_margin = cur_pos['entryPrice'] * cur_pos['size'] / self.params['leverage']
-
-            cur_pnl_by_order_price = cur_pos['size'] * (order_price - cur_pos['entryPrice'])
-            if cur_pos['side'] == 'Sell':
-                cur_pnl_by_order_price *= -1
-            
-            cash += cur_margin + cur_pnl_by_order_price
-
-        cash *= self.params['depo_part'] # берем только торгуемый объем
-
-        max_risk_qty = (cash*self.params['max_loss_percent']/100) / abs(order_price-stop_price)
-        if max_risk_qty * order_price / self.params['leverage'] < cash:
-            return max_risk_qty
-        else:
-            return cash * self.params['leverage'] / order_price
+        return order_size(cash, order_price, stop_price, self.params, self.__takerFee, cur_pos)
 
     def execute(self, symbol):
-        self.data = self.__broker.klines(symbol, self.params['timeframe'])
+        # Закрытые свечи и индикаторы общие для всех стратегий на (symbol, timeframe) - только для чтения
+        timeframe = self.params['timeframe']
+        self.data = market_data_hub.get_candles(symbol, timeframe)
         if self.data.empty:
             return None
 
-        self.ma = ta.ema(close=self.data['Close'], length=self.params['ma_period'])
-        stochastic = ta.stoch(high=self.data['High'], low=self.data['Low'], close=self.data['Close'],\
-                                   k=self.params['stochastic_params'][0],\
-                                   d=self.params['stochastic_params'][1],\
-                                   smooth_k=self.params['stochastic_params'][2])
+        self.ma = market_data_hub.indicator(symbol, timeframe, 'EMA', self.params['ma_period'])
+        stochastic = market_data_hub.indicator(symbol, timeframe, 'Stochastic', *self.params['stochastic_params'])
         self.stochastic_k = stochastic.iloc[:,0]
         self.stochastic_d = stochastic.iloc[:,1]
-        self.chaikin = ta.adosc(high=self.data['High'], low=self.data['Low'], close=self.data['Close'], volume=self.data['Volume'],\
-                                fast=3, slow=10)
-        self.rsi = ta.rsi(close=self.data['Close'])
-
-        # смотрим сигналы в пределах window свечей
-        bull_signals = [0, 0, 0]
-        bear_signals = [0, 0, 0]
-        for i in range(self.params['window'], 0, -1):
-            if (self.stochastic_k.iloc[-i - 1] <= self.stochastic_d.iloc[-i - 1] and
-               self.stochastic_k.iloc[-i] > self.stochastic_d.iloc[-i]):
-                bull_signals[1] = 1
-                bear_signals[1] = 0
-            elif (self.stochastic_k.iloc[-i - 1] >= self.stochastic_d.iloc[-i - 1] and
-                 self.stochastic_k.iloc[-i] < self.stochastic_d.iloc[-i]):
-                bear_signals[1] = 1
-                bull_signals[1] = 0
-                
-            if self.chaikin.iloc[-i - 1] <= 0 and self.chaikin.iloc[-i] > 0:
-                bull_signals[2] = 1
-                bear_signals[2] = 0
-            elif self.chaikin.iloc[-i - 1] >= 0 and self.chaikin.iloc[-i] < 0:
-                bear_signals[2] = 1
-                bull_signals[2] = 0
-                
-            if any(bull_signals) and self.graphic_signal(-i) == 1:
-                bull_signals[0] = 1
-                bear_signals[0] = 0
-            if any(bear_signals) and self.graphic_signal(-i) == -1:
-                bear_signals[0] = 1
-                bull_signals[0] = 0
+        self.chaikin = market_data_hub.indicator(symbol, timeframe, 'ADOSC', 3, 10)
+        self.rsi = market_data_hub.indicator(symbol, timeframe, 'RSI')
+
+        # смотрим сигналы в пределах window свечей (векторно по всему ряду, берем последнюю свечу)
+        signals = my_strategy_signals(self.data['Open'], self.data['Close'], self.data['Volume'], self.ma,
+                                      self.stochastic_k, self.stochastic_d, self.chaikin, self.goodvolume, self.params['window'])
+        long_signal = signals['long'][-1]
+        short_signal = signals['short'][-1]
 
         if not self.__own_trade:
-            if all(bull_signals) and self.data['Close'].iloc[-1] > self.ma.iloc[-1]:
+            if long_signal:
                 return 1
-            elif all(bear_signals) and self.data['Close'].iloc[-1] < self.ma.iloc[-1]:
+            elif short_signal:
                 return -1
             return 0
         # Если идем дальше - значит сами совершаем сделки
         
         # Если новый сигнал - снимаем открытые ордера
-        open_orders = self.__broker.get_open_orders(symbol)
+        open_orders = self.__broker.account.get_open_orders(symbol)
         if open_orders == None:
             return None
         if len(open_orders) > 2:
             return None
-        if (all(bull_signals) and self.data['Close'].iloc[-1] > self.ma.iloc[-1]) and len(open_orders) > 0:
+        if long_signal and len(open_orders) > 0:
             self.__broker.cancel_all_symbol_orders(symbol)
-        if (all(bear_signals) and self.data['Close'].iloc[-1] < self.ma.iloc[-1]) and len(open_orders) > 0:
+        if short_signal and len(open_orders) > 0:
             self.__broker.cancel_all_symbol_orders(symbol)
         
-        positions = self.__broker.get_positions()
+        positions = self.__broker.account.get_positions()
         if positions == None:
             return None
         
@@ -171,7 +148,7 @@ class MyStrategy:
         # Если не в позиции
         if not symbol in positions:
             # long
-            if all(bull_signals) and self.data['Close'].iloc[-1] > self.ma.iloc[-1]:
+            if long_signal:
                 order_price = self.data['High'].iloc[-1] + price_step * 2
                 stop_price = self.data['Low'].iloc[self.define_stop_candle_index('long')] - price_step * 2
                 stop_price = round(stop_price, price_acc)
@@ -183,7 +160,7 @@ class MyStrategy:
                                                leverage=self.params['leverage'], qty=size, sl=stop_price)
 
             # short
-            elif all(bear_signals) and self.data['Close'].iloc[-1] < self.ma.iloc[-1]:
+            elif short_signal:
                 order_price = self.data['Low'].iloc[-1] - price_step * 2
                 stop_price = self.data['High'].iloc[self.define_stop_candle_index('short')] + price_step * 2
                 stop_price = round(stop_price, price_acc)
@@ -217,18 +194,16 @@ class MyStrategy:
                                                    leverage=self.params['leverage'], qty=positions[symbol]['size'])
                 
                 # если переворот в short
-                elif all(bear_signals) and self.data['Close'].iloc[-1] < self.ma.iloc[-1]:
+                elif short_signal:
                     order_price = self.data['Low'].iloc[-1] - price_step * 2
                     stop_price = self.data['High'].iloc[self.define_stop_candle_index('short')] + price_step * 2
                     stop_price = round(stop_price, price_acc)
                     
                     size = self.calculate_order_size(order_price, stop_price, positions[symbol])
                     
-                    # Отправляем ордера на закрытие и открытие
-                    self.__broker.place_stop_order(symbol=symbol, side='Sell', price=order_price,
-                                                   leverage=self.params['leverage'], qty=positions[symbol]['size'], sl=stop_price)
-                    self.__broker.place_stop_order(symbol=symbol, side='Sell', price=order_price,
-                                                   leverage=self.params['leverage'], qty=size, sl=stop_price)
+                    # Отправляем ордера на закрытие и открытие одним batch запросом
+                    self.__broker.reverse_position(symbol=symbol, side='Sell', cur_size=positions[symbol]['size'], qty=size,
+                                                   price=order_price, leverage=self.params['leverage'], sl=stop_price)
             
             # short
             else:
@@ -251,18 +226,16 @@ class MyStrategy:
                                                    leverage=self.params['leverage'], qty=positions[symbol]['size'])
                 
                 # если переворот в long
-                elif all(bull_signals) and self.data['Close'].iloc[-1] > self.ma.iloc[-1]:
+                elif long_signal:
                     order_price = self.data['High'].iloc[-1] + price_step * 2
                     stop_price = self.data['Low'].iloc[self.define_stop_candle_index('long')] - price_step * 2
                     stop_price = round(stop_price, price_acc)
                     
                     size = self.calculate_order_size(order_price, stop_price, positions[symbol])
                     
-                    # Отправляем ордера на закрытие и открытие
-                    self.__broker.place_stop_order(symbol=symbol, side='Buy', price=order_price,
-                                                   leverage=self.params['leverage'], qty=positions[symbol]['size'], sl=stop_price)
-                    self.__broker.place_stop_order(symbol=symbol, side='Buy', price=order_price,
-                                                   leverage=self.params['leverage'], qty=size, sl=stop_price)
+                    # Отправляем ордера на закрытие и открытие одним batch запросом
+                    self.__broker.reverse_position(symbol=symbol, side='Buy', cur_size=positions[symbol]['size'], qty=size,
+                                                   price=order_price, leverage=self.params['leverage'], sl=stop_price)
                     
 
 class SimpleStrategy:
@@ -271,13 +244,7 @@ class SimpleStrategy:
         self.__takerFee = broker.get_fee_rates()[0]
         self.__own_trade = own_trade # совершает ли стратегия сделки сама или просто возвращает сигнал
 
-        self.params = {
-            "timeframe": timeframe,
-            "ma_period": 10,
-            "max_loss_percent": 2,
-            "leverage": leverage,
-            'depo_part': depo_procent / 100
-        }
+        self.params = simple_strategy_params(timeframe, leverage, depo_procent)
 
         # Данные
         self.data = None
@@ -296,33 +263,10 @@ class SimpleStrategy:
         return ind
 
     def calculate_order_size(self, order_price, stop_price, cur_pos=None):
-        cash = self.__broker.get_availableWithdrawal_balance()
+        cash = self.__broker.account.get_available_balance()
         if cash == None:
             return None
-        
-        # Вычитаем комиссии (в случае максимального входа)
-        # https://www.bybit.com/ru-RU/help-center/article/Order-Cost-USDT-ContractUSDT_Perpetual_Contract
-        # Вычитаем комиссию за открытие по тейкеру
-        cash -= cash * self.params['leverage'] * self.__takerFee
-        # Вычитаем комиссию за закрытие по тейкеру (берем шорт как худший вариант)
-        cash -= cash * self.params['leverage'] * (1 + 1 / self.params['leverage']) * self.__takerFee
-
-        if cur_pos != None:
-            cur_margin = cur_pos['entryPrice'] * cur_pos['size'] / self.params['leverage']
-
-            cur_pnl_by_order_price = cur_pos['size'] * (order_price - cur_pos['entryPrice'])
-            if cur_pos['side'] == 'Sell':
-                cur_pnl_by_order_price *= -1
-            
-            cash += cur_margin + cur_pnl_by_order_price
-        
-        cash *= self.params['depo_part'] # берем только торгуемый объем
-
-        max_risk_qty = (cash*self.params['max_loss_percent']/100) / abs(order_price-stop_price)
-        if max_risk_qty * order_price / self.params['leverage'] < cash:
-            return max_risk_qty
-        else:
-            return cash * self.params['leverage'] / order_price
+        return order_size(cash, order_price, stop_price, self.params, self.__takerFee, cur_pos)
         
     def graphic_signal(self, ind):
         if (self.data['Close'].iloc[ind - 1] < self.ma.iloc[ind - 1] and
@@ -334,11 +278,13 @@ class SimpleStrategy:
         return 0 # nothing
 
     def execute(self, symbol):
-        self.data = self.__broker.klines(symbol, self.params['timeframe'])
+        # Закрытые свечи и индикаторы общие для всех стратегий на (symbol, timeframe) - только для чтения
+        timeframe = self.params['timeframe']
+        self.data = market_data_hub.get_candles(symbol, timeframe)
         if self.data.empty:
             return None
 
-        self.ma = ta.ema(close=self.data['Close'], length=self.params['ma_period'])
+        self.ma = market_data_hub.indicator(symbol, timeframe, 'EMA', self.params['ma_period'])
 
         signal = self.graphic_signal(-1)
 
@@ -347,7 +293,7 @@ class SimpleStrategy:
         # Если идем дальше - значит сами совершаем сделки
 
         # Если новый сигнал - снимаем открытые ордера
-        open_orders = self.__broker.get_open_orders(symbol)
+        open_orders = self.__broker.account.get_open_orders(symbol)
         if open_orders == None:
             return None
         if len(open_orders) > 2:
@@ -355,7 +301,7 @@ class SimpleStrategy:
         if (signal == -1 or signal == 1) and len(open_orders) > 0:
             self.__broker.cancel_all_symbol_orders(symbol)
         
-        positions = self.__broker.get_positions()
+        positions = self.__broker.account.get_positions()
         if positions == None:
             return None
         
@@ -400,9 +346,9 @@ class SimpleStrategy:
                     
                     size = self.calculate_order_size(order_price, stop_price, positions[symbol])
                     
-                    # Отправляем ордера на закрытие и открытие
-                    self.__broker.place_market_order(symbol=symbol, side='Sell', leverage=self.params['leverage'], qty=positions[symbol]['size'], sl=stop_price)
-                    self.__broker.place_market_order(symbol=symbol, side='Sell', leverage=self.params['leverage'], qty=size, sl=stop_price)
+                    # Закрываем и открываем одним рыночным ордером на суммарный объем
+                    self.__broker.reverse_position(symbol=symbol, side='Sell', cur_size=positions[symbol]['size'], qty=size,
+                                                   leverage=self.params['leverage'], sl=stop_price)
             
             # short
             else:
@@ -414,6 +360,6 @@ class SimpleStrategy:
                     
                     size = self.calculate_order_size(order_price, stop_price, positions[symbol])
                     
-                    # Отправляем ордера на закрытие и открытие
-                    self.__broker.place_market_order(symbol=symbol, side='Buy', leverage=self.params['leverage'], qty=positions[symbol]['size'], sl=stop_price)
-                    self.__broker.place_market_order(symbol=symbol, side='Buy', leverage=self.params['leverage'], qty=size, sl=stop_price)
+                    # Закрываем и открываем одним рыночным ордером на суммарный объем
+                    self.__broker.reverse_position(symbol=symbol, side='Buy', cur_size=positions[symbol]['size'], qty=size,
+                                                   leverage=self.params['leverage'], sl=stop_price)
@@ -0,0 +1,61 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from strategies.Indicators import IndicatorSet, EMA, RSI, Stochastic, ADOSC
+
+ta = pytest.importorskip('pandas_ta')
+
+def make_candles(n=500, seed=1):
+    rng = np.random.default_rng(seed)
+    close = 600 + np.cumsum(rng.normal(0, 1, n)).round(1)
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) + rng.exponential(0.5, n).round(1)
+    low = np.minimum(open_, close) - rng.exponential(0.5, n).round(1)
+    high[50] = low[50] = open_[50] = close[50] # свеча с нулевым диапазоном
+    volume = rng.exponential(100, n)
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume, 'Turnover': volume * close},
+                        index=pd.Index(np.arange(n) * 60_000, name='Time'))
+
+def make_set(history):
+    return IndicatorSet({'ma': EMA(10), 'stochastic': Stochastic(14, 3, 3), 'chaikin': ADOSC(3, 10), 'rsi': RSI()}, history=history)
+
+def assert_same(actual, expected):
+    actual = np.asarray(actual, dtype=np.float64)
+    expected = np.asarray(expected, dtype=np.float64)
+    assert np.array_equal(np.isnan(actual), np.isnan(expected))
+    mask = ~np.isnan(expected)
+    np.testing.assert_allclose(actual[mask], expected[mask], rtol=1e-9, atol=1e-9)
+
+def assert_matches_pandas_ta(indicators, data):
+    # так же, как считает MyStrategy.execute
+    assert_same(indicators.series('ma', data.index), ta.ema(close=data['Close'], length=10))
+    stochastic = ta.stoch(high=data['High'], low=data['Low'], close=data['Close'], k=14, d=3, smooth_k=3).reindex(data.index)
+    assert_same(indicators.series('stochastic', data.index).iloc[:, 0], stochastic.iloc[:, 0])
+    assert_same(indicators.series('stochastic', data.index).iloc[:, 1], stochastic.iloc[:, 1])
+    assert_same(indicators.series('chaikin', data.index),
+                ta.adosc(high=data['High'], low=data['Low'], close=data['Close'], volume=data['Volume'], fast=3, slow=10))
+    assert_same(indicators.series('rsi', data.index), ta.rsi(close=data['Close']))
+
+def test_batch_update_matches_pandas_ta():
+    data = make_candles()
+    indicators = make_set(len(data))
+    indicators.update(data)
+    assert_matches_pandas_ta(indicators, data)
+
+def test_incremental_update_matches_pandas_ta():
+    data = make_candles()
+    indicators = make_set(len(data))
+    for i in range(1, len(data) + 1):
+        indicators.update(data.iloc[max(0, i - 200):i]) # окно как у кольцевого буфера
+    assert_matches_pandas_ta(indicators, data)
+
+def test_warm_start_from_state():
+    data = make_candles()
+    indicators = make_set(len(data))
+    indicators.update(data.iloc[:300])
+
+    restored = make_set(len(data))
+    restored.load_state(json.loads(json.dumps(indicators.state())))
+    restored.update(data)
+    assert_matches_pandas_ta(restored, data)
@@ -0,0 +1,52 @@
+from threading import Lock, Timer
+from time import time, sleep
+from strategies.Scheduler import StrategyScheduler
+
+# Стратегия без биржи: execute() спит delay и запоминает (user_id, start, end) в общий журнал
+class FakeStrategy:
+    def __init__(self, user_id, log, delay=0.05):
+        self.user_id = user_id
+        self.__log = log
+        self.__delay = delay
+
+    def execute(self):
+        start = time()
+        sleep(self.__delay)
+        self.__log.append((self.user_id, start, time(), self))
+
+def test_runs_of_one_user_are_sequential():
+    scheduler = StrategyScheduler(max_workers=8)
+    log = []
+    strategies = [(1, FakeStrategy(1, log)) for _ in range(5)]
+    stats = scheduler.run_tick(strategies, deadline=time() + 2)
+    scheduler.shutdown()
+    assert stats['late'] == 0 and stats['in_window'] == 5
+    assert [entry[3] for entry in log] == [strategy for _, strategy in strategies] # в порядке постановки
+    assert all(prev[2] <= next[1] for prev, next in zip(log, log[1:])) # без пересечений
+
+def test_different_users_run_in_parallel():
+    scheduler = StrategyScheduler(max_workers=4)
+    log = []
+    stats = scheduler.run_tick([(user_id, FakeStrategy(user_id, log, delay=0.2)) for user_id in range(4)], deadline=time() + 2)
+    scheduler.shutdown()
+    assert stats['in_window'] == 4
+    assert stats['duration'] < 0.35 # по очереди было бы 0.8 с
+
+def test_late_strategies_are_reported_after_deadline():
+    scheduler = StrategyScheduler(max_workers=4)
+    log = []
+    strategies = [(1, FakeStrategy(1, log, delay=0.01)), (2, FakeStrategy(2, log, delay=0.5))]
+    stats = scheduler.run_tick(strategies, deadline=time() + 0.2)
+    scheduler.shutdown()
+    assert stats['total'] == 2 and stats['in_window'] == 1 and stats['late'] == 1
+    assert stats['duration'] < 0.4 # тик не ждет опоздавшую стратегию
+    assert len(stats['finished']) == 1
+
+def test_run_queued_behind_shutdown_fails_instead_of_hanging():
+    scheduler = StrategyScheduler(max_workers=2)
+    log = []
+    Timer(0.05, scheduler.shutdown).start() # следующий запуск пользователя встанет в пул уже после остановки
+    stats = scheduler.run_tick([(1, FakeStrategy(1, log, delay=0.2)), (1, FakeStrategy(1, log))], deadline=time() + 2)
+    assert stats['in_window'] == 1 and stats['late'] == 1
+    assert stats['duration'] < 1 # цепочка разрешилась ошибкой, а не ждала дедлайн
+    assert len(log) == 1
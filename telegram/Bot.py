@@ -1,21 +1,107 @@
+from collections import deque
+from itertools import count
+from threading import Condition
+from time import time
+import numpy as np
 from telebot import TeleBot, types
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+from telebot.apihelper import ApiTelegramException
 from config import config
 from logs.logger import get_logger
 from global_strategies import active_strategies
-from bybit.BybitHelper import Bybit, timeframe_match
+from bybit.BybitHelper import timeframe_match
+from bybit.ClientPool import client_pool
+from bybit.InstrumentsRegistry import instruments_registry
 from strategies.Strategy import Strategy
+from bybit.RateLimiter import TokenBucket
+from telegram.Notifier import Notifier, PRIORITY_TRADE, PRIORITY_MENU, PRIORITY_NAMES
 from db.session import DBSessionManager
 from db.crud import *
 
+# Исходящие сообщения в пределах лимитов Telegram: ~30 сообщений в секунду на бота и 1 в секунду на чат (token bucket).
+# Из ожидающих первым уходит самое приоритетное сообщение, чей чат не исчерпал лимит (ошибки и сделки раньше меню).
+# На 429 чат блокируется на retry_after, и сообщение отправляется повторно
+class SendScheduler:
+    def __init__(self, global_limit=30, chat_limit=1, retries=3, history=1000):
+        self.__logger = get_logger('telegramSender')
+        self.__cond = Condition()
+        self.__global = TokenBucket(global_limit)
+        self.__chat_limit = chat_limit
+        self.__chats = {} # chat_id -> TokenBucket
+        self.__waiting = [] # (priority, seq, chat_id)
+        self.__seq = count()
+        self.__retries = retries
+        self.__latency = {priority: deque(maxlen=history) for priority in PRIORITY_NAMES} # секунды до доставки
+        self.retried = 0 # сколько раз получили 429
+
+    def __chat(self, chat_id):
+        bucket = self.__chats.get(chat_id)
+        if bucket == None:
+            bucket = self.__chats[chat_id] = TokenBucket(self.__chat_limit)
+        return bucket
+
+    # Blocks until the message may be sent
+    def __acquire(self, chat_id, priority):
+        entry = (priority, next(self.__seq), chat_id)
+        with self.__cond:
+            self.__waiting.append(entry)
+            while True:
+                timeout = self.__chat(chat_id).wait()
+                if timeout == 0 and entry == min(e for e in self.__waiting if self.__chat(e[2]).wait() == 0):
+                    timeout = self.__global.take()
+                    if timeout == 0:
+                        self.__chat(chat_id).take()
+                        self.__waiting.remove(entry)
+                        self.__cond.notify_all()
+                        return
+                elif timeout == 0:
+                    timeout = None # ждем, пока уйдет более приоритетное сообщение
+                self.__cond.wait(timeout)
+
+    # method(chat_id, *args, **kwargs) - TeleBot.send_message and similar
+    def send(self, method, chat_id, *args, priority=PRIORITY_MENU, **kwargs):
+        start = time()
+        for attempt in range(self.__retries + 1):
+            self.__acquire(chat_id, priority)
+            try:
+                result = method(chat_id, *args, **kwargs)
+            except ApiTelegramException as err:
+                if err.error_code != 429 or attempt == self.__retries:
+                    raise
+                retry_after = (err.result_json.get('parameters') or {}).get('retry_after', 1)
+                with self.__cond:
+                    self.retried += 1
+                    bucket = self.__chat(chat_id)
+                    bucket.blocked_until = max(bucket.blocked_until, time() + retry_after)
+                    self.__cond.notify_all()
+                self.__logger.warning(f'Telegram rate limit for {chat_id}, retry after {retry_after} s')
+                continue
+            with self.__cond:
+                self.__latency[priority].append(time() - start)
+            return result
+
+    def stats(self):
+        with self.__cond:
+            latency = {PRIORITY_NAMES[priority]: np.array(values) * 1000 for priority, values in self.__latency.items()}
+            return {
+                'queue_depth': len(self.__waiting),
+                'latency_ms': {name: {'p50': float(np.percentile(values, 50)), 'p95': float(np.percentile(values, 95)),
+                                      'p99': float(np.percentile(values, 99))} if len(values) else
+                                     {'p50': 0.0, 'p95': 0.0, 'p99': 0.0} for name, values in latency.items()},
+                'retried': self.retried
+            }
+
+
 class TelegramBot:
     def __init__(self, token):
         self.bot = TeleBot(token)
         self.logger = get_logger('telegramBot')
+        self.sender = SendScheduler()
         self.available_tickers = config.AVAILABLE_TICKERS
         self.available_timeframes = config.AVAILABLE_TIMEFRAMES
         self.user_state = {}
         self.temp_strategy_data = {}
+        self.notifier = Notifier(lambda chat_id, text, priority: self.send_message(chat_id, text, priority=priority)) # уведомления из торговых потоков
 
         # Команды
         self.bot.message_handler(commands=['start'])(self.start_handler)
@@ -50,7 +136,7 @@ class TelegramBot:
             keyboard = InlineKeyboardMarkup()
             keyboard.add(InlineKeyboardButton("🔐 Подключиться к бирже", callback_data="connect_exchange"))
 
-            self.bot.send_message(message.chat.id, "Привет! Я бот для торговли на Bybit.\nНужно подключиться к аккаунту на Bybit, чтобы начать:", reply_markup=keyboard)
+            self.send_message(message.chat.id, "Привет! Я бот для торговли на Bybit.\nНужно подключиться к аккаунту на Bybit, чтобы начать:", reply_markup=keyboard)
             self.logger.info(f'New user started: {message.chat.id}')
         except Exception as err:
             print(err)
@@ -60,7 +146,7 @@ class TelegramBot:
         try:
             self.bot.answer_callback_query(call.id)  # убирает загрузку
             self.user_state[call.message.chat.id] = {'step': 'awaiting_api_key'}
-            self.bot.send_message(call.message.chat.id, "Введите API ключ от Bybit:", reply_markup=types.ReplyKeyboardRemove())
+            self.send_message(call.message.chat.id, "Введите API ключ от Bybit:", reply_markup=types.ReplyKeyboardRemove())
         except Exception as err:
             print(err)
             self.logger.error(f"Error while connecting to Bybit for user {call.message.chat.id}: {err}")
@@ -70,7 +156,7 @@ class TelegramBot:
             self.bot.answer_callback_query(call.id)  # убирает загрузку
             state = self.user_state.get(call.message.chat.id, {})
             valid = False
-            broker = Bybit(state['api_key'], state['api_secret'])
+            broker = client_pool.get(state['api_key'], state['api_secret'])
             balance = 0
             if broker.is_connected:
                 valid = True
@@ -81,11 +167,11 @@ class TelegramBot:
                 with DBSessionManager() as db:
                     create_user(db, telegram_id=call.message.chat.id, api_key=state['api_key'], api_secret=state['api_secret'])
                     create_bot(db, telegram_id=call.message.chat.id, current_balance=balance)
-                self.bot.send_message(call.message.chat.id, f"✅ Подключение прошло успешно! Ваш баланс: {balance} USDT")
+                self.send_message(call.message.chat.id, f"✅ Подключение прошло успешно! Ваш баланс: {balance} USDT")
                 self.logger.info(f'New user registered: {call.message.chat.id}')
                 self.go_main_menu(call.message)
             else:
-                self.bot.send_message(call.message.chat.id, "❌ Ошибка подключения. Введите ключи заново.")
+                self.send_message(call.message.chat.id, "❌ Ошибка подключения. Введите ключи заново.")
                 self.connect_exchange(call)
         except Exception as err:
             print(err)
@@ -97,7 +183,7 @@ class TelegramBot:
             state = self.user_state.get(user_id, {})
 
             if not state.get('verified') or state.get('verified') == False:
-                self.bot.send_message(user_id, "❌ Сначала подключитесь к Bybit!")
+                self.send_message(user_id, "❌ Сначала подключитесь к Bybit!")
                 return
 
             keyboard = InlineKeyboardMarkup()
@@ -108,7 +194,7 @@ class TelegramBot:
             if strategies and len(strategies) > 0:
                 keyboard.add(InlineKeyboardButton("📂 Список сохранённых стратегий", callback_data="saved_strategies_list"))
 
-            self.bot.send_message(user_id, "Главное меню:", reply_markup=keyboard)
+            self.send_message(user_id, "Главное меню:", reply_markup=keyboard)
             self.user_state[user_id]['step'] = 'main_menu'
         except Exception as err:
             print(err)
@@ -126,7 +212,7 @@ class TelegramBot:
             f"/help — Вызов текущей инструкции"
         )
 
-        self.bot.send_message(message.chat.id, text)
+        self.send_message(message.chat.id, text)
 
     def set_new_strategy(self, call):
         try:
@@ -139,7 +225,7 @@ class TelegramBot:
             for i in range(0, len(self.available_tickers), row_width):
                 keyboard.row(*[types.KeyboardButton(btn) for btn in self.available_tickers[i:i+row_width]])
 
-            self.bot.send_message(call.message.chat.id, "Выберите криптовалютную пару:", reply_markup=keyboard)
+            self.send_message(call.message.chat.id, "Выберите криптовалютную пару:", reply_markup=keyboard)
         except Exception as err:
             print(err)
             self.logger.error(f"Error after hitting new strategy for user {call.message.chat.id}: {err}")
@@ -148,14 +234,14 @@ class TelegramBot:
         self.temp_strategy_data[message.chat.id]['coin'] = message.text
         self.user_state[message.chat.id]['step'] = 'awaiting_leverage'
 
-        self.bot.send_message(message.chat.id, "Введите плечо (например, 5):", reply_markup=types.ReplyKeyboardRemove())
+        self.send_message(message.chat.id, "Введите плечо (например, 5):", reply_markup=types.ReplyKeyboardRemove())
 
     def set_timeframe(self, message):
         try:
             self.temp_strategy_data[message.chat.id]['timeframe'] = timeframe_match[message.text]
             self.user_state[message.chat.id]['step'] = 'awaiting_percent'
 
-            self.bot.send_message(message.chat.id, "Введите торгуемый процент от депозита (1-100). Желательно, чтобы он составлял не менее 100$:", reply_markup=types.ReplyKeyboardRemove())
+            self.send_message(message.chat.id, "Введите торгуемый процент от депозита (1-100). Желательно, чтобы он составлял не менее 100$:", reply_markup=types.ReplyKeyboardRemove())
         except Exception as err:
             print(err)
             self.logger.error(f"Error while getting timeframe for user {message.chat.id}: {err}")
@@ -173,7 +259,7 @@ class TelegramBot:
             with DBSessionManager() as db:
                 update_trade_settings(db, user_id, strategy_id=strat_id, coin_name=strat['coin'], leverage=strat['leverage'], timeframe=strat['timeframe'], depo_procent=strat['percent'])
 
-        self.bot.send_message(user_id, f"Стратегия сохранена!", reply_markup=types.ReplyKeyboardRemove())
+        self.send_message(user_id, f"Стратегия сохранена!", reply_markup=types.ReplyKeyboardRemove())
         self.logger.info(f"Strategy saved for user {user_id}: {strat}")
 
         self.go_main_menu(call.message)
@@ -194,7 +280,7 @@ class TelegramBot:
             callback_data = f"select_strategy_{strat['id']}"
             keyboard.add(InlineKeyboardButton(name, callback_data=callback_data))
 
-        self.bot.send_message(user_id, "Выберите стратегию:", reply_markup=keyboard)
+        self.send_message(user_id, "Выберите стратегию:", reply_markup=keyboard)
 
     def select_strategy_action(self, call):
         self.bot.answer_callback_query(call.id)  # убирает загрузку
@@ -211,7 +297,7 @@ class TelegramBot:
             InlineKeyboardButton("🗑 Удалить", callback_data=f"strategy_delete_{strat_id}")
         )
 
-        self.bot.send_message(user_id, f"Выбрана стратегия №{strat_id}. Что хотите сделать?", reply_markup=kb)
+        self.send_message(user_id, f"Выбрана стратегия №{strat_id}. Что хотите сделать?", reply_markup=kb)
 
     def handle_strategy_action(self, call):
         self.bot.answer_callback_query(call.id)  # убирает загрузку
@@ -222,7 +308,7 @@ class TelegramBot:
 
             with DBSessionManager() as db:
                 user = get_user(db, user_id)
-                broker = Bybit(user['api_key'], user['api_secret'])
+                broker = client_pool.get(user['api_key'], user['api_secret'])
                 balance = broker.get_balance()
                 update_bot(db, user_id, current_balance=balance, is_running=True)
             if user_id not in active_strategies:
@@ -232,7 +318,7 @@ class TelegramBot:
             keyboard.add(types.KeyboardButton("❌ Остановить робота"))
 
             self.logger.info(f'Bot started working for user: {call.message.chat.id}')
-            self.bot.send_message(user_id, f"✅ Робот запущен по стратегии №{strat_id}", reply_markup=keyboard)
+            self.send_message(user_id, f"✅ Робот запущен по стратегии №{strat_id}", reply_markup=keyboard)
 
         elif call.data.startswith("strategy_edit_"):
             strat_id = int(call.data.replace("strategy_edit_", ""))
@@ -245,7 +331,7 @@ class TelegramBot:
             for i in range(0, len(self.available_tickers), row_width):
                 keyboard.row(*[types.KeyboardButton(btn) for btn in self.available_tickers[i:i+row_width]])
 
-            self.bot.send_message(user_id, "Выберите новую криптовалютную пару:", reply_markup=keyboard)
+            self.send_message(user_id, "Выберите новую криптовалютную пару:", reply_markup=keyboard)
 
         elif call.data.startswith("strategy_delete_"):
             strat_id = int(call.data.replace("strategy_delete_", ""))
@@ -253,7 +339,7 @@ class TelegramBot:
             with DBSessionManager() as db:
                 delete_trade(db, strat_id)
 
-            self.bot.send_message(user_id, f"🗑 Стратегия №{strat_id} удалена")
+            self.send_message(user_id, f"🗑 Стратегия №{strat_id} удалена")
             self.go_main_menu(call.message)
 
     def stop_bot(self, message):
@@ -262,14 +348,14 @@ class TelegramBot:
 
             with DBSessionManager() as db:
                 user = get_user(db, user_id)
-                broker = Bybit(user['api_key'], user['api_secret'])
+                broker = client_pool.get(user['api_key'], user['api_secret'])
                 balance = broker.get_balance()
                 update_bot(db, user_id, current_balance=balance, is_running=False)
             if user_id in active_strategies:
-                del active_strategies[user_id]
+                active_strategies.pop(user_id).close()
 
             self.logger.info(f'Bot stopped working for user: {user_id}')
-            self.bot.send_message(user_id, "Робот остановлен!", reply_markup=types.ReplyKeyboardRemove())
+            self.send_message(user_id, "Робот остановлен!", reply_markup=types.ReplyKeyboardRemove())
         except Exception as err:
             print(err)
             self.logger.error('Error while trying to stop robot.')
@@ -284,7 +370,7 @@ class TelegramBot:
             self.user_state[user_id]['api_key'] = message.text.strip()
             self.user_state[user_id]['step'] = 'awaiting_api_secret'
 
-            self.bot.send_message(user_id, "Теперь введите API секрет:")
+            self.send_message(user_id, "Теперь введите API секрет:")
         elif state == 'awaiting_api_secret':
             self.user_state[user_id]['api_secret'] = message.text.strip()
 
@@ -294,13 +380,14 @@ class TelegramBot:
                 InlineKeyboardButton("🔁 Ввести заново", callback_data="rewrite_API")
             )
 
-            self.bot.send_message(user_id, "Подтвердите введенные данные:", reply_markup=keyboard)
+            self.send_message(user_id, "Подтвердите введенные данные:", reply_markup=keyboard)
         elif state == 'awaiting_leverage':
             if message.text.strip().isdigit() and int(message.text.strip()) > 0:
                 leverage = int(message.text.strip())
-                broker = Bybit('xxx', 'xxx')
-                max_leverage = int(broker.get_max_leverage(self.temp_strategy_data[user_id]['coin']))
-                if leverage <= max_leverage:
+                max_leverage = instruments_registry.get_max_leverage(self.temp_strategy_data[user_id]['coin'])
+                if max_leverage == None: # справочник еще не загружен (Bybit недоступен) - шаг не меняем
+                    self.send_message(user_id, "❌ Информация об инструменте недоступна. Попробуйте ввести плечо позже.")
+                elif leverage <= int(max_leverage):
                     self.temp_strategy_data[user_id]['leverage'] = leverage
                     self.user_state[user_id]['step'] = 'awaiting_timeframe'
 
@@ -309,11 +396,11 @@ class TelegramBot:
                     for i in range(0, len(self.available_timeframes), row_width):
                         keyboard.row(*[types.KeyboardButton(btn) for btn in self.available_timeframes[i:i+row_width]])
 
-                    self.bot.send_message(user_id, "Выберите таймфрейм:", reply_markup=keyboard)
+                    self.send_message(user_id, "Выберите таймфрейм:", reply_markup=keyboard)
                 else:
-                    self.bot.send_message(user_id, f"❌ Введите число от 1 до {max_leverage}.")
+                    self.send_message(user_id, f"❌ Введите число от 1 до {int(max_leverage)}.")
             else:
-                self.bot.send_message(user_id, "❌ Введите корректное число для плеча.")
+                self.send_message(user_id, "❌ Введите корректное число для плеча.")
         elif state == 'awaiting_percent':
             if message.text.strip().isdigit():
                 percent = int(message.text.strip())
@@ -326,22 +413,30 @@ class TelegramBot:
                         InlineKeyboardButton("❌ Отменить", callback_data="discard_strategy_changes")
                     )
 
-                    self.bot.send_message(user_id, "Готово. Сохранить стратегию?", reply_markup=keyboard)
+                    self.send_message(user_id, "Готово. Сохранить стратегию?", reply_markup=keyboard)
                 else:
-                    self.bot.send_message(user_id, "❌ Введите число от 1 до 100.")
+                    self.send_message(user_id, "❌ Введите число от 1 до 100.")
             else:
-                self.bot.send_message(user_id, "❌ Введите корректное число для процента.")
+                self.send_message(user_id, "❌ Введите корректное число для процента.")
         else:
-            self.bot.send_message(user_id, "Неизвестная команда. Используйте кнопки для действий.")
+            self.send_message(user_id, "Неизвестная команда. Используйте кнопки для действий.")
 
-    def send_message_to_user(self, chat_id, text):
+    # Sending through the rate-limit scheduler; menu replies have the lowest priority
+    def send_message(self, chat_id, text, priority=PRIORITY_MENU, **kwargs):
+        return self.sender.send(self.bot.send_message, chat_id, text, priority=priority, **kwargs)
+
+    def send_message_to_user(self, chat_id, text, priority=PRIORITY_TRADE):
         try:
-            self.bot.send_message(chat_id, text)
+            self.send_message(chat_id, text, priority=priority)
             self.logger.info(f"Sent message to user {chat_id}")
         except Exception as err:
             print(err)
             self.logger.error(f"Failed to send message to {chat_id}: {err}")
 
+    # Non-blocking send for trading code (order paths, WebSocket callbacks)
+    def notify(self, chat_id, text, priority=PRIORITY_TRADE):
+        return self.notifier.notify(chat_id, text, priority)
+
     def run(self):
         try:
             print("Telegram-бот запущен...")
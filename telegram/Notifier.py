@@ -0,0 +1,144 @@
+from collections import deque
+from threading import Condition, Thread
+from time import time
+import numpy as np
+from logs.logger import get_logger
+
+MAX_MESSAGE_LENGTH = 4096 # лимит Telegram на одно сообщение
+
+# Priorities of outgoing messages (lower goes first)
+PRIORITY_ERROR = 0
+PRIORITY_TRADE = 1
+PRIORITY_MENU = 2
+PRIORITY_NAMES = {PRIORITY_ERROR: 'error', PRIORITY_TRADE: 'trade', PRIORITY_MENU: 'menu'}
+
+# Исходящие уведомления Telegram без ожидания в вызывающем потоке (колбэки WebSocket, ордера).
+# notify() только кладет текст в ограниченную очередь, отправляют потоки-отправители.
+# Сообщения одному чату, пришедшие в течение coalesce_window, склеиваются в одно,
+# один чат обслуживается одним отправителем за раз - порядок сообщений сохраняется.
+class Notifier:
+    def __init__(self, send, workers=4, max_queue=10000, coalesce_window=0.5, history=1000):
+        self.__send = send # send(chat_id, text, priority), бросает исключение при ошибке
+        self.__logger = get_logger('notifier')
+        self.__cond = Condition()
+        self.__pending = {} # chat_id -> {'texts', 'enqueued', 'due', 'priority'}, в порядке первого сообщения
+        self.__busy = set() # чаты, которые сейчас отправляются
+        self.__depth = 0
+        self.__max_depth = 0
+        self.__max_queue = max_queue
+        self.__window = coalesce_window
+        self.__latency = deque(maxlen=history) # секунды от notify() до отправки
+        self.__stopped = False
+        self.sent = 0
+        self.coalesced = 0 # сообщений, ушедших не отдельно, а в составе другого
+        self.dropped = 0
+        self.failed = 0
+
+        self.__workers = [Thread(target=self.__worker, daemon=True, name=f'notifier-{i}') for i in range(workers)]
+        for worker in self.__workers:
+            worker.start()
+
+    # Never blocks. Returns False if the queue is full and the message is dropped
+    def notify(self, chat_id, text, priority=PRIORITY_TRADE):
+        with self.__cond:
+            if self.__stopped or self.__depth >= self.__max_queue:
+                self.dropped += 1
+                self.__logger.warning(f'Notification queue is full, message to {chat_id} dropped')
+                return False
+            item = self.__pending.get(chat_id)
+            if item == None:
+                item = self.__pending[chat_id] = {'texts': [], 'enqueued': [], 'due': time() + self.__window,
+                                                  'priority': priority}
+            item['priority'] = min(item['priority'], priority)
+            item['texts'].append(text)
+            item['enqueued'].append(time())
+            self.__depth += 1
+            self.__max_depth = max(self.__max_depth, self.__depth)
+            self.__cond.notify()
+        return True
+
+    # Chat whose burst window is over and which is not being sent now (highest priority first), or (None, seconds to wait)
+    def __next_chat(self):
+        now = time()
+        best = None
+        timeout = None
+        for chat_id, item in self.__pending.items():
+            if chat_id in self.__busy:
+                continue
+            if item['due'] <= now or self.__stopped:
+                if best == None or item['priority'] < self.__pending[best]['priority']:
+                    best = chat_id
+            else:
+                timeout = item['due'] - now if timeout == None else min(timeout, item['due'] - now)
+        return (best, None) if best != None else (None, timeout)
+
+    def __worker(self):
+        while True:
+            with self.__cond:
+                while True:
+                    chat_id, timeout = self.__next_chat()
+                    if chat_id != None:
+                        break
+                    if self.__stopped and not self.__pending:
+                        return
+                    self.__cond.wait(timeout)
+                item = self.__pending.pop(chat_id)
+                self.__busy.add(chat_id)
+                self.__depth -= len(item['texts'])
+
+            try:
+                for text in split_message(item['texts']):
+                    self.__send(chat_id, text, item['priority'])
+                ok = True
+            except Exception as err:
+                print(err)
+                self.__logger.error(f'Failed to send message to {chat_id}: {err}')
+                ok = False
+
+            with self.__cond:
+                self.__busy.discard(chat_id)
+                if ok:
+                    self.sent += 1
+                    self.coalesced += len(item['texts']) - 1
+                    now = time()
+                    self.__latency.extend(now - enqueued for enqueued in item['enqueued'])
+                else:
+                    self.failed += len(item['texts'])
+                self.__cond.notify_all() # у этого чата могли накопиться новые сообщения
+
+    # Sending what is queued and stopping the senders
+    def shutdown(self, timeout=5):
+        with self.__cond:
+            self.__stopped = True
+            self.__cond.notify_all()
+        for worker in self.__workers:
+            worker.join(timeout)
+
+    def stats(self):
+        with self.__cond:
+            latency = np.array(self.__latency) * 1000
+            max_depth, self.__max_depth = self.__max_depth, self.__depth # новое окно начинается с текущей глубины
+            return {
+                'queue_depth': self.__depth,
+                'max_queue_depth': max_depth, # с прошлого вызова stats()
+                'sent': self.sent,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'latency_ms': {'p50': float(np.percentile(latency, 50)), 'p95': float(np.percentile(latency, 95)),
+                               'max': float(latency.max())} if len(latency) else {'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+            }
+
+
+# Joining texts of one chat into as few messages as Telegram allows
+def split_message(texts, limit=MAX_MESSAGE_LENGTH):
+    messages = []
+    for text in texts:
+        while len(text) > limit:
+            messages.append(text[:limit])
+            text = text[limit:]
+        if messages and len(messages[-1]) + 2 + len(text) <= limit:
+            messages[-1] += '\n\n' + text
+        else:
+            messages.append(text)
+    return messages
@@ -0,0 +1,84 @@
+from threading import Event, Lock
+from time import sleep
+from telegram.Notifier import Notifier, PRIORITY_ERROR, PRIORITY_TRADE, PRIORITY_MENU
+
+# Отправка без Telegram: запоминает (chat_id, text, priority) и следит, чтобы один чат не отправлялся параллельно
+class FakeSend:
+    def __init__(self, delay=0.0, hold=None):
+        self.sent = []
+        self.started = Event()
+        self.overlaps = 0
+        self.__delay = delay
+        self.__hold = hold
+        self.__active = set()
+        self.__lock = Lock()
+
+    def __call__(self, chat_id, text, priority):
+        with self.__lock:
+            if chat_id in self.__active:
+                self.overlaps += 1
+            self.__active.add(chat_id)
+        self.started.set()
+        if self.__hold != None:
+            self.__hold.wait(5)
+        sleep(self.__delay)
+        with self.__lock:
+            self.__active.discard(chat_id)
+            self.sent.append((chat_id, text, priority))
+
+def test_burst_to_one_chat_is_coalesced():
+    send = FakeSend()
+    notifier = Notifier(send, workers=2, coalesce_window=0.2)
+    for i in range(3):
+        assert notifier.notify(1, f'fill {i}')
+    notifier.shutdown()
+    assert send.sent == [(1, 'fill 0\n\nfill 1\n\nfill 2', PRIORITY_TRADE)]
+    stats = notifier.stats()
+    assert stats['sent'] == 1 and stats['coalesced'] == 2
+
+def test_chat_messages_keep_order_and_are_not_sent_in_parallel():
+    send = FakeSend(delay=0.05)
+    notifier = Notifier(send, workers=4, coalesce_window=0)
+    for i in range(20):
+        notifier.notify(1, str(i))
+        sleep(0.01)
+    notifier.shutdown()
+    texts = '\n\n'.join(text for _, text, _ in send.sent)
+    assert texts.split('\n\n') == [str(i) for i in range(20)]
+    assert send.overlaps == 0
+
+def test_full_queue_drops_messages():
+    send = FakeSend()
+    notifier = Notifier(send, workers=1, max_queue=2, coalesce_window=10)
+    assert notifier.notify(1, 'a') and notifier.notify(2, 'b')
+    assert not notifier.notify(3, 'c')
+    stats = notifier.stats()
+    assert stats['dropped'] == 1 and stats['queue_depth'] == 2 and stats['max_queue_depth'] == 2
+    notifier.shutdown()
+    assert sorted(chat_id for chat_id, _, _ in send.sent) == [1, 2]
+
+def test_higher_priority_chat_goes_first():
+    hold = Event()
+    send = FakeSend(hold=hold)
+    notifier = Notifier(send, workers=1, coalesce_window=0)
+    notifier.notify(1, 'busy')
+    assert send.started.wait(2) # единственный отправитель занят
+    notifier.notify(2, 'menu', PRIORITY_MENU)
+    notifier.notify(3, 'trade', PRIORITY_TRADE)
+    notifier.notify(4, 'error', PRIORITY_ERROR)
+    hold.set()
+    notifier.shutdown()
+    assert [chat_id for chat_id, _, _ in send.sent] == [1, 4, 3, 2]
+
+def test_max_queue_depth_is_max_since_last_stats():
+    hold = Event()
+    send = FakeSend(hold=hold)
+    notifier = Notifier(send, workers=1, coalesce_window=10)
+    for chat_id in range(3):
+        notifier.notify(chat_id, 'text')
+    assert notifier.stats()['max_queue_depth'] == 3
+    assert notifier.stats()['max_queue_depth'] == 3 # очередь не разгружалась - максимум окна равен текущей глубине
+    hold.set()
+    notifier.shutdown()
+    assert notifier.stats()['max_queue_depth'] == 3
+    assert notifier.stats()['max_queue_depth'] == 0
@@ -0,0 +1,74 @@
+from threading import Thread
+from time import time, sleep
+import pytest
+from telebot.apihelper import ApiTelegramException
+from telegram.Bot import SendScheduler
+from telegram.Notifier import PRIORITY_ERROR, PRIORITY_MENU
+
+def too_many_requests(retry_after):
+    return ApiTelegramException('sendMessage', None, {'ok': False, 'error_code': 429,
+                                                      'description': 'Too Many Requests',
+                                                      'parameters': {'retry_after': retry_after}})
+
+# Вместо TeleBot.send_message: запоминает порядок отправки, первые failures вызовов отвечают 429
+class FakeMethod:
+    def __init__(self, failures=0, retry_after=0.2, error=None):
+        self.calls = []
+        self.__failures = failures
+        self.__retry_after = retry_after
+        self.__error = error
+
+    def __call__(self, chat_id, text):
+        self.calls.append((chat_id, text, time()))
+        if self.__error != None:
+            raise self.__error
+        if self.__failures > 0:
+            self.__failures -= 1
+            raise too_many_requests(self.__retry_after)
+        return {'chat_id': chat_id, 'text': text}
+
+def test_429_is_retried_after_retry_after():
+    scheduler = SendScheduler()
+    method = FakeMethod(failures=1, retry_after=0.3)
+    assert scheduler.send(method, 1, 'hi') == {'chat_id': 1, 'text': 'hi'}
+    assert len(method.calls) == 2
+    assert method.calls[1][2] - method.calls[0][2] >= 0.3
+    assert scheduler.stats()['retried'] == 1
+
+def test_429_gives_up_after_retries_and_other_errors_are_raised():
+    scheduler = SendScheduler(chat_limit=100, retries=2)
+    method = FakeMethod(failures=10, retry_after=0.01)
+    with pytest.raises(ApiTelegramException):
+        scheduler.send(method, 1, 'hi')
+    assert len(method.calls) == 3
+
+    forbidden = ApiTelegramException('sendMessage', None, {'ok': False, 'error_code': 403, 'description': 'Forbidden'})
+    method = FakeMethod(error=forbidden)
+    with pytest.raises(ApiTelegramException):
+        scheduler.send(method, 2, 'hi')
+    assert len(method.calls) == 1
+
+def test_chat_limit_spaces_messages_of_one_chat():
+    scheduler = SendScheduler(chat_limit=10)
+    method = FakeMethod()
+    for i in range(12):
+        scheduler.send(method, 1, str(i))
+    assert method.calls[11][2] - method.calls[0][2] >= 0.15 # 10 сообщений из полной корзины, дальше 10 в секунду
+    other = FakeMethod()
+    started = time()
+    scheduler.send(other, 2, 'x') # другой чат не ждет
+    assert time() - started < 0.05
+
+def test_waiting_error_goes_before_waiting_menu():
+    scheduler = SendScheduler(global_limit=5, chat_limit=100)
+    method = FakeMethod()
+    for i in range(5):
+        scheduler.send(method, 100 + i, 'drain') # глобальная корзина пуста
+    menu = Thread(target=scheduler.send, args=(method, 1, 'menu'), kwargs={'priority': PRIORITY_MENU})
+    menu.start()
+    sleep(0.05) # меню встало в очередь первым
+    error = Thread(target=scheduler.send, args=(method, 2, 'error'), kwargs={'priority': PRIORITY_ERROR})
+    error.start()
+    menu.join(2)
+    error.join(2)
+    assert [text for _, text, _ in method.calls[5:]] == ['error', 'menu']